@@ -0,0 +1,44 @@
+import argparse
+import time
+
+import numpy as np
+
+from core.backtest import BacktestConfig, run_backtest
+from core.signals import SIGNALS
+
+# five years of 5 minute bars over a regular session
+BAR_COUNT = 5 * 252 * 78
+SYMBOL_COUNT = 500
+
+
+def generate_prices(bar_count: int, symbol_count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(0.0, 0.001, size=(bar_count, symbol_count))
+    prices = 100 * np.exp(np.cumsum(log_returns, axis=0))
+    # a few holes like the ones left by missing bars
+    prices[rng.random(prices.shape) < 0.001] = np.nan
+    return prices
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="time vectorized backtests")
+    parser.add_argument("--bars", type=int, default=BAR_COUNT)
+    parser.add_argument("--symbols", type=int, default=SYMBOL_COUNT)
+    parser.add_argument("--signals", nargs="+", default=sorted(SIGNALS))
+    args = parser.parse_args()
+
+    prices = generate_prices(args.bars, args.symbols)
+    print(f"{args.bars} bars x {args.symbols} symbols")
+    print(f"{'signal':>26} {'signal (s)':>11} {'backtest (s)':>13}")
+    for name in args.signals:
+        start = time.perf_counter()
+        weights = SIGNALS[name](prices)
+        signal_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        run_backtest(prices, weights, BacktestConfig())
+        backtest_seconds = time.perf_counter() - start
+        print(f"{name:>26} {signal_seconds:>11.2f} {backtest_seconds:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
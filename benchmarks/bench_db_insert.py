@@ -0,0 +1,66 @@
+import argparse
+from datetime import datetime, timedelta
+import time
+from typing import Callable, List, Tuple
+
+import pandas as pd
+import pytz
+
+from cli.commands.downloading._download.downloader.db import DataframeDatabase
+
+ROW_COUNTS = [1_000, 5_000, 20_000, 100_000]
+# the per-row concat is quadratic, past this it takes minutes
+LEGACY_ROW_LIMIT = 20_000
+
+
+def generate_rows(row_count: int) -> List[Tuple[datetime, float]]:
+    start = pytz.timezone("US/Eastern").localize(datetime(2018, 1, 2, 9, 30))
+    return [(start + timedelta(minutes=i), float(i)) for i in range(row_count)]
+
+
+def legacy_add_rows(
+    database: DataframeDatabase, symbol: str, rows: List[Tuple[datetime, float]]
+) -> None:
+    df = pd.DataFrame()
+    for dt, obj in rows:
+        df = pd.concat([df, pd.DataFrame({symbol: {dt: obj}})], ignore_index=False)
+    database._df = pd.concat([df, database._df])
+
+
+def bulk_add_rows(
+    database: DataframeDatabase, symbol: str, rows: List[Tuple[datetime, float]]
+) -> None:
+    database.add_rows(symbol, rows)
+
+
+def time_insert(
+    insert: Callable[[DataframeDatabase, str, List[Tuple[datetime, float]]], None],
+    rows: List[Tuple[datetime, float]],
+) -> float:
+    database = DataframeDatabase()
+    # a second symbol makes the insert merge into an existing frame
+    database.add_rows("EXISTING", rows[::2])
+    start = time.perf_counter()
+    insert(database, "NEW", rows)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="time DataframeDatabase inserts")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'bulk (s)':>10} {'legacy (s)':>12} {'speedup':>8}")
+    for row_count in args.rows:
+        rows = generate_rows(row_count)
+        bulk = time_insert(bulk_add_rows, rows)
+        if args.skip_legacy or row_count > LEGACY_ROW_LIMIT:
+            print(f"{row_count:>10} {bulk:>10.4f} {'-':>12} {'-':>8}")
+            continue
+        legacy = time_insert(legacy_add_rows, rows)
+        print(f"{row_count:>10} {bulk:>10.4f} {legacy:>12.4f} {legacy / bulk:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
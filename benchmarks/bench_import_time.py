@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# none of these should be needed to parse arguments or print help
+HEAVY_MODULES = [
+    "alpaca",
+    "numpy",
+    "pandas",
+    "pandas_market_calendars",
+    "polygon",
+    "pyarrow",
+]
+HEAVY_MODULES_SCRIPT = f"""
+import json, sys
+from cli.cli import CLI
+CLI()
+print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))
+"""
+
+
+def time_help(runs: int) -> List[float]:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py", "--help"],
+            cwd=REPO_ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def heavy_modules_imported() -> List[str]:
+    output = subprocess.run(
+        [sys.executable, "-c", HEAVY_MODULES_SCRIPT],
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="time `main.py --help` start up")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=0.5,
+        help="fail when the median start up time is above this",
+    )
+    args = parser.parse_args()
+
+    durations = time_help(args.runs)
+    median = statistics.median(durations)
+    heavy = heavy_modules_imported()
+    print(f"main.py --help: median {median:.3f}s over {args.runs} runs")
+    print(f"heavy modules imported by the CLI: {', '.join(heavy) or 'none'}")
+
+    if len(heavy) > 0 or median > args.max_seconds:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+from datetime import date, datetime
+import functools
+import time
+import json
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlencode, urlparse
+import zlib
+
+import numpy as np
+import pandas as pd
+
+MARKET_TIMEZONE = "US/Eastern"
+FIRST_FILING_YEAR = 2010
+ALPACA_MAX_PAGE_SIZE = 10_000
+POLYGON_MAX_PAGE_SIZE = 100
+POLYGON_DEFAULT_PAGE_SIZE = 10
+TICKER_DETAILS_PREFIX = "/v3/reference/tickers/"
+FINANCIALS_PATH = "/vX/reference/financials"
+
+
+# every value only depends on the symbol and the timestamp, so repeated runs
+# and overlapping requests see the same data
+def symbol_seed(symbol: str) -> int:
+    return zlib.crc32(symbol.encode())
+
+
+def synthetic_closes(symbol: str, minutes: np.ndarray) -> np.ndarray:
+    seed = symbol_seed(symbol)
+    base = 20 + seed % 480
+    phase = (minutes + seed) % 10_007
+    return np.round(base * (1 + 0.05 * np.sin(phase / 97.0)), 2)
+
+
+def market_minutes(start: datetime, end: datetime) -> pd.DatetimeIndex:
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    start = start.tz_localize("UTC") if start.tzinfo is None else start
+    end = end.tz_localize("UTC") if end.tzinfo is None else end
+    minutes = pd.date_range(start.ceil("min"), end.floor("min"), freq="min")
+    local = minutes.tz_convert(MARKET_TIMEZONE)
+    in_session = (
+        (local.dayofweek < 5)
+        & (local.hour * 60 + local.minute >= 9 * 60 + 30)
+        & (local.hour < 16)
+    )
+    return minutes[in_session]
+
+
+class FakeNotFoundResponse:
+    status_code = 404
+    headers: Dict[str, str] = {}
+
+
+# carries a response like the sdk errors do, so it is reported and not retried
+class FakeNotFoundError(Exception):
+    response = FakeNotFoundResponse()
+
+
+# the bars of every requested symbol in one flat order, so a page token is an
+# offset into it and pages may split a symbol like alpaca's do
+@functools.lru_cache(maxsize=64)
+def bar_minutes(start: str, end: str) -> Tuple[np.ndarray, List[str]]:
+    minutes = market_minutes(pd.Timestamp(start), pd.Timestamp(end))
+    return (
+        minutes.asi8 // 60_000_000_000,
+        minutes.strftime("%Y-%m-%dT%H:%M:%SZ").tolist(),
+    )
+
+
+# one page of alpaca's GET /v2/stocks/bars response, shared with the mock server
+def stock_bars_page(
+    symbols: List[str], start: str, end: str, page_size: int, offset: int
+) -> Dict[str, object]:
+    epoch_minutes, timestamps = bar_minutes(start, end)
+    end_offset = min(offset + page_size, len(symbols) * len(timestamps))
+
+    bars: Dict[str, List[Dict[str, object]]] = {}
+    for symbol_index, symbol in enumerate(symbols):
+        first = max(offset - symbol_index * len(timestamps), 0)
+        last = min(end_offset - symbol_index * len(timestamps), len(timestamps))
+        if first >= last:
+            continue
+        closes = synthetic_closes(symbol, epoch_minutes[first:last]).tolist()
+        bars[symbol] = [
+            {
+                "t": timestamp,
+                "o": close,
+                "h": close,
+                "l": close,
+                "c": close,
+                "v": 100,
+                "n": 1,
+                "vw": close,
+            }
+            for timestamp, close in zip(timestamps[first:last], closes)
+        ]
+
+    next_page_token = None
+    if end_offset < len(symbols) * len(timestamps):
+        next_page_token = str(end_offset)
+    return {"bars": bars, "next_page_token": next_page_token}
+
+
+# stands in for alpaca's StockHistoricalDataClient, answering its http GET with
+# one 1-minute bar per session minute between the request's start and end.
+# requests for any of failing_symbols fail
+class FakeStockHistoricalDataClient:
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        failing_symbols: Iterable[str] = (),
+        page_size: int = ALPACA_MAX_PAGE_SIZE,
+    ):
+        self.latency_seconds = latency_seconds
+        self.failing_symbols = set(failing_symbols)
+        self.page_size = page_size
+        self.calls = 0
+
+    def get(self, path: str, data: Dict[str, object]) -> Dict[str, object]:
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+        if path != "/stocks/bars":
+            raise FakeNotFoundError(f"no route {path}")
+        symbols = str(data["symbols"]).split(",")
+        if self.failing_symbols.intersection(symbols):
+            raise FakeNotFoundError(f"no bars for {', '.join(symbols)}")
+        return stock_bars_page(
+            symbols,
+            str(data["start"]),
+            str(data["end"]),
+            min(int(data.get("limit") or ALPACA_MAX_PAGE_SIZE), self.page_size),
+            int(data.get("page_token") or 0),
+        )
+
+
+# payloads shaped like the polygon json responses, shared with the mock server
+def ticker_details(ticker: str, date: str = None) -> Dict[str, object]:
+    seed = symbol_seed(ticker)
+    year = datetime.fromisoformat(date or "2020-01-01").year
+    return {
+        "ticker": ticker,
+        "total_employees": 1_000 + seed % 100_000,
+        "market_cap": 1e9 * (1 + seed % 500) * (1 + (year - 2000) / 100),
+    }
+
+
+def annual_financials(
+    ticker: str, filing_date_lt: str = None
+) -> List[Dict[str, object]]:
+    until = date.fromisoformat(filing_date_lt or date.today().isoformat())
+    seed = symbol_seed(ticker)
+    financials = []
+    for year in range(FIRST_FILING_YEAR, until.year + 1):
+        filing_date = date(year, 2, 1 + seed % 27)
+        if filing_date >= until:
+            break
+        revenues = 1e9 * (1 + seed % 50) * (1.05 ** (year - FIRST_FILING_YEAR))
+        financials.append(
+            {
+                "ticker": ticker,
+                "filing_date": filing_date.isoformat(),
+                "fiscal_year": str(year - 1),
+                "timeframe": "annual",
+                "financials": {
+                    "income_statement": {
+                        "revenues": {"value": revenues, "unit": "USD"},
+                        "gross_profit": {"value": revenues * 0.4, "unit": "USD"},
+                    }
+                },
+            }
+        )
+    return financials
+
+
+# newest filings first like polygon's, further pages are linked through
+# next_url. shared with the mock server
+def stock_financials_page(
+    query: Dict[str, str], url: str, page_size: int
+) -> Dict[str, object]:
+    financials = annual_financials(query["ticker"], query.get("filing_date.lt"))
+    financials.reverse()
+    page_size = min(int(query.get("limit") or POLYGON_DEFAULT_PAGE_SIZE), page_size)
+    offset = int(query.get("cursor") or 0)
+
+    response = {
+        "status": "OK",
+        "results": financials[offset : offset + page_size],
+    }
+    if offset + page_size < len(financials):
+        next_query = {**query, "cursor": str(offset + page_size)}
+        response["next_url"] = f"{url}?{urlencode(next_query)}"
+    return response
+
+
+class FakeHTTPResponse:
+    def __init__(self, status: int, payload: object, headers: Dict[str, str] = None):
+        self.status = status
+        self.data = json.dumps(payload).encode()
+        self.headers = headers or {}
+
+
+# stands in for polygon's RESTClient at the http level the downloaders request
+# it through, serving ticker details and paged financials. requests for any of
+# failing_symbols, and ticker details on any of failing_dates, get a 404, the
+# first rate_limited_requests requests get a 429
+class FakePolygonClient:
+    BASE = "https://api.polygon.io"
+    headers: Dict[str, str] = {}
+    timeout = None
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        failing_symbols: Iterable[str] = (),
+        failing_dates: Iterable[str] = (),
+        page_size: int = POLYGON_MAX_PAGE_SIZE,
+        rate_limited_requests: int = 0,
+        retry_after_seconds: float = 0.0,
+    ):
+        self.latency_seconds = latency_seconds
+        self.failing_symbols = set(failing_symbols)
+        self.failing_dates = set(failing_dates)
+        self.page_size = page_size
+        self.rate_limited_requests = rate_limited_requests
+        self.retry_after_seconds = retry_after_seconds
+        self.calls = 0
+        self.client = self
+
+    def request(
+        self, method: str, url: str, fields: Dict[str, str] = None, **kwargs
+    ) -> FakeHTTPResponse:
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+        if self.calls <= self.rate_limited_requests:
+            return FakeHTTPResponse(
+                429,
+                {"status": "ERROR", "message": "too many requests"},
+                {"Retry-After": str(self.retry_after_seconds)},
+            )
+
+        path = urlparse(url).path
+        query = {key: str(value) for key, value in (fields or {}).items()}
+        if path.startswith(TICKER_DETAILS_PREFIX):
+            ticker = path[len(TICKER_DETAILS_PREFIX) :]
+            if (
+                ticker in self.failing_symbols
+                or query.get("date") in self.failing_dates
+            ):
+                return FakeHTTPResponse(404, {"status": "NOT_FOUND"})
+            return FakeHTTPResponse(
+                200,
+                {"status": "OK", "results": ticker_details(ticker, query.get("date"))},
+            )
+        if path == FINANCIALS_PATH:
+            if query.get("ticker") in self.failing_symbols:
+                return FakeHTTPResponse(404, {"status": "NOT_FOUND"})
+            return FakeHTTPResponse(
+                200, stock_financials_page(query, self.BASE + path, self.page_size)
+            )
+        return FakeHTTPResponse(404, {"status": "NOT_FOUND", "message": path})
@@ -0,0 +1,245 @@
+import argparse
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import math
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+from urllib.parse import parse_qs, urlparse
+
+from .fakes import (
+    ALPACA_MAX_PAGE_SIZE,
+    FINANCIALS_PATH,
+    TICKER_DETAILS_PREFIX,
+    stock_bars_page,
+    stock_financials_page,
+    ticker_details,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MockServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    latency_seconds: float = 0.0
+    # the most bars or filings in one response, smaller pages mean more requests
+    page_size: int = ALPACA_MAX_PAGE_SIZE
+    # quota of each provider, requests above it get a 429 with a Retry-After
+    requests_per_minute: Optional[float] = None
+    # share of requests answered with a 429 regardless of the quota
+    rate_limited_fraction: float = 0.0
+    retry_after_seconds: float = 1.0
+
+
+# the same token bucket the providers enforce, answering instead of waiting
+class Quota:
+    def __init__(self, requests_per_minute: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # the seconds until a request would be let through, None if it is now
+    def take(self) -> Optional[float]:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+
+class MockMarketDataServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cfg: MockServerConfig):
+        super().__init__((cfg.host, cfg.port), MockMarketDataHandler)
+        self.cfg = cfg
+        self.quotas: Dict[str, Quota] = {}
+        if cfg.requests_per_minute is not None:
+            self.quotas = {
+                provider: Quota(cfg.requests_per_minute)
+                for provider in ("alpaca", "polygon")
+            }
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] = self.stats.get(stat, 0) + 1
+
+    # None lets the request through, otherwise the Retry-After of its 429
+    def throttle(self, provider: str) -> Optional[float]:
+        if random.random() < self.cfg.rate_limited_fraction:
+            return self.cfg.retry_after_seconds
+        quota = self.quotas.get(provider)
+        return None if quota is None else quota.take()
+
+
+class MockMarketDataHandler(BaseHTTPRequestHandler):
+    server: MockMarketDataServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/v2/stocks/bars":
+            provider, respond = "alpaca", lambda: stock_bars(self.server.cfg, query)
+        elif url.path.startswith(TICKER_DETAILS_PREFIX):
+            ticker = url.path[len(TICKER_DETAILS_PREFIX) :]
+            provider, respond = "polygon", lambda: {
+                "status": "OK",
+                "results": ticker_details(ticker, query.get("date")),
+            }
+        elif url.path == FINANCIALS_PATH:
+            provider, respond = "polygon", lambda: stock_financials_page(
+                query,
+                f"http://{self.headers['Host']}{url.path}",
+                self.server.cfg.page_size,
+            )
+        else:
+            self.server.count("not_found")
+            self.send_json(404, {"status": "NOT_FOUND", "message": url.path})
+            return
+
+        time.sleep(self.server.cfg.latency_seconds)
+        retry_after = self.server.throttle(provider)
+        if retry_after is not None:
+            self.server.count(f"{provider}_rate_limited")
+            self.send_json(
+                429,
+                {"status": "ERROR", "message": "too many requests"},
+                {"Retry-After": str(math.ceil(retry_after))},
+            )
+            return
+
+        self.server.count(f"{provider}_requests")
+        try:
+            payload = respond()
+        except (KeyError, ValueError) as e:
+            self.server.count("bad_requests")
+            self.send_json(400, {"status": "ERROR", "message": str(e)})
+            return
+        self.send_json(200, payload)
+
+    def send_json(
+        self, status: int, payload: object, headers: Dict[str, str] = None
+    ) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        _logger.debug(f"{self.address_string()} {format % args}")
+
+
+def stock_bars(cfg: MockServerConfig, query: Dict[str, str]) -> Dict[str, object]:
+    return stock_bars_page(
+        query["symbols"].split(","),
+        query["start"],
+        query["end"],
+        min(int(query.get("limit") or ALPACA_MAX_PAGE_SIZE), cfg.page_size),
+        int(query.get("page_token") or 0),
+    )
+
+
+def start_mock_server(cfg: MockServerConfig) -> MockMarketDataServer:
+    server = MockMarketDataServer(cfg)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@contextmanager
+def running_mock_server(cfg: MockServerConfig) -> Iterator[MockMarketDataServer]:
+    server = start_mock_server(cfg)
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="serve generated alpaca bars and polygon ticker details and "
+        "financials on a local port"
+    )
+    parser.add_argument("--host", default=MockServerConfig.host)
+    parser.add_argument(
+        "--port", type=int, default=MockServerConfig.port, help="0 picks a free port"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=ALPACA_MAX_PAGE_SIZE,
+        help="the most bars or filings in one response",
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        help="quota of each provider, requests above it get a 429",
+    )
+    parser.add_argument(
+        "--rate-limited-fraction",
+        type=float,
+        default=0.0,
+        help="share of requests answered with a 429 regardless of the quota",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=MockServerConfig.retry_after_seconds,
+        help="Retry-After of the randomly rate limited requests",
+    )
+    parser.add_argument("--debug", action="store_true", help="log every request")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    server = MockMarketDataServer(
+        MockServerConfig(
+            host=args.host,
+            port=args.port,
+            latency_seconds=args.latency,
+            page_size=args.page_size,
+            requests_per_minute=args.requests_per_minute,
+            rate_limited_fraction=args.rate_limited_fraction,
+            retry_after_seconds=args.retry_after,
+        )
+    )
+    print(f"serving mock market data on {server.url}, point the downloader at it with")
+    print(f"  --alpaca-url {server.url} --polygon-url {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(sorted(server.stats.items())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import cli.commands.downloading._download as download_module
+from cli.commands.downloading._download.configs.download import (
+    DownloadConfig,
+    DownloaderEnum,
+)
+from cli.commands.downloading._download.downloader.build_downloader import (
+    build_downloader,
+)
+from cli.commands.downloading._download.downloader.db import DataframeDatabase
+from cli.commands.downloading._download.downloader.metrics import METRICS
+from cli.commands.downloading._download.downloader.prices import (
+    GetDatabaseMissesConfig,
+    UpdateDatabaseConfig,
+    fill_new_entries,
+    get_price_misses,
+)
+from cli.commands.downloading._download.downloader.utils import (
+    LoadMarketCalendarConfig,
+    load_market_calendar,
+)
+
+from .fakes import FakeStockHistoricalDataClient
+from .mock_server import MockServerConfig, running_mock_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYMBOL_COUNTS = [10, 100, 500]
+# share of slots left empty in the synthetic databases
+HOLE_FRACTION = 0.01
+E2E_CONFIG_NAME = "benchmark"
+
+
+def symbols(symbol_count: int) -> List[str]:
+    return [f"SYM{i:04d}" for i in range(symbol_count)]
+
+
+def slot_grid(years: float, cache_dir: str) -> pd.DatetimeIndex:
+    end = datetime.now()
+    calendar = load_market_calendar(
+        LoadMarketCalendarConfig(
+            start_date=str(end - pd.Timedelta(days=round(years * 365))),
+            end_date=str(end - pd.Timedelta(days=1)),
+            cache_dir=cache_dir,
+        )
+    )
+    cfg = GetDatabaseMissesConfig(None, None, calendar, calendar_cache_dir=cache_dir)
+    cfg.set_defaults()
+    return cfg.slot_grid
+
+
+def filled_database(
+    grid: pd.DatetimeIndex, symbol_list: List[str], seed: int = 0
+) -> DataframeDatabase:
+    rng = np.random.default_rng(seed)
+    database = DataframeDatabase()
+    for symbol in symbol_list:
+        present = rng.random(len(grid)) >= HOLE_FRACTION
+        database.add_batch(symbol, grid[present], rng.random(present.sum()) + 100)
+    return database
+
+
+def timed(run: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def bench_price_misses(grid: pd.DatetimeIndex, symbol_list: List[str]) -> float:
+    database = filled_database(grid, symbol_list)
+
+    def run():
+        for symbol in symbol_list:
+            cfg = GetDatabaseMissesConfig(
+                symbol, database, pd.Series(dtype="object"), slot_grid=grid
+            )
+            cfg.set_defaults()
+            get_price_misses(cfg)
+
+    return timed(run)
+
+
+def bench_fill_and_generate(grid: pd.DatetimeIndex, symbol_list: List[str]) -> float:
+    database = filled_database(grid, symbol_list)
+    rng = np.random.default_rng(1)
+    # half of the holes are filled, the other half are slots past the index
+    updates = {}
+    for symbol in symbol_list:
+        missing = database.missing(symbol, grid)
+        extra = grid[-1] + pd.to_timedelta(np.arange(1, len(missing) + 1), "min")
+        slots = missing.append(extra)
+        updates[symbol] = pd.Series(rng.random(len(slots)) + 100, index=slots)
+
+    def run():
+        for symbol, aligned_prices in updates.items():
+            cfg = UpdateDatabaseConfig(
+                symbol, database, aligned_prices.index, aligned_prices, "float64"
+            )
+            fill_new_entries(cfg)
+
+    return timed(run)
+
+
+def bench_add_rows(grid: pd.DatetimeIndex, symbol_list: List[str]) -> float:
+    rows = list(zip(grid.to_pydatetime(), np.linspace(100, 200, len(grid)).tolist()))
+    database = DataframeDatabase()
+    return timed(lambda: [database.add_rows(symbol, rows) for symbol in symbol_list])
+
+
+def bench_save_load(
+    grid: pd.DatetimeIndex, symbol_list: List[str], directory: str
+) -> Dict[str, float]:
+    database = filled_database(grid, symbol_list)
+    filepath = os.path.join(directory, f"prices-{len(symbol_list)}.parquet")
+    save_seconds = timed(lambda: database.save(filepath))
+    load_seconds = timed(lambda: DataframeDatabase().load(filepath))
+    # the load reuses the coverage sidecar written by the save
+    return {"db_save": save_seconds, "db_load": load_seconds}
+
+
+def bench_download(
+    symbol_list: List[str],
+    directory: str,
+    years: float,
+    workers: int,
+    symbols_per_request: int,
+    latency_seconds: float,
+    mock_server_url: Optional[str] = None,
+) -> Dict[str, object]:
+    cfg = DownloadConfig(
+        database_filepath=os.path.join(directory, f"e2e-{len(symbol_list)}.parquet"),
+        downloader_enum=DownloaderEnum.PricesDownloader,
+        symbols=symbol_list,
+        use_existing_db=False,
+        years_examined=years,
+        database_entry_type="float64",
+        symbols_per_request=symbols_per_request,
+        use_response_cache=False,
+        calendar_cache_dir=os.path.join(directory, "calendar"),
+        alpaca_requests_per_minute=1e9,
+        alpaca_key_id="mock",
+        alpaca_secret_key="mock",
+        alpaca_url_override=mock_server_url,
+    )
+    client = FakeStockHistoricalDataClient(latency_seconds)
+
+    # against the mock server the real client sends real http requests
+    def build_fake_downloader(cfg: DownloadConfig):
+        downloader = build_downloader(cfg)
+        if mock_server_url is None:
+            downloader._alpaca_client = client
+        return downloader
+
+    args = argparse.Namespace(
+        config=E2E_CONFIG_NAME,
+        debug=False,
+        workers=workers,
+        flush_every_symbols=None,
+        flush_every_seconds=None,
+        offline=False,
+        no_response_cache=True,
+        metrics_json=None,
+        metrics_prom=None,
+        alpaca_url=None,
+        polygon_url=None,
+        requests_per_minute=None,
+    )
+    with mock.patch.object(
+        download_module, "CONFIG_CHOICES", {E2E_CONFIG_NAME: cfg}
+    ), mock.patch.object(download_module, "build_downloader", build_fake_downloader):
+        seconds = timed(lambda: download_module._download_func(args))
+    return {
+        "seconds": seconds,
+        "api_calls": METRICS.snapshot()["counters"]["api_calls"],
+    }
+
+
+def git_commit() -> Dict[str, object]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": git("status", "--porcelain") != "",
+    }
+
+
+def previous_record(filepath: str, commit: str) -> Optional[Dict[str, object]]:
+    if not os.path.exists(filepath):
+        return None
+    previous = None
+    with open(filepath) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["commit"] != commit:
+                previous = record
+    return previous
+
+
+def result_key(result: Dict[str, object]) -> str:
+    return f"{result['benchmark']}[{result['symbols']}]"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="time the download hot paths against in process fake clients"
+    )
+    parser.add_argument("--symbols", type=int, nargs="+", default=SYMBOL_COUNTS)
+    parser.add_argument(
+        "--years", type=float, default=1.0, help="history of the database benchmarks"
+    )
+    parser.add_argument(
+        "--e2e-years", type=float, default=0.1, help="history of the download runs"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--symbols-per-request", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument(
+        "--mock-server",
+        action="store_true",
+        help="download over http from a local mock server instead of the in process "
+        "fake client, --latency is then added by the server",
+    )
+    parser.add_argument(
+        "--output",
+        default="./data/benchmarks/results.jsonl",
+        help="one json line per run is appended, keyed by git commit",
+    )
+    args = parser.parse_args()
+
+    results: List[Dict[str, object]] = []
+
+    def record(benchmark: str, symbol_count: int, seconds: float, **extra) -> None:
+        results.append(
+            {
+                "benchmark": benchmark,
+                "symbols": symbol_count,
+                "seconds": seconds,
+                **extra,
+            }
+        )
+        print(f"{benchmark:>22} {symbol_count:>8} {seconds:>10.3f}s")
+
+    print(f"{'benchmark':>22} {'symbols':>8} {'time':>11}")
+    with tempfile.TemporaryDirectory() as directory, contextlib.ExitStack() as stack:
+        mock_server_url = None
+        if args.mock_server and not args.skip_e2e:
+            server = stack.enter_context(
+                running_mock_server(
+                    MockServerConfig(port=0, latency_seconds=args.latency)
+                )
+            )
+            mock_server_url = server.url
+
+        grid = slot_grid(args.years, os.path.join(directory, "calendar"))
+        for symbol_count in args.symbols:
+            symbol_list = symbols(symbol_count)
+            record(
+                "get_price_misses",
+                symbol_count,
+                bench_price_misses(grid, symbol_list),
+            )
+            record(
+                "fill_and_generate_rows",
+                symbol_count,
+                bench_fill_and_generate(grid, symbol_list),
+            )
+            record("add_rows", symbol_count, bench_add_rows(grid, symbol_list))
+            for name, seconds in bench_save_load(grid, symbol_list, directory).items():
+                record(name, symbol_count, seconds)
+            if not args.skip_e2e:
+                download = bench_download(
+                    symbol_list,
+                    directory,
+                    args.e2e_years,
+                    args.workers,
+                    args.symbols_per_request,
+                    args.latency,
+                    mock_server_url,
+                )
+                record(
+                    "download_e2e" if mock_server_url is None else "download_e2e_http",
+                    symbol_count,
+                    download["seconds"],
+                    api_calls=download["api_calls"],
+                )
+
+    run = {
+        **git_commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "args": vars(args),
+        "results": results,
+    }
+    previous = previous_record(args.output, run["commit"])
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"appended results for {run['commit'][:12]} to {args.output}")
+
+    if previous is not None:
+        previous_seconds = {
+            result_key(result): result["seconds"] for result in previous["results"]
+        }
+        print(f"\ncompared to {previous['commit'][:12]}")
+        for result in results:
+            before = previous_seconds.get(result_key(result))
+            if before:
+                print(f"{result_key(result):>32} {result['seconds'] / before:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
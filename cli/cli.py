@@ -3,7 +3,8 @@ import argparse
 import logging
 from typing import Callable, List
 
-from .commands import downloading_cmd
+from .commands import backtesting_cmd, downloading_cmd, modelling_cmd
+from .profiling import PROFILE_MODES, profile
 
 _logger = logging.getLogger(__name__)
 
@@ -17,6 +18,8 @@ USAGE = "tbd"
 class CLI:
     SUBCOMMANDS: List[Callable[[argparse._SubParsersAction], None]] = [
         downloading_cmd,
+        backtesting_cmd,
+        modelling_cmd,
     ]
 
     def __init__(self) -> None:
@@ -25,6 +28,17 @@ class CLI:
     def _create_parser(self) -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(usage=USAGE, description=PROGRAM_DESCRIPTION)
         parser.add_argument("-v", "--version", action="version", version=VERSION)
+        parser.add_argument(
+            "--profile",
+            choices=PROFILE_MODES,
+            help="profile the sub command, cpu writes sorted cProfile stats and mem "
+            "a tracemalloc diff of the top allocation sites",
+        )
+        parser.add_argument(
+            "--profile-output",
+            help="the file the profile report is written to, defaults to "
+            "./profile-<mode>-<time>.txt",
+        )
 
         subparser = parser.add_subparsers(
             title="sub-commands", metavar="", dest="sub_cmd"
@@ -36,7 +50,8 @@ class CLI:
 
     def parse_args(self, args: List[str]) -> None:
         parsed_args = self.parser.parse_args(args)
-        parsed_args.func(parsed_args)
+        with profile(parsed_args.profile, parsed_args.profile_output):
+            parsed_args.func(parsed_args)
         return
 
 
@@ -1,3 +1,5 @@
+from .backtesting import backtesting_cmd
 from .downloading import downloading_cmd
+from .modelling import modelling_cmd
 
-__all__ = ["downloading_cmd"]
+__all__ = ["backtesting_cmd", "downloading_cmd", "modelling_cmd"]
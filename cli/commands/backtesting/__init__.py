@@ -0,0 +1,26 @@
+import argparse
+
+from ._export import export_cmd
+from ._run import run_cmd
+from ._sweep import sweep_cmd
+
+
+def backtesting_cmd(parent: argparse._SubParsersAction) -> None:
+    backtesting_parser = parent.add_parser(
+        "backtesting",
+        help="Command for backtesting strategies",
+    )
+    backtesting_subparser = backtesting_parser.add_subparsers(
+        title="backtesting-sub-commands",
+        metavar="",
+        dest="backtesting_sub_cmd",
+    )
+
+    cmds = [
+        export_cmd,
+        run_cmd,
+        sweep_cmd,
+    ]
+
+    for cmd in cmds:
+        cmd(backtesting_subparser)
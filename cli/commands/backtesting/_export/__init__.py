@@ -0,0 +1,41 @@
+import logging
+import argparse
+import time
+
+__all__ = ["export_cmd"]
+
+_logger = logging.getLogger(__name__)
+
+
+def export_cmd(parent: argparse._SubParsersAction) -> None:
+    export_cmd = parent.add_parser(
+        "export",
+        help="Export the price database as a memory mappable matrix",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="export a prices parquet database to a directory of .npy arrays\n"
+        "(prices, timestamps, symbols) that backtests open as read only memory maps",
+    )
+    export_cmd.add_argument(
+        "--database",
+        default="./data/sp500_equity_prices.parquet",
+        help="the prices database written by `downloading download`",
+    )
+    export_cmd.add_argument(
+        "--output",
+        default="./data/sp500_equity_prices.matrix",
+        help="the directory the matrix is written to, replaced if it exists",
+    )
+
+    export_cmd.set_defaults(func=_export_func)
+    return
+
+
+def _export_func(args: argparse.Namespace) -> None:
+    from core.price_matrix import export_price_matrix
+
+    start_time = time.perf_counter()
+    matrix = export_price_matrix(args.database, args.output)
+    _logger.info(
+        f"exported {matrix.prices.shape[0]} timestamps x {matrix.prices.shape[1]} "
+        f"symbols to {args.output} in {time.perf_counter() - start_time:.1f}s"
+    )
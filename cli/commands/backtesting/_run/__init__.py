@@ -0,0 +1,127 @@
+import logging
+import argparse
+import time
+from typing import Dict, List
+
+from ....exceptions import ConfigError
+
+__all__ = ["run_cmd"]
+
+_logger = logging.getLogger(__name__)
+
+
+def run_cmd(parent: argparse._SubParsersAction) -> None:
+    run_cmd = parent.add_parser(
+        "run",
+        help="Backtest a signal against an exported price matrix",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="simulate the portfolio produced by a signal over the time x symbol\n"
+        "price matrix written by `backtesting export`, the signal is either a\n"
+        "built in name or a `package.module:function` path",
+    )
+    run_cmd.add_argument(
+        "--matrix",
+        default="./data/sp500_equity_prices.matrix",
+        help="the directory written by `backtesting export`",
+    )
+    run_cmd.add_argument(
+        "--signal",
+        default="momentum",
+        help="equal_weight, momentum, mean_reversion, moving_average_crossover\n"
+        "or a `package.module:function` path",
+    )
+    run_cmd.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="a keyword argument passed to the signal, may be repeated",
+    )
+    run_cmd.add_argument(
+        "--cost-bps",
+        type=float,
+        default=1.0,
+        help="transaction cost charged on traded notional, in basis points",
+    )
+    run_cmd.add_argument(
+        "--output",
+        default=None,
+        help="an optional csv the per bar returns, turnover and equity are written to",
+    )
+
+    run_cmd.set_defaults(func=_run_func)
+    return
+
+
+def _run_func(args: argparse.Namespace) -> None:
+    from core.backtest import BacktestConfig, periods_per_year, run_backtest
+    from core.price_matrix import PriceMatrix
+    from core.signals import SignalParameterError, check_params, load_signal
+
+    params = parse_params(args.param)
+    try:
+        signal = load_signal(args.signal)
+    except (KeyError, ImportError, AttributeError) as e:
+        raise ConfigError(f"could not load signal {args.signal}: {e}")
+
+    matrix = PriceMatrix.open(args.matrix)
+    cfg = BacktestConfig(
+        transaction_cost_bps=args.cost_bps,
+        periods_per_year=periods_per_year(matrix.timestamps),
+    )
+
+    start_time = time.perf_counter()
+    try:
+        check_params(signal, params)
+        weights = signal(matrix.prices, **params)
+    except SignalParameterError as e:
+        raise ConfigError(f"could not run signal {args.signal} with {params}: {e}")
+    signal_seconds = time.perf_counter() - start_time
+    result = run_backtest(matrix.prices, weights, cfg)
+    _logger.info(
+        f"backtested {args.signal} over {matrix.prices.shape[0]} timestamps x "
+        f"{matrix.prices.shape[1]} symbols in {time.perf_counter() - start_time:.1f}s "
+        f"(signal {signal_seconds:.1f}s)"
+    )
+
+    for name, value in result.metrics(cfg.periods_per_year).items():
+        _logger.info(f"{name:>22}: {value:.6f}")
+
+    if args.output is not None:
+        write_result(args.output, matrix.timestamps, result)
+        _logger.info(f"wrote per bar results to {args.output}")
+
+
+# values are parsed as int, then float, and kept as strings otherwise
+def parse_params(params: List[str]) -> Dict[str, object]:
+    parsed: Dict[str, object] = {}
+    for param in params:
+        if "=" not in param:
+            raise ConfigError(f"expected KEY=VALUE, got {param}")
+        key, value = param.split("=", 1)
+        parsed[key] = parse_value(value)
+    return parsed
+
+
+def parse_value(value: str) -> object:
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+def write_result(filepath: str, timestamps, result) -> None:
+    import pandas as pd
+
+    pd.DataFrame(
+        {
+            "returns": result.returns,
+            "gross_returns": result.gross_returns,
+            "costs": result.costs,
+            "turnover": result.turnover,
+            "equity": result.equity[1:],
+        },
+        index=pd.to_datetime(timestamps[1:], utc=True).rename("datetime"),
+    ).to_csv(filepath)
@@ -0,0 +1,128 @@
+import logging
+import argparse
+import time
+from typing import Dict, List
+
+from ....exceptions import ConfigError
+from .._run import parse_params, parse_value
+
+__all__ = ["sweep_cmd"]
+
+_logger = logging.getLogger(__name__)
+
+
+def sweep_cmd(parent: argparse._SubParsersAction) -> None:
+    sweep_cmd = parent.add_parser(
+        "sweep",
+        help="Backtest a signal over a grid of parameters in parallel",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="evaluate every combination of the --grid values with a process pool,\n"
+        "the price matrix is placed in shared memory once and every worker\n"
+        "attaches to it instead of reading or receiving its own copy",
+    )
+    sweep_cmd.add_argument(
+        "--matrix",
+        default="./data/sp500_equity_prices.matrix",
+        help="the directory written by `backtesting export`",
+    )
+    sweep_cmd.add_argument(
+        "--signal",
+        default="momentum",
+        help="a signal name or `package.module:function` path, see `backtesting run`",
+    )
+    sweep_cmd.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="KEY=V1,V2,...",
+        help="the values a signal keyword argument is swept over, may be repeated",
+    )
+    sweep_cmd.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="a keyword argument held fixed across the sweep, may be repeated",
+    )
+    sweep_cmd.add_argument(
+        "--cost-bps",
+        type=float,
+        default=1.0,
+        help="transaction cost charged on traded notional, in basis points",
+    )
+    sweep_cmd.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="the number of worker processes, defaults to the number of cores",
+    )
+    sweep_cmd.add_argument(
+        "--sort-by",
+        default="sharpe",
+        help="the metric the results table is sorted by, descending",
+    )
+    sweep_cmd.add_argument(
+        "--output",
+        default="./data/sweep_results.csv",
+        help="the csv the results table is written to",
+    )
+
+    sweep_cmd.set_defaults(func=_sweep_func)
+    return
+
+
+def _sweep_func(args: argparse.Namespace) -> None:
+    import numpy as np
+    import pandas as pd
+
+    from core.backtest import BacktestConfig, periods_per_year
+    from core.price_matrix import PriceMatrix
+    from core.signals import SignalParameterError, check_params, load_signal
+    from core.sweep import SweepConfig, param_grid, run_sweep
+
+    try:
+        signal = load_signal(args.signal)
+    except (KeyError, ImportError, AttributeError) as e:
+        raise ConfigError(f"could not load signal {args.signal}: {e}")
+
+    param_sets = param_grid(parse_grid(args.grid), parse_params(args.param))
+    for params in param_sets:
+        try:
+            check_params(signal, params)
+        except SignalParameterError as e:
+            raise ConfigError(f"could not run signal {args.signal}: {e}")
+    matrix = PriceMatrix.open(args.matrix)
+    cfg = SweepConfig(
+        signal=args.signal,
+        param_sets=param_sets,
+        backtest=BacktestConfig(
+            transaction_cost_bps=args.cost_bps,
+            periods_per_year=periods_per_year(matrix.timestamps),
+        ),
+        workers=args.workers,
+    )
+
+    start_time = time.perf_counter()
+    try:
+        results = pd.DataFrame(run_sweep(np.asarray(matrix.prices), cfg))
+    except SignalParameterError as e:
+        raise ConfigError(f"could not run signal {args.signal}: {e}")
+    _logger.info(
+        f"swept {len(param_sets)} parameter sets of {args.signal} in "
+        f"{time.perf_counter() - start_time:.1f}s"
+    )
+
+    if args.sort_by in results:
+        results = results.sort_values(args.sort_by, ascending=False)
+    results.to_csv(args.output, index=False)
+    _logger.info(f"wrote results to {args.output}\n{results.head(10).to_string()}")
+
+
+def parse_grid(grid: List[str]) -> Dict[str, List[object]]:
+    parsed: Dict[str, List[object]] = {}
+    for axis in grid:
+        if "=" not in axis:
+            raise ConfigError(f"expected KEY=V1,V2,..., got {axis}")
+        key, values = axis.split("=", 1)
+        parsed[key] = [parse_value(value) for value in values.split(",")]
+    return parsed
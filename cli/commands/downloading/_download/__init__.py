@@ -1,13 +1,27 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import dataclasses
 import logging
 import argparse
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Set
 
+from ....exceptions import ConfigError
 from .configs.download import CONFIG_CHOICES
 from .downloader.build_downloader import build_downloader
+from .downloader.downloader import Downloader, Page
+from .downloader.metrics import METRICS
 
 __all__ = ["download_cmd"]
 
 _logger = logging.getLogger(__name__)
 
+# pages each worker may have waiting for the writer thread
+PAGES_PER_WORKER = 2
+QUEUE_POLL_SECONDS = 0.1
+
 
 def download_cmd(parent: argparse._SubParsersAction) -> None:
     download_cmd = parent.add_parser(
@@ -27,6 +41,57 @@ def download_cmd(parent: argparse._SubParsersAction) -> None:
         action="store_true",
         help="sets the logger to level DEBUG for just _download module loggers",
     )
+    download_cmd.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of symbols pulled concurrently, database writes stay on one thread",
+    )
+
+    download_cmd.add_argument(
+        "--flush-every-symbols",
+        type=int,
+        help="save the database after this many updated symbols, overrides the config",
+    )
+    download_cmd.add_argument(
+        "--flush-every-seconds",
+        type=float,
+        help="save the database once this many seconds passed since the last save,\n"
+        "overrides the config",
+    )
+    download_cmd.add_argument(
+        "--offline",
+        action="store_true",
+        help="replay cached responses only, symbols without one are skipped",
+    )
+    download_cmd.add_argument(
+        "--no-response-cache",
+        action="store_true",
+        help="neither read nor write the on disk response cache",
+    )
+    download_cmd.add_argument(
+        "--metrics-json",
+        help="write the per stage timers and counters of the run to this json file",
+    )
+    download_cmd.add_argument(
+        "--metrics-prom",
+        help="write the per stage timers and counters of the run to this prometheus\n"
+        "textfile",
+    )
+
+    download_cmd.add_argument(
+        "--alpaca-url",
+        help="send alpaca requests to this base url instead, e.g. a local mock server",
+    )
+    download_cmd.add_argument(
+        "--polygon-url",
+        help="send polygon requests to this base url instead, e.g. a local mock server",
+    )
+    download_cmd.add_argument(
+        "--requests-per-minute",
+        type=float,
+        help="the request quota of every provider, overrides the config",
+    )
 
     download_cmd.set_defaults(func=_download_func)
     return
@@ -36,12 +101,153 @@ def _download_func(args: argparse.Namespace) -> None:
     if args.debug is True:
         _logger.setLevel(logging.DEBUG)
 
-    downloader = build_downloader(CONFIG_CHOICES[args.config])
+    cfg = CONFIG_CHOICES[args.config]
+    if args.flush_every_symbols is not None:
+        cfg = dataclasses.replace(cfg, flush_every_symbols=args.flush_every_symbols)
+    if args.flush_every_seconds is not None:
+        cfg = dataclasses.replace(cfg, flush_every_seconds=args.flush_every_seconds)
+    if args.offline and args.no_response_cache:
+        raise ConfigError(
+            "--offline replays the response cache, drop --no-response-cache"
+        )
+    if args.offline:
+        cfg = dataclasses.replace(cfg, offline=True)
+    if args.no_response_cache:
+        cfg = dataclasses.replace(cfg, use_response_cache=False)
+    if args.alpaca_url is not None:
+        cfg = dataclasses.replace(cfg, alpaca_url_override=args.alpaca_url)
+    if args.polygon_url is not None:
+        cfg = dataclasses.replace(cfg, polygon_base_url=args.polygon_url)
+    if args.requests_per_minute is not None:
+        cfg = dataclasses.replace(
+            cfg,
+            alpaca_requests_per_minute=args.requests_per_minute,
+            polygon_requests_per_minute=args.requests_per_minute,
+        )
+
+    METRICS.reset()
+    with METRICS.timer("build_downloader"):
+        downloader = build_downloader(cfg)
+
+    start_time = time.perf_counter()
+    try:
+        if args.workers > 1:
+            _download_concurrently(downloader, args.workers)
+        else:
+            _download_sequentially(downloader)
+    finally:
+        with METRICS.timer("flush"):
+            downloader.flush()
+    elapsed = time.perf_counter() - start_time
+
+    downloader.log_summary()
+    symbol_count = len(downloader.symbols())
+    _logger.info(
+        f"processed {symbol_count} symbols in {elapsed:.1f}s "
+        f"({symbol_count / max(elapsed, 1e-9):.2f} symbols/sec, workers={args.workers})"
+    )
+    _log_metrics(args)
+
+
+# stage times are summed over threads, with workers they can exceed the run
+def _log_metrics(args: argparse.Namespace) -> None:
+    _logger.info(f"download metrics\n{METRICS.summary_table()}")
+    if args.metrics_json is not None:
+        METRICS.write_json(args.metrics_json)
+        _logger.info(f"wrote metrics to {args.metrics_json}")
+    if args.metrics_prom is not None:
+        METRICS.write_prometheus(args.metrics_prom)
+        _logger.info(f"wrote metrics to {args.metrics_prom}")
+
+
+def _download_sequentially(downloader: Downloader) -> None:
+    for symbol_to_missing in _missing_batches(downloader):
+        for page in _timed_pages(downloader, symbol_to_missing):
+            _save_page(downloader, page)
+
+
+# only pulling runs on the worker threads, finding misses and saving both touch
+# the database and therefore stay on the calling thread. workers hand pages
+# over through a bounded queue, so at most PAGES_PER_WORKER pages per worker
+# wait to be saved while the others block
+def _download_concurrently(downloader: Downloader, workers: int) -> None:
+    pages: queue.Queue = queue.Queue(maxsize=PAGES_PER_WORKER * workers)
+    stop = threading.Event()
+    in_flight: Set[Future] = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for symbol_to_missing in _missing_batches(downloader):
+                in_flight.add(
+                    executor.submit(
+                        _produce_pages, downloader, symbol_to_missing, pages, stop
+                    )
+                )
+                while len(in_flight) >= 2 * workers:
+                    _save_next_page(downloader, pages, in_flight)
+
+            while len(in_flight) > 0 or not pages.empty():
+                _save_next_page(downloader, pages, in_flight)
+        finally:
+            stop.set()
 
+
+def _missing_batches(downloader: Downloader) -> Iterator[Dict[str, List[datetime]]]:
+    symbol_to_missing: Dict[str, List[datetime]] = {}
     for symbol in downloader.symbols():
-        missing_dts = downloader.find_missing_dates(symbol)
+        with METRICS.timer("find_missing_dates"):
+            missing_dts = downloader.find_missing_dates(symbol)
         if len(missing_dts) == 0:
             continue
 
-        pulled_data = downloader.pull_missing_data(symbol, missing_dts)
-        downloader.save_to_database(symbol, missing_dts, pulled_data)
+        symbol_to_missing[symbol] = missing_dts
+        if len(symbol_to_missing) >= downloader.batch_size():
+            yield symbol_to_missing
+            symbol_to_missing = {}
+
+    if len(symbol_to_missing) > 0:
+        yield symbol_to_missing
+
+
+def _produce_pages(
+    downloader: Downloader,
+    symbol_to_missing: Dict[str, List[datetime]],
+    pages: queue.Queue,
+    stop: threading.Event,
+) -> None:
+    for page in _timed_pages(downloader, symbol_to_missing):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=QUEUE_POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        if stop.is_set():
+            return
+
+
+# saves at most one page, then drops finished producers, re-raising their errors
+def _save_next_page(
+    downloader: Downloader, pages: queue.Queue, in_flight: Set[Future]
+) -> None:
+    try:
+        _save_page(downloader, pages.get(timeout=QUEUE_POLL_SECONDS))
+    except queue.Empty:
+        pass
+
+    for future in [future for future in in_flight if future.done()]:
+        in_flight.remove(future)
+        future.result()
+
+
+def _timed_pages(
+    downloader: Downloader, symbol_to_missing: Dict[str, List[datetime]]
+) -> Iterator[Page]:
+    return METRICS.timed_iter(
+        "pull_missing_data", downloader.pull_missing_pages(symbol_to_missing)
+    )
+
+
+def _save_page(downloader: Downloader, page: Page) -> None:
+    with METRICS.timer("save_to_database"):
+        for symbol, (missing_dts, pulled_data) in page.items():
+            downloader.save_to_database(symbol, missing_dts, pulled_data)
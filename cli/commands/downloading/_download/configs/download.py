@@ -1,11 +1,10 @@
 from dataclasses import dataclass
 from enum import Enum
+import functools
 import os
+from typing import Callable, Dict, Iterator, List, Mapping
 
-
-import pytz
-from typing import Set, List
-import pandas as pd
+SP500_SYMBOLS_FILEPATH = "./data/sp500_equity_symbols.csv"
 
 
 class DownloaderEnum(Enum):
@@ -14,6 +13,12 @@ class DownloaderEnum(Enum):
     FinancialsDownloader = "FinancialsDownloader"
 
 
+class DatabaseEnum(Enum):
+    DataframeDatabase = "DataframeDatabase"
+    PartitionedParquetDatabase = "PartitionedParquetDatabase"
+    RecordDatabase = "RecordDatabase"
+
+
 @dataclass
 class DownloadConfig:
     database_filepath: str
@@ -21,43 +26,112 @@ class DownloadConfig:
     symbols: List[str]
     use_existing_db: bool
     years_examined: int
-    database_entry_type: str
+    # dtype of the DataframeDatabase and PartitionedParquetDatabase columns
+    database_entry_type: str = "float64"
     symbols_limit: int = None
     alpaca_key_id: str = None
     alpaca_secret_key: str = None
     polygon_api_key: str = None
+    # point the clients at another host, e.g. benchmarks/mock_server.py
+    alpaca_url_override: str = None
+    polygon_base_url: str = None
+    database_enum: DatabaseEnum = DatabaseEnum.DataframeDatabase
+    entry_fields: Dict[str, str] = None
+    symbols_per_request: int = 1
+    gap_tolerance_slots: int = 6
+    # the most slots one request covers, ~8 trading days of 79 five minute slots
+    page_slots: int = 650
+    use_response_cache: bool = True
+    response_cache_dir: str = "./data/.response_cache"
+    response_cache_max_bytes: int = 2 * 1024**3
+    offline: bool = False
+    # provider quotas shared by every client in the process, 429 responses
+    # lower the rate below them until requests succeed again
+    alpaca_requests_per_minute: float = 200
+    polygon_requests_per_minute: float = 5
+    max_retries: int = 5
+    calendar_cache_dir: str = "./data/.calendar_cache"
+    flush_every_symbols: int = 25
+    flush_every_seconds: float = 300
+
+
+# the symbol universe is read once per process, whichever config asks first
+@functools.lru_cache(maxsize=None)
+def load_symbols(filepath: str) -> List[str]:
+    import pandas as pd
+
+    return pd.read_csv(filepath)["Symbol"].tolist()
+
+
+# configs are only built when looked up, so listing the choices (e.g. for
+# --help) reads no files
+class LazyConfigs(Mapping[str, DownloadConfig]):
+    def __init__(self, factories: Dict[str, Callable[[], DownloadConfig]]):
+        self._factories = factories
+        self._configs: Dict[str, DownloadConfig] = {}
+
+    def __getitem__(self, name: str) -> DownloadConfig:
+        if name not in self._configs:
+            self._configs[name] = self._factories[name]()
+        return self._configs[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._factories
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._factories)
+
+    def __len__(self) -> int:
+        return len(self._factories)
 
 
-CONFIG_CHOICES = {
-    "sp500_equity_prices": DownloadConfig(
-        alpaca_key_id=os.environ.get("ALYOSHA_ALPACA_API_KEY_ID"),
-        alpaca_secret_key=os.environ.get("ALYOSHA_ALPACA_API_SECRET"),
-        database_filepath="./data/sp500_equity_prices.parquet",
-        downloader_enum=DownloaderEnum.PricesDownloader,
-        symbols=pd.read_csv("./data/sp500_equity_symbols.csv")["Symbol"],
-        use_existing_db=True,
-        years_examined=5,
-        symbols_limit=10,
-        database_entry_type="float64",
-    ),
-    "sp500_equity_profiles": DownloadConfig(
-        polygon_api_key=os.environ.get("POLYGON_API_KEY"),
-        database_filepath="./data/sp500_equity_profiles.parquet",
-        downloader_enum=DownloaderEnum.ProfilesDownloader,
-        symbols=pd.read_csv("./data/sp500_equity_symbols.csv")["Symbol"],
-        use_existing_db=True,
-        years_examined=5,
-        symbols_limit=5,
-        database_entry_type="object",
-    ),
-    "sp500_equity_financials": DownloadConfig(
-        polygon_api_key=os.environ.get("POLYGON_API_KEY"),
-        database_filepath="./data/sp500_equity_financials.parquet",
-        downloader_enum=DownloaderEnum.FinancialsDownloader,
-        symbols=pd.read_csv("./data/sp500_equity_symbols.csv")["Symbol"],
-        use_existing_db=True,
-        years_examined=5,
-        symbols_limit=5,
-        database_entry_type="object",
-    ),
-}
+CONFIG_CHOICES = LazyConfigs(
+    {
+        "sp500_equity_prices": lambda: DownloadConfig(
+            alpaca_key_id=os.environ.get("ALYOSHA_ALPACA_API_KEY_ID"),
+            alpaca_secret_key=os.environ.get("ALYOSHA_ALPACA_API_SECRET"),
+            database_filepath="./data/sp500_equity_prices.parquet",
+            downloader_enum=DownloaderEnum.PricesDownloader,
+            symbols=load_symbols(SP500_SYMBOLS_FILEPATH),
+            use_existing_db=True,
+            years_examined=5,
+            symbols_limit=10,
+            database_entry_type="float64",
+            symbols_per_request=20,
+        ),
+        "sp500_equity_prices_partitioned": lambda: DownloadConfig(
+            alpaca_key_id=os.environ.get("ALYOSHA_ALPACA_API_KEY_ID"),
+            alpaca_secret_key=os.environ.get("ALYOSHA_ALPACA_API_SECRET"),
+            database_filepath="./data/sp500_equity_prices",
+            database_enum=DatabaseEnum.PartitionedParquetDatabase,
+            downloader_enum=DownloaderEnum.PricesDownloader,
+            symbols=load_symbols(SP500_SYMBOLS_FILEPATH),
+            use_existing_db=True,
+            years_examined=5,
+            database_entry_type="float64",
+            symbols_per_request=20,
+        ),
+        "sp500_equity_profiles": lambda: DownloadConfig(
+            polygon_api_key=os.environ.get("POLYGON_API_KEY"),
+            database_filepath="./data/sp500_equity_profiles.parquet",
+            database_enum=DatabaseEnum.RecordDatabase,
+            entry_fields={"total_employees": "Int64", "market_cap": "float64"},
+            downloader_enum=DownloaderEnum.ProfilesDownloader,
+            symbols=load_symbols(SP500_SYMBOLS_FILEPATH),
+            use_existing_db=True,
+            years_examined=5,
+            symbols_limit=5,
+        ),
+        "sp500_equity_financials": lambda: DownloadConfig(
+            polygon_api_key=os.environ.get("POLYGON_API_KEY"),
+            database_filepath="./data/sp500_equity_financials.parquet",
+            database_enum=DatabaseEnum.RecordDatabase,
+            entry_fields={"gross_margin": "float64", "revenue_diff": "float64"},
+            downloader_enum=DownloaderEnum.FinancialsDownloader,
+            symbols=load_symbols(SP500_SYMBOLS_FILEPATH),
+            use_existing_db=True,
+            years_examined=5,
+            symbols_limit=5,
+        ),
+    }
+)
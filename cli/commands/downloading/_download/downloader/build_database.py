@@ -0,0 +1,14 @@
+from ..configs.download import DatabaseEnum, DownloadConfig
+from .db import DatabaseInterface, DataframeDatabase
+from .partitioned_db import PartitionedParquetDatabase
+from .record_db import RecordDatabase
+
+
+def build_database(cfg: DownloadConfig) -> DatabaseInterface:
+    if cfg.database_enum == DatabaseEnum.DataframeDatabase:
+        return DataframeDatabase()
+    elif cfg.database_enum == DatabaseEnum.PartitionedParquetDatabase:
+        return PartitionedParquetDatabase()
+    elif cfg.database_enum == DatabaseEnum.RecordDatabase:
+        return RecordDatabase(cfg.entry_fields)
+    raise NotImplementedError
@@ -1,17 +1,19 @@
-from enum import Enum
-
 from ..configs.download import DownloadConfig, DownloaderEnum
 from .downloader import Downloader
-from .prices import PricesDownloader
-from .profiles import ProfilesDownloader
-from .financials import FinancialsDownloader
 
 
+# each downloader pulls in its own SDK, so only the one asked for is imported
 def build_downloader(cfg: DownloadConfig) -> Downloader:
     if cfg.downloader_enum == DownloaderEnum.PricesDownloader:
+        from .prices import PricesDownloader
+
         return PricesDownloader(cfg)
     elif cfg.downloader_enum == DownloaderEnum.ProfilesDownloader:
+        from .profiles import ProfilesDownloader
+
         return ProfilesDownloader(cfg)
     elif cfg.downloader_enum == DownloaderEnum.FinancialsDownloader:
+        from .financials import FinancialsDownloader
+
         return FinancialsDownloader(cfg)
     raise NotImplementedError
@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+import logging
+import time
+from typing import Callable, Optional, Set
+
+from .metrics import METRICS
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FlushPolicy:
+    every_symbols: Optional[int] = None
+    every_seconds: Optional[float] = None
+
+
+# tracks the distinct symbols whose data changed since the last save, a symbol
+# saved page by page counts once, and only saves once the policy says so, or
+# when flush is called explicitly at the end of a run
+class Checkpointer:
+    def __init__(self, save: Callable[[], None], policy: FlushPolicy):
+        self._save = save
+        self.policy = policy
+        self._dirty_symbols: Set[str] = set()
+        self._last_flush = time.monotonic()
+
+    def mark_dirty(self, symbol: str) -> None:
+        self._dirty_symbols.add(symbol)
+        if self.is_due():
+            self.flush()
+
+    def is_due(self) -> bool:
+        if len(self._dirty_symbols) == 0:
+            return False
+        if (
+            self.policy.every_symbols is not None
+            and len(self._dirty_symbols) >= self.policy.every_symbols
+        ):
+            return True
+        return (
+            self.policy.every_seconds is not None
+            and time.monotonic() - self._last_flush >= self.policy.every_seconds
+        )
+
+    def flush(self) -> None:
+        if len(self._dirty_symbols) == 0:
+            return
+        _logger.info(f"checkpointing database after {len(self._dirty_symbols)} symbols")
+        with METRICS.timer("database_save"):
+            self._save()
+        self._dirty_symbols = set()
+        self._last_flush = time.monotonic()
@@ -0,0 +1,150 @@
+from datetime import datetime
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+NANOSECONDS_PER_MINUTE = 60 * 1_000_000_000
+
+
+# per key bitmaps over a shared sorted grid of every epoch minute (UTC) ever
+# added, bit i of a bitmap is set when grid minute i holds a valid entry for
+# that key. the grid only grows by the slots a database stores, so the bitmaps
+# stay as small as the slot grid instead of spanning every minute in between
+class CoverageIndex:
+    def __init__(self):
+        self._grid = np.zeros(0, dtype=np.int64)
+        self._bitmaps: Dict[str, np.ndarray] = {}
+
+    def add(self, key: str, dtimes: pd.Index) -> None:
+        minutes = np.unique(to_minutes(dtimes))
+        if len(minutes) == 0:
+            return
+        self._extend_grid(minutes)
+
+        positions = np.searchsorted(self._grid, minutes)
+        bitmap = self._bitmaps.get(key, np.zeros(0, dtype=np.uint8))
+        byte_count = int(positions[-1]) // 8 + 1
+        if len(bitmap) < byte_count:
+            # grow with headroom so appending day by day stays amortized linear
+            grown = np.zeros(max(byte_count, 2 * len(bitmap)), dtype=np.uint8)
+            grown[: len(bitmap)] = bitmap
+            bitmap = grown
+        np.bitwise_or.at(
+            bitmap, positions >> 3, (128 >> (positions & 7)).astype(np.uint8)
+        )
+        self._bitmaps[key] = bitmap
+
+    def contains(self, key: str, dt: datetime) -> bool:
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            return False
+        minute = to_minute(dt)
+        position = int(np.searchsorted(self._grid, minute))
+        if position >= len(self._grid) or self._grid[position] != minute:
+            return False
+        if position >> 3 >= len(bitmap):
+            return False
+        return bool(bitmap[position >> 3] & (128 >> (position & 7)))
+
+    def contains_many(self, key: str, dtimes: pd.Index) -> np.ndarray:
+        found = np.zeros(len(dtimes), dtype=bool)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None or len(dtimes) == 0:
+            return found
+
+        minutes = to_minutes(dtimes)
+        positions = np.searchsorted(self._grid, minutes)
+        in_grid = positions < len(self._grid)
+        in_grid[in_grid] = self._grid[positions[in_grid]] == minutes[in_grid]
+        in_grid &= (positions >> 3) < len(bitmap)
+        positions = positions[in_grid]
+        found[in_grid] = (bitmap[positions >> 3] & (128 >> (positions & 7))) != 0
+        return found
+
+    def missing(self, key: str, dtimes: pd.Index) -> pd.Index:
+        return dtimes[~self.contains_many(key, dtimes)]
+
+    def keys(self) -> List[str]:
+        return list(self._bitmaps)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._bitmaps
+
+    def save(self, filepath: str, fingerprint: np.ndarray) -> None:
+        keys = self.keys()
+        width = max([len(self._bitmaps[key]) for key in keys], default=0)
+        bitmaps = np.zeros((len(keys), width), dtype=np.uint8)
+        for i, key in enumerate(keys):
+            bitmaps[i, : len(self._bitmaps[key])] = self._bitmaps[key]
+
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez_compressed(
+                tmp_filepath,
+                grid=self._grid,
+                keys=np.array(keys, dtype=str),
+                bitmaps=bitmaps,
+                fingerprint=fingerprint,
+            )
+            os.replace(tmp_filepath, filepath)
+        finally:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+
+    # returns None when the sidecar is missing, was written for other data or
+    # by an older layout
+    @classmethod
+    def load(cls, filepath: str, fingerprint: np.ndarray) -> Optional["CoverageIndex"]:
+        if not os.path.exists(filepath):
+            return None
+        with np.load(filepath) as sidecar:
+            if "grid" not in sidecar.files or not np.array_equal(
+                sidecar["fingerprint"], fingerprint
+            ):
+                return None
+            coverage = cls()
+            coverage._grid = sidecar["grid"].astype(np.int64)
+            for key, bitmap in zip(sidecar["keys"], sidecar["bitmaps"]):
+                coverage._bitmaps[str(key)] = bitmap.copy()
+        return coverage
+
+    # minutes past the end of the grid are appended, minutes falling between
+    # grid minutes shift the bits after them, which only happens when a hole
+    # no key had an entry for yet is filled in
+    def _extend_grid(self, minutes: np.ndarray) -> None:
+        positions = np.searchsorted(self._grid, minutes)
+        in_grid = positions < len(self._grid)
+        in_grid[in_grid] = self._grid[positions[in_grid]] == minutes[in_grid]
+        new_minutes, new_positions = minutes[~in_grid], positions[~in_grid]
+        if len(new_minutes) == 0:
+            return
+
+        inserted = new_positions < len(self._grid)
+        if inserted.any():
+            bit_count = len(self._grid)
+            for key, bitmap in self._bitmaps.items():
+                bits = np.zeros(bit_count, dtype=np.uint8)
+                unpacked = np.unpackbits(bitmap)[:bit_count]
+                bits[: len(unpacked)] = unpacked
+                self._bitmaps[key] = np.packbits(
+                    np.insert(bits, new_positions[inserted], 0)
+                )
+        self._grid = np.insert(self._grid, new_positions, new_minutes)
+
+
+def to_minutes(dtimes: Iterable[datetime]) -> np.ndarray:
+    utc_dtimes = pd.DatetimeIndex(pd.to_datetime(dtimes, utc=True))
+    return utc_dtimes.asi8 // NANOSECONDS_PER_MINUTE
+
+
+def to_minute(dt: datetime) -> int:
+    timestamp = pd.Timestamp(dt)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return timestamp.value // NANOSECONDS_PER_MINUTE
+
+
+def is_whole_minute(dt: datetime) -> bool:
+    return dt.second == 0 and dt.microsecond == 0
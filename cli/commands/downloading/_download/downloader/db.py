@@ -1,10 +1,16 @@
 from abc import abstractmethod
 from datetime import datetime
-from typing import List, Tuple
+from typing import List, Sequence, Set, Tuple
 from typing_extensions import Protocol
 
+import numpy as np
 import pandas as pd
 
+from core.files import atomic_to_parquet
+
+from .coverage import CoverageIndex, is_whole_minute
+from .metrics import METRICS
+
 
 class DatabaseInterface(Protocol):
     @abstractmethod
@@ -16,21 +22,23 @@ class DatabaseInterface(Protocol):
         "add a set of rows to the db"
 
     @abstractmethod
-    def add_symbol(self, symbol: str, entry_type: str) -> None:
-        "add a row for a certain symbol"
+    def add_batch(
+        self, symbol: str, dtimes: Sequence[datetime], entries: Sequence[object]
+    ) -> None:
+        "add a set of entries for a symbol, given as parallel columns"
 
     @abstractmethod
     def contains(self, symbol: str, dt: datetime) -> bool:
         "determine if the db contains a valid entry for the symbol and datetime"
 
-    @abstractmethod
-    def contains_datetime(self, dt: datetime) -> bool:
-        "determine if the db contains a valid entry for the datetime"
-
     @abstractmethod
     def contains_symbol(self, symbol: str) -> bool:
         "determine if the db contains a valid entry for the symbol"
 
+    @abstractmethod
+    def missing(self, symbol: str, dtimes: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        "determine which of the datetimes lack a valid entry for the symbol"
+
     @abstractmethod
     def load(self, filepath: str) -> None:
         "load database from memory"
@@ -40,46 +48,154 @@ class DatabaseInterface(Protocol):
         "save database to memory"
 
 
-class DataframeDatabase(DatabaseInterface):
+# databases keeping one typed column per symbol, created before its first entry
+class ColumnarDatabaseInterface(DatabaseInterface, Protocol):
+    @abstractmethod
+    def add_symbol(self, symbol: str, entry_type: str) -> None:
+        "add a row for a certain symbol"
+
+
+# the coverage index mirrors which (symbol, datetime) cells are valid and which
+# datetimes are in the index, so membership checks avoid pandas lookups
+class DataframeDatabase(ColumnarDatabaseInterface):
+    INDEX_KEY = "__index__"
+
     def __init__(self):
         self._df = pd.DataFrame()
+        self._coverage = CoverageIndex()
 
     def add_entry(self, symbol: str, dt: datetime, entry: object) -> None:
         if entry is None:
             return
-        self._df[symbol][dt] = entry
+        # a single .loc write, chained indexing may write to a copy and leave
+        # the coverage claiming an entry the frame does not have
+        self._df.loc[dt, symbol] = entry
+        self._coverage.add(symbol, pd.Index([dt]))
+        self._coverage.add(self.INDEX_KEY, pd.Index([dt]))
 
     def add_rows(self, symbol: str, new_rows: List[Tuple[datetime, object]]) -> None:
-        self._df = pd.concat([to_df(symbol, new_rows), self._df])
+        if len(new_rows) == 0:
+            return
+        dtimes, entries = zip(*new_rows)
+        self.add_batch(symbol, dtimes, entries)
+
+    # the batch is aligned onto the union of both indexes once, then combined
+    # with the existing column so batch entries win where both are present
+    def add_batch(
+        self, symbol: str, dtimes: Sequence[datetime], entries: Sequence[object]
+    ) -> None:
+        batch = to_series(symbol, dtimes, entries)
+        if len(batch) == 0:
+            return
+
+        if len(self._df.index) == 0:
+            index = batch.index
+        else:
+            index = self._df.index.union(batch.index)
+        if not index.equals(self._df.index):
+            self._df = self._df.reindex(index)
+
+        if symbol in self._df:
+            self._df[symbol] = batch.reindex(index).combine_first(self._df[symbol])
+        else:
+            self._df[symbol] = batch.reindex(index)
+        self._coverage.add(symbol, batch.index)
+        self._coverage.add(self.INDEX_KEY, batch.index)
 
     def add_symbol(self, symbol: str, entry_type: str) -> None:
         self._df[symbol] = pd.Series(dtype=entry_type)
 
     def contains(self, symbol: str, dtime: datetime) -> bool:
-        return (
-            symbol in self._df
-            and dtime in self._df[symbol]
-            and not pd.isna(self._df[symbol][dtime])
-        )
+        if not is_whole_minute(dtime):
+            return (
+                symbol in self._df
+                and dtime in self._df[symbol]
+                and not pd.isna(self._df[symbol][dtime])
+            )
+        return self._coverage.contains(symbol, dtime)
 
     def contains_datetime(self, dtime: datetime) -> bool:
-        return dtime in self._df.index
+        if not is_whole_minute(dtime):
+            return dtime in self._df.index
+        return self._coverage.contains(self.INDEX_KEY, dtime)
+
+    def contains_datetimes(self, dtimes: pd.DatetimeIndex) -> np.ndarray:
+        utc_dtimes = to_utc_index(dtimes)
+        if (utc_dtimes.second != 0).any() or (utc_dtimes.microsecond != 0).any():
+            return utc_dtimes.isin(to_utc_index(self._df.index))
+        return self._coverage.contains_many(self.INDEX_KEY, dtimes)
 
     def contains_symbol(self, symbol: str) -> bool:
         return symbol in self._df
 
+    def missing(self, symbol: str, dtimes: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        if symbol not in self._df:
+            return dtimes
+        utc_dtimes = to_utc_index(dtimes)
+        if (utc_dtimes.second != 0).any() or (utc_dtimes.microsecond != 0).any():
+            valid_dtimes = self._df[symbol].dropna().index
+            return dtimes[~utc_dtimes.isin(to_utc_index(valid_dtimes))]
+        return self._coverage.missing(symbol, dtimes)
+
     def load(self, filepath: str) -> None:
         self._df = pd.read_parquet(filepath)
+        coverage = CoverageIndex.load(coverage_filepath(filepath), self._fingerprint())
+        if coverage is None or set(coverage.keys()) != self._coverage_keys():
+            coverage = self._build_coverage()
+        self._coverage = coverage
 
     def save(self, filepath: str) -> None:
-        self._df.to_parquet(filepath)
+        save_parquet(self._df, filepath)
+        self._coverage.save(coverage_filepath(filepath), self._fingerprint())
+
+    def _build_coverage(self) -> CoverageIndex:
+        coverage = CoverageIndex()
+        coverage.add(self.INDEX_KEY, self._df.index)
+        for symbol in self._df:
+            coverage.add(symbol, self._df[symbol].dropna().index)
+        return coverage
+
+    def _coverage_keys(self) -> Set[str]:
+        keys = {symbol for symbol in self._df if self._df[symbol].notna().any()}
+        if len(self._df.index) > 0:
+            keys.add(self.INDEX_KEY)
+        return keys
+
+    # cheap summary of the frame used to detect a sidecar written for other data,
+    # the index bounds catch frames with the same counts over other datetimes
+    def _fingerprint(self) -> np.ndarray:
+        bounds = [-1, -1]
+        if len(self._df.index) > 0:
+            utc_index = to_utc_index(self._df.index)
+            bounds = [utc_index.min().value, utc_index.max().value]
+        return np.array(
+            [len(self._df.index), *bounds] + self._df.notna().sum().tolist(),
+            dtype=np.int64,
+        )
+
+
+def save_parquet(df: pd.DataFrame, filepath: str) -> None:
+    METRICS.increment("bytes_written", atomic_to_parquet(df, filepath))
 
 
 def to_df(symbol: str, datetime_list: List[Tuple[datetime, object]]) -> pd.DataFrame:
-    df = pd.DataFrame()
-    for dt, obj in datetime_list:
-        df = pd.concat(
-            [df, pd.DataFrame({symbol: {dt: obj}})],
-            ignore_index=False,
-        )
-    return df
+    if len(datetime_list) == 0:
+        return pd.DataFrame()
+    dtimes, entries = zip(*datetime_list)
+    return to_series(symbol, dtimes, entries).to_frame()
+
+
+def to_series(
+    symbol: str, dtimes: Sequence[datetime], entries: Sequence[object]
+) -> pd.Series:
+    series = pd.Series(entries, index=pd.Index(dtimes), name=symbol)
+    series = series[~series.index.duplicated(keep="last")]
+    return series.dropna()
+
+
+def coverage_filepath(filepath: str) -> str:
+    return f"{filepath}.coverage.npz"
+
+
+def to_utc_index(dtimes: pd.Index) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(pd.to_datetime(dtimes, utc=True))
@@ -1,7 +1,9 @@
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Tuple
 from datetime import datetime
 
-import pandas as pd
+
+# the missing datetimes a page covers and the data pulled for them, per symbol
+Page = Dict[str, Tuple[List[datetime], object]]
 
 
 class Downloader:
@@ -13,6 +15,29 @@ class Downloader:
     ) -> List[Tuple[datetime, object]]:
         raise NotImplementedError
 
+    def pull_missing_data_batch(
+        self, symbol_to_missing: Dict[str, List[datetime]]
+    ) -> Dict[str, List[Tuple[datetime, object]]]:
+        return {
+            symbol: self.pull_missing_data(symbol, missing_datetimes)
+            for symbol, missing_datetimes in symbol_to_missing.items()
+        }
+
+    # pages are saved as they arrive, downloaders that can split a pull into
+    # smaller requests override this so memory is bounded by a page instead of
+    # a symbol's whole history
+    def pull_missing_pages(
+        self, symbol_to_missing: Dict[str, List[datetime]]
+    ) -> Iterator[Page]:
+        pulled_data = self.pull_missing_data_batch(symbol_to_missing)
+        yield {
+            symbol: (missing_datetimes, pulled_data.get(symbol))
+            for symbol, missing_datetimes in symbol_to_missing.items()
+        }
+
+    def batch_size(self) -> int:
+        return 1
+
     def save_to_database(
         self,
         symbol: str,
@@ -21,5 +46,11 @@ class Downloader:
     ) -> None:
         raise NotImplementedError
 
+    def flush(self) -> None:
+        raise NotImplementedError
+
+    def log_summary(self) -> None:
+        return
+
     def symbols(self) -> List[str]:
         raise NotImplementedError
@@ -5,13 +5,25 @@ from os.path import exists
 from typing import Dict, List, Optional, Set, Tuple
 
 from polygon import RESTClient
+import numpy as np
 import pandas as pd
-from pandas_market_calendars.calendar_registry import MarketCalendar
 import pytz
 
+from .....exceptions import ResourceError
 from ..configs.download import DownloadConfig
+from .checkpoint import Checkpointer, FlushPolicy
 from .downloader import Downloader
-from .db import DatabaseInterface, DataframeDatabase
+from .build_database import build_database
+from .db import DatabaseInterface
+from .metrics import METRICS
+from .polygon_api import polygon_pages
+from .rate_limit import FailureLog, RateLimiter, build_rate_limiter
+from .response_cache import (
+    ResponseCache,
+    build_response_cache,
+    cached_call,
+    is_historical,
+)
 from .utils import (
     datetime_key,
     load_quarterly_calender,
@@ -29,26 +41,40 @@ class FinancialsDownloader(Downloader):
 
         self._polygon_client: Optional[RESTClient] = None
 
+        self.response_cache: Optional[ResponseCache] = build_response_cache(cfg)
+        self.rate_limiter: RateLimiter = build_rate_limiter("polygon", cfg)
+        self.failures = FailureLog()
+
         self._database: Optional[DatabaseInterface] = None
         if cfg.use_existing_db and exists(cfg.database_filepath):
             _logger.info("loading existing database")
-            self._database = DataframeDatabase()
+            self._database = build_database(cfg)
             self._database.load(cfg.database_filepath)
 
+        self._checkpointer = Checkpointer(
+            lambda: self.database.save(self.cfg.database_filepath),
+            FlushPolicy(cfg.flush_every_symbols, cfg.flush_every_seconds),
+        )
+
         self.target_datetimes = load_quarterly_calender(cfg.years_examined)
 
     @property
     def polygon_client(self) -> RESTClient:
         if self._polygon_client is None:
             _logger.info("loading polygon client")
-            self._polygon_client = RESTClient(api_key=self.cfg.polygon_api_key)
+            base_url = {}
+            if self.cfg.polygon_base_url is not None:
+                base_url["base"] = self.cfg.polygon_base_url
+            self._polygon_client = RESTClient(
+                api_key=self.cfg.polygon_api_key, **base_url
+            )
         return self._polygon_client
 
     @property
     def database(self) -> DatabaseInterface:
         if self._database is None:
             _logger.info("loading new database")
-            self._database = DataframeDatabase()
+            self._database = build_database(self.cfg)
         return self._database
 
     def find_missing_dates(self, symbol: str) -> List[datetime.date]:
@@ -70,6 +96,9 @@ class FinancialsDownloader(Downloader):
                 symbol,
                 self.polygon_client,
                 missing_datetimes,
+                self.response_cache,
+                self.rate_limiter,
+                self.failures,
             )
         )
 
@@ -84,23 +113,24 @@ class FinancialsDownloader(Downloader):
 
         dt_to_profile = to_datetime_mapping(pulled_data)
 
-        cfg = UpdateDatabaseConfig(
-            symbol,
-            self.database,
-            missing_datetimes,
-            dt_to_profile,
-            self.cfg.database_entry_type,
+        new_rows = generate_new_rows(
+            UpdateDatabaseConfig(
+                symbol, self.database, missing_datetimes, dt_to_profile
+            )
         )
-        update_count = fill_new_entries(cfg)
-        new_rows = generate_new_rows(cfg)
+        if len(new_rows) == 0:
+            return
 
-        has_new_rows = len(new_rows) > 0
-        if has_new_rows > 0:
-            self.database.add_rows(symbol, new_rows)
+        self.database.add_rows(symbol, new_rows)
+        METRICS.increment("entries_written", len(new_rows))
+        _logger.debug(f"Marking database for saving: {symbol}")
+        self._checkpointer.mark_dirty(symbol)
 
-        if update_count > 0 or has_new_rows:
-            _logger.debug(f"Saving to database: {symbol}")
-            self.database.save(self.cfg.database_filepath)
+    def flush(self) -> None:
+        self._checkpointer.flush()
+
+    def log_summary(self) -> None:
+        self.failures.log_summary()
 
     def symbols(self) -> List[str]:
         return self.cfg.symbols
@@ -174,6 +204,7 @@ class GetDatabaseMissesConfig:
 
 def get_profile_misses(cfg: GetDatabaseMissesConfig) -> List[datetime]:
     missing_dt_lst = []
+    METRICS.increment("slots_checked", len(cfg.datetimes))
 
     for dt in cfg.datetimes:
         if not cfg.database.contains(cfg.symbol, dt):
@@ -187,46 +218,121 @@ class GetFinancialsConfig:
     symbol: str
     polygon_client: RESTClient
     datetimes: List[datetime]
+    response_cache: ResponseCache = None
+    rate_limiter: RateLimiter = None
+    failures: FailureLog = None
 
 
 def get_financials(cfg: GetFinancialsConfig) -> List[Tuple[datetime, object]]:
     financials: List[Tuple[datetime, object]] = []
+    if len(cfg.datetimes) == 0:
+        return financials
+
+    try:
+        history = get_financials_history(
+            cfg.polygon_client,
+            cfg.symbol,
+            max(cfg.datetimes),
+            cfg.response_cache,
+            cfg.rate_limiter,
+        )
+    except ResourceError as e:
+        _logger.warning(f"Skipping financials for {cfg.symbol}: {e}")
+        if cfg.failures is not None:
+            cfg.failures.record(cfg.symbol, e)
+        return financials
+    filing_dates = history["filing_date"].values
     for dt in cfg.datetimes:
-        polygon_financials = cfg.polygon_client.vx.list_stock_financials(
-            ticker=cfg.symbol,
-            filing_date_lt=str(dt.date()),
-            timeframe="annual",
-            order="desc",
-            sort="filing_date",
+        # the two latest annual filings strictly before the target date
+        filing_count = np.searchsorted(
+            filing_dates, np.datetime64(dt.date(), "ns"), side="left"
         )
-        gross_margin, revenue_after, pre_length = None, None, len(financials)
-        for financial in polygon_financials:
-            if gross_margin is None:
-                gross_margin = (
-                    financial.financials.income_statement.gross_profit.value
-                    / financial.financials.income_statement.revenues.value
-                )
-            if revenue_after is None:
-                revenue_after = financial.financials.income_statement.revenues.value
-            else:
-                rev_before = financial.financials.income_statement.revenues.value
-                financials.append(
-                    (
-                        dt,
-                        {
-                            "gross_margin": gross_margin,
-                            "revenue_diff": (revenue_after - rev_before) / rev_before,
-                        },
-                    )
-                )
-                break
-        if len(financials) == pre_length:
-            _logger.warn(
+        if filing_count < 2:
+            _logger.warning(
                 f"No results appended when pulling financials for {dt} {cfg.symbol}"
             )
+            continue
+
+        latest, previous = (
+            history.iloc[filing_count - 1],
+            history.iloc[filing_count - 2],
+        )
+        financials.append(
+            (
+                dt,
+                {
+                    "gross_margin": float(latest["gross_profit"] / latest["revenues"]),
+                    "revenue_diff": float(
+                        (latest["revenues"] - previous["revenues"])
+                        / previous["revenues"]
+                    ),
+                },
+            )
+        )
     return financials
 
 
+# every annual filing before the last target date, requested page by page and
+# sorted by filing date so each target can be resolved with a binary search
+def get_financials_history(
+    polygon_client: RESTClient,
+    symbol: str,
+    until: datetime,
+    response_cache: Optional[ResponseCache] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> pd.DataFrame:
+    polygon_financials = cached_call(
+        response_cache,
+        "polygon.stock_financials",
+        {"ticker": symbol, "filing_date_lt": str(until.date()), "timeframe": "annual"},
+        lambda: [
+            financial
+            for page in polygon_pages(
+                polygon_client,
+                "/vX/reference/financials",
+                {
+                    "ticker": symbol,
+                    "filing_date.lt": str(until.date()),
+                    "timeframe": "annual",
+                    "order": "asc",
+                    "sort": "filing_date",
+                    "limit": "100",
+                },
+                rate_limiter,
+            )
+            for financial in page.get("results", [])
+        ],
+        historical=is_historical(until),
+    )
+
+    rows = []
+    for financial in polygon_financials:
+        income_statement = financial.get("financials", {}).get("income_statement", {})
+        rows.append(
+            {
+                "filing_date": financial.get("filing_date"),
+                "gross_profit": statement_value(income_statement, "gross_profit"),
+                "revenues": statement_value(income_statement, "revenues"),
+            }
+        )
+
+    history = pd.DataFrame(rows, columns=["filing_date", "gross_profit", "revenues"])
+    history["filing_date"] = pd.to_datetime(history["filing_date"], errors="coerce")
+    history[["gross_profit", "revenues"]] = history[
+        ["gross_profit", "revenues"]
+    ].astype("float64")
+    # filings without a date or a usable income statement would be saved as NaN
+    # or inf and never fetched again
+    history = history.dropna()
+    history = history[history["revenues"] != 0]
+    return history.sort_values("filing_date", kind="stable").reset_index(drop=True)
+
+
+def statement_value(statement: Dict[str, object], field: str) -> Optional[float]:
+    data_point = statement.get(field)
+    return None if data_point is None else data_point.get("value")
+
+
 @dataclass
 class ExtractPriceConfig:
     database: DatabaseInterface
@@ -240,34 +346,17 @@ class UpdateDatabaseConfig:
     database: DatabaseInterface
     missing_datetimes: List[datetime]
     datetime_to_data: Dict[datetime, object]
-    entry_type: str
 
     def to_extract_price_config(self, dt: datetime) -> ExtractPriceConfig:
         return ExtractPriceConfig(self.database, dt, self.datetime_to_data)
 
 
-def fill_new_entries(
-    cfg: UpdateDatabaseConfig,
-) -> int:
-    update_count = 0
-    for idx, dt in enumerate(cfg.missing_datetimes):
-        if cfg.database.contains_datetime(dt):
-            if not cfg.database.contains_symbol(cfg.symbol):
-                cfg.database.add_symbol(cfg.symbol, cfg.entry_type)
-
-            profile = cfg.datetime_to_data[datetime_key(dt)]
-            if profile is not None:
-                cfg.database.add_entry(cfg.symbol, dt, profile)
-                update_count += 1
-    return update_count
-
-
-# uses UpdateDatabaseConfig but actually does not need all its fields
+# datetimes the pull skipped, e.g. after a failed request, have no entry in
+# datetime_to_data and stay missing until the next run
 def generate_new_rows(cfg: UpdateDatabaseConfig) -> List[Tuple[datetime, object]]:
     new_rows = []
-    for idx, dt in enumerate(cfg.missing_datetimes):
-        if not cfg.database.contains_datetime(dt):
-            profile = cfg.datetime_to_data[datetime_key(dt)]
-            if profile is not None:
-                new_rows += [(dt, profile)]
+    for dt in cfg.missing_datetimes:
+        profile = cfg.datetime_to_data.get(datetime_key(dt))
+        if profile is not None:
+            new_rows.append((dt, profile))
     return new_rows
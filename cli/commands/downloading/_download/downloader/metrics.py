@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, TypeVar
+
+PROMETHEUS_PREFIX = "printer_download"
+
+T = TypeVar("T")
+
+
+@dataclass
+class StageTimes:
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+
+
+# process wide timers and counters of a download run. stage cpu time is the
+# cpu time of the thread running the stage, so a stage whose cpu time is far
+# below its wall time is waiting on the network or the disk
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, StageTimes] = {}
+        self.counters: Dict[str, float] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(
+                stage,
+                time.perf_counter() - wall_start,
+                time.thread_time() - cpu_start,
+            )
+
+    # times every next() of the iterator as one call of the stage
+    def timed_iter(self, stage: str, iterator: Iterator[T]) -> Iterator[T]:
+        iterator = iter(iterator)
+        while True:
+            with self.timer(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def record(self, stage: str, wall_seconds: float, cpu_seconds: float) -> None:
+        with self._lock:
+            times = self.stages.setdefault(stage, StageTimes())
+            times.calls += 1
+            times.wall_seconds += wall_seconds
+            times.cpu_seconds += cpu_seconds
+
+    def increment(self, counter: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {
+                "stages": {
+                    stage: asdict(times) for stage, times in sorted(self.stages.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def summary_table(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            f"{'stage':<22} {'calls':>8} {'wall (s)':>10} {'cpu (s)':>10} {'cpu/wall':>9}"
+        ]
+        for stage, times in snapshot["stages"].items():
+            cpu_share = times["cpu_seconds"] / max(times["wall_seconds"], 1e-9)
+            lines.append(
+                f"{stage:<22} {times['calls']:>8} {times['wall_seconds']:>10.2f} "
+                f"{times['cpu_seconds']:>10.2f} {cpu_share:>8.0%}"
+            )
+        lines.append("")
+        lines.append(f"{'counter':<22} {'value':>8}")
+        for counter, value in snapshot["counters"].items():
+            lines.append(f"{counter:<22} {value:>8g}")
+        return "\n".join(lines)
+
+    def write_json(self, filepath: str) -> None:
+        atomic_write_text(filepath, json.dumps(self.snapshot(), indent=2))
+
+    # node exporter textfile format, counters only grow within a run
+    def write_prometheus(self, filepath: str) -> None:
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        for name, field, help_text in [
+            ("stage_calls_total", "calls", "calls of a download stage"),
+            ("stage_wall_seconds", "wall_seconds", "wall time spent in a stage"),
+            ("stage_cpu_seconds", "cpu_seconds", "cpu time spent in a stage"),
+        ]:
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} counter")
+            for stage, times in snapshot["stages"].items():
+                lines.append(
+                    f'{PROMETHEUS_PREFIX}_{name}{{stage="{stage}"}} {times[field]}'
+                )
+        for counter, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{counter}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{counter}_total {value}")
+        atomic_write_text(filepath, "\n".join(lines) + "\n")
+
+
+def atomic_write_text(filepath: str, text: str) -> None:
+    tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_filepath, "w") as f:
+        f.write(text)
+    os.replace(tmp_filepath, filepath)
+
+
+METRICS = Metrics()
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from datetime import datetime
+import os
+import time
+from typing import Dict, List, Sequence, Set, Tuple
+import uuid
+
+import pandas as pd
+
+from .db import ColumnarDatabaseInterface, save_parquet, to_series, to_utc_index
+
+PartitionKey = Tuple[str, int, int]
+
+# lookups keep the valid datetimes of at most this many stored partitions
+MAX_CACHED_PARTITIONS = 64
+# a partition holding more part files than this is rewritten as one on save
+MAX_PART_FILES = 8
+
+
+# stores one directory per symbol=/year=/month= partition, every save only adds
+# new part files and every lookup only reads the partitions it covers. only
+# the valid datetimes of recently read partitions are kept in memory, entries
+# stay buffered until they are saved and a partition's buffered batches are
+# merged once when it is next read, so adding entry by entry stays linear
+class PartitionedParquetDatabase(ColumnarDatabaseInterface):
+    def __init__(self):
+        self._root: str = None
+        self._symbols: Set[str] = set()
+        self._entry_types: Dict[str, str] = {}
+        self._valid_indexes: OrderedDict[PartitionKey, pd.DatetimeIndex] = OrderedDict()
+        self._pending: Dict[PartitionKey, List[pd.Series]] = {}
+
+    def add_entry(self, symbol: str, dt: datetime, entry: object) -> None:
+        if entry is None:
+            return
+        self.add_batch(symbol, [dt], [entry])
+
+    def add_rows(self, symbol: str, new_rows: List[Tuple[datetime, object]]) -> None:
+        if len(new_rows) == 0:
+            return
+        dtimes, entries = zip(*new_rows)
+        self.add_batch(symbol, dtimes, entries)
+
+    def add_batch(
+        self, symbol: str, dtimes: Sequence[datetime], entries: Sequence[object]
+    ) -> None:
+        batch = to_series(symbol, dtimes, entries)
+        if len(batch) == 0:
+            return
+        batch.index = to_utc_index(batch.index)
+
+        self._symbols.add(symbol)
+        for (year, month), partition in batch.groupby(
+            [batch.index.year, batch.index.month]
+        ):
+            self._pending.setdefault((symbol, year, month), []).append(partition)
+
+    def add_symbol(self, symbol: str, entry_type: str) -> None:
+        self._symbols.add(symbol)
+        self._entry_types[symbol] = entry_type
+
+    def contains(self, symbol: str, dtime: datetime) -> bool:
+        if symbol not in self._symbols:
+            return False
+        utc_dtime = pd.Timestamp(dtime)
+        utc_dtime = (
+            utc_dtime.tz_localize("UTC")
+            if utc_dtime.tzinfo is None
+            else utc_dtime.tz_convert("UTC")
+        )
+        key = (symbol, utc_dtime.year, utc_dtime.month)
+        return utc_dtime in self._valid_index(key)
+
+    def contains_symbol(self, symbol: str) -> bool:
+        return symbol in self._symbols
+
+    def missing(self, symbol: str, dtimes: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        if symbol not in self._symbols or len(dtimes) == 0:
+            return dtimes
+        utc_dtimes = to_utc_index(dtimes)
+        months = set(zip(utc_dtimes.year, utc_dtimes.month))
+        valid_dtimes = [
+            self._valid_index((symbol, year, month)) for year, month in months
+        ]
+        return dtimes[~utc_dtimes.isin(concat_indexes(valid_dtimes))]
+
+    def load(self, filepath: str) -> None:
+        self._root = filepath
+        self._valid_indexes = OrderedDict()
+        self._pending = {}
+        self._symbols = {
+            name[len("symbol=") :]
+            for name in os.listdir(filepath)
+            if name.startswith("symbol=")
+        }
+
+    # only the entries added since the last save are written
+    def save(self, filepath: str) -> None:
+        if filepath != self._root:
+            self._valid_indexes = OrderedDict()
+        self._root = filepath
+        for key, batches in self._pending.items():
+            partition_dir = self._partition_dir(key)
+            self._write_part(key, partition_dir, combine_batches(batches))
+            self._valid_indexes.pop(key, None)
+            if len(part_files(partition_dir)) > MAX_PART_FILES:
+                self._compact(key, partition_dir)
+        self._pending = {}
+
+    def _partition_dir(self, key: PartitionKey) -> str:
+        symbol, year, month = key
+        return os.path.join(
+            self._root, f"symbol={symbol}", f"year={year}", f"month={month}"
+        )
+
+    # stored valid datetimes come from a bounded cache, buffered batches are
+    # merged into one the first time they are read
+    def _valid_index(self, key: PartitionKey) -> pd.DatetimeIndex:
+        valid_index = self._stored_valid_index(key)
+        batches = self._pending.get(key)
+        if batches is None:
+            return valid_index
+        if len(batches) > 1:
+            batches[:] = [combine_batches(batches)]
+        return valid_index.union(batches[0].index)
+
+    def _stored_valid_index(self, key: PartitionKey) -> pd.DatetimeIndex:
+        if key in self._valid_indexes:
+            self._valid_indexes.move_to_end(key)
+            return self._valid_indexes[key]
+
+        valid_index = self._read_stored_partition(key).dropna().index
+        self._valid_indexes[key] = valid_index
+        if len(self._valid_indexes) > MAX_CACHED_PARTITIONS:
+            self._valid_indexes.popitem(last=False)
+        return valid_index
+
+    # part files are named by write time so later writes win on duplicates
+    def _read_stored_partition(self, key: PartitionKey) -> pd.Series:
+        if self._root is None:
+            return combine_batches([])
+        partition_dir = self._partition_dir(key)
+        batches = []
+        for filename in part_files(partition_dir):
+            df = pd.read_parquet(os.path.join(partition_dir, filename))
+            batches.append(
+                pd.Series(df["entry"].values, index=to_utc_index(df["datetime"]))
+            )
+        return combine_batches(batches)
+
+    def _write_part(
+        self, key: PartitionKey, partition_dir: str, partition: pd.Series
+    ) -> None:
+        entry_type = self._entry_types.get(key[0])
+        if entry_type is not None:
+            partition = partition.astype(entry_type)
+
+        os.makedirs(partition_dir, exist_ok=True)
+        save_parquet(
+            pd.DataFrame({"datetime": partition.index, "entry": partition.values}),
+            os.path.join(
+                partition_dir, f"part-{time.time_ns()}-{uuid.uuid4().hex}.parquet"
+            ),
+        )
+
+    # the merged part is newer than every part it replaces, so a crash before
+    # the old parts are removed still reads back the same entries
+    def _compact(self, key: PartitionKey, partition_dir: str) -> None:
+        old_parts = part_files(partition_dir)
+        self._write_part(key, partition_dir, self._read_stored_partition(key))
+        for filename in old_parts:
+            os.remove(os.path.join(partition_dir, filename))
+
+
+def part_files(partition_dir: str) -> List[str]:
+    if not os.path.isdir(partition_dir):
+        return []
+    return sorted(
+        filename
+        for filename in os.listdir(partition_dir)
+        if filename.endswith(".parquet")
+    )
+
+
+def combine_batches(batches: List[pd.Series]) -> pd.Series:
+    batches = [batch for batch in batches if len(batch) > 0]
+    if len(batches) == 0:
+        return pd.Series(dtype="object", index=pd.DatetimeIndex([], tz="UTC"))
+    combined = pd.concat(batches)
+    return combined[~combined.index.duplicated(keep="last")].sort_index()
+
+
+def concat_indexes(indexes: List[pd.Index]) -> pd.Index:
+    if len(indexes) == 0:
+        return pd.DatetimeIndex([], tz="UTC")
+    return indexes[0].append(indexes[1:])
@@ -0,0 +1,53 @@
+import json
+from typing import Dict, Iterator, Optional
+from urllib.parse import parse_qsl, urlparse
+
+from polygon import RESTClient
+
+from .rate_limit import RateLimiter, call_with_retry
+
+
+# carries the http response, so rate_limit.error_details reads its status and
+# Retry-After header
+class PolygonResponseError(Exception):
+    def __init__(self, response):
+        super().__init__(
+            f"{response.status}: {response.data.decode('utf-8', 'replace')[:200]}"
+        )
+        self.response = response
+
+
+# one GET through the sdk client's connection pool and auth headers, but
+# without the urllib3 retries the sdk installs on it, which retry 429s on their
+# own and would hide them from call_with_retry
+def polygon_get(
+    client: RESTClient, path: str, params: Optional[Dict[str, str]] = None
+) -> Dict[str, object]:
+    response = client.client.request(
+        "GET",
+        client.BASE + path,
+        fields=params,
+        headers=client.headers,
+        retries=False,
+        timeout=client.timeout,
+    )
+    if response.status != 200:
+        raise PolygonResponseError(response)
+    return json.loads(response.data.decode("utf-8"))
+
+
+# follows next_url page by page, every page takes its own rate limiter token
+def polygon_pages(
+    client: RESTClient,
+    path: str,
+    params: Dict[str, str],
+    rate_limiter: Optional[RateLimiter] = None,
+) -> Iterator[Dict[str, object]]:
+    while True:
+        page = call_with_retry(rate_limiter, lambda: polygon_get(client, path, params))
+        yield page
+        next_url = page.get("next_url")
+        if not next_url:
+            return
+        url = urlparse(next_url)
+        path, params = url.path, dict(parse_qsl(url.query))
@@ -2,7 +2,8 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta
 import logging
 from os.path import exists
-from typing import Dict, List, Optional, Set, Tuple
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
 from alpaca.data import (
     StockBarsRequest,
@@ -10,21 +11,41 @@ from alpaca.data import (
     TimeFrame,
     TimeFrameUnit,
 )
+import numpy as np
 import pandas as pd
-from pandas_market_calendars.calendar_registry import MarketCalendar
 import pytz
 
+from .....exceptions import ResourceError
 from ..configs.download import DownloadConfig
-from .downloader import Downloader
-from .db import DatabaseInterface, DataframeDatabase
+from .checkpoint import Checkpointer, FlushPolicy
+from .downloader import Downloader, Page
+from .build_database import build_database
+from .coverage import to_minutes
+from .db import ColumnarDatabaseInterface, DatabaseInterface
+from .metrics import METRICS
+from .rate_limit import FailureLog, RateLimiter, build_rate_limiter, call_with_retry
+from .response_cache import (
+    ResponseCache,
+    build_response_cache,
+    cached_call,
+    is_historical,
+)
 from .utils import (
     LoadMarketCalendarConfig,
+    LoadSlotGridConfig,
     load_market_calendar,
-    to_datetime_mapping,
+    load_slot_grid,
 )
 
 _logger = logging.getLogger(__name__)
 
+# bars up to this many minutes away from a slot can fill it
+PRICE_TOLERANCE_MINUTES = 4
+# rough size of one 1-minute bar in an Alpaca bars response
+ESTIMATED_BAR_BYTES = 100
+# the most bars one request returns, alpaca's own maximum
+BARS_PER_PAGE = 10_000
+
 
 class PricesDownloader(Downloader):
     def __init__(self, cfg: DownloadConfig):
@@ -34,21 +55,35 @@ class PricesDownloader(Downloader):
 
         self._alpaca_client: Optional[StockHistoricalDataClient] = None
 
+        self.response_cache: Optional[ResponseCache] = build_response_cache(cfg)
+        self.rate_limiter: RateLimiter = build_rate_limiter("alpaca", cfg)
+        self.failures = FailureLog()
+
         self._database: Optional[DatabaseInterface] = None
         if cfg.use_existing_db and exists(cfg.database_filepath):
             _logger.info("loading existing database")
-            self._database = DataframeDatabase()
+            self._database = build_database(cfg)
             self._database.load(cfg.database_filepath)
 
-        self.market_calendar = load_market_calendar(
-            LoadMarketCalendarConfig(
-                start_date=str(
-                    datetime.now() - timedelta(days=round(cfg.years_examined * 365))
-                ),
-                end_date=str(datetime.now() - timedelta(days=1)),
-            ),
+        self._checkpointer = Checkpointer(
+            lambda: self.database.save(self.cfg.database_filepath),
+            FlushPolicy(cfg.flush_every_symbols, cfg.flush_every_seconds),
         )
 
+        with METRICS.timer("calendar_load"):
+            self.market_calendar = load_market_calendar(
+                LoadMarketCalendarConfig(
+                    start_date=str(
+                        datetime.now() - timedelta(days=round(cfg.years_examined * 365))
+                    ),
+                    end_date=str(datetime.now() - timedelta(days=1)),
+                    cache_dir=cfg.calendar_cache_dir,
+                ),
+            )
+        self._slot_grid: Optional[pd.DatetimeIndex] = None
+        self._gap_stats = GapStats()
+        self._gap_stats_lock = threading.Lock()
+
     @property
     def alpaca_client(self) -> StockHistoricalDataClient:
         if self._alpaca_client is None:
@@ -56,14 +91,19 @@ class PricesDownloader(Downloader):
             self._alpaca_client = StockHistoricalDataClient(
                 api_key=self.cfg.alpaca_key_id,
                 secret_key=self.cfg.alpaca_secret_key,
+                url_override=self.cfg.alpaca_url_override,
             )
+            # the sdk retries 429s itself without reading Retry-After, they
+            # have to reach call_with_retry instead. the constructor treats a
+            # retry_attempts of 0 as unset, so it is switched off afterwards
+            self._alpaca_client._retry = 0
         return self._alpaca_client
 
     @property
     def database(self) -> DatabaseInterface:
         if self._database is None:
             _logger.info("loading new database")
-            self._database = DataframeDatabase()
+            self._database = build_database(self.cfg)
         return self._database
 
     def find_missing_dates(self, symbol: str) -> List[datetime.date]:
@@ -72,23 +112,181 @@ class PricesDownloader(Downloader):
             symbol=symbol,
             database=self.database,
             market_calendar=self.market_calendar,
+            slot_grid=self._slot_grid,
+            calendar_cache_dir=self.cfg.calendar_cache_dir,
         )
         cfg.set_defaults()
+        self._slot_grid = cfg.slot_grid
         return get_price_misses(cfg)
 
     def pull_missing_data(
         self, symbol: str, missing_datetimes: List[datetime]
-    ) -> List[Tuple[datetime, object]]:
-        _logger.debug(f"Pulling missing data: {symbol}")
-        return get_prices(
-            GetPricesConfig(
-                symbol,
+    ) -> "MinuteBars":
+        return self.pull_missing_data_batch({symbol: missing_datetimes})[symbol]
+
+    def pull_missing_data_batch(
+        self, symbol_to_missing: Dict[str, List[datetime]]
+    ) -> Dict[str, "MinuteBars"]:
+        symbol_to_gaps = {
+            symbol: self._gap_intervals(missing_datetimes)
+            for symbol, missing_datetimes in symbol_to_missing.items()
+        }
+
+        pulled_data: Dict[str, List[MinuteBars]] = {
+            symbol: [] for symbol in symbol_to_missing
+        }
+        for symbols, (start_datetime, end_datetime) in group_by_gap_intervals(
+            symbol_to_gaps, self.cfg.symbols_per_request
+        ):
+            batch_prices = self._pull_interval(symbols, start_datetime, end_datetime)
+            for symbol, bars in batch_prices.items():
+                pulled_data[symbol].append(bars)
+        # windows of one symbol overlap by their padding
+        return {
+            symbol: unique_minute_bars(concat_minute_bars(bars))
+            for symbol, bars in pulled_data.items()
+        }
+
+    # every gap interval is at most page_slots long and is aligned onto the
+    # slots it covers as soon as it arrives, so only one interval of bars is
+    # held per call
+    def pull_missing_pages(
+        self, symbol_to_missing: Dict[str, List[datetime]]
+    ) -> Iterator[Page]:
+        symbol_to_gaps = {
+            symbol: self._gap_intervals(missing_datetimes)
+            for symbol, missing_datetimes in symbol_to_missing.items()
+        }
+        symbol_to_slots = {
+            symbol: pd.DatetimeIndex(missing_datetimes)
+            for symbol, missing_datetimes in symbol_to_missing.items()
+        }
+
+        # windows start and end later one after another, a symbol's slots in
+        # the overlap with its previous window were already yielded
+        yielded_until: Dict[str, int] = {}
+        for symbols, (start_datetime, end_datetime) in group_by_gap_intervals(
+            symbol_to_gaps, self.cfg.symbols_per_request
+        ):
+            batch_prices = self._pull_interval(symbols, start_datetime, end_datetime)
+            page: Page = {}
+            for symbol in symbols:
+                slots = symbol_to_slots[symbol]
+                first = max(
+                    slots.searchsorted(start_datetime, side="left"),
+                    yielded_until.get(symbol, 0),
+                )
+                last = slots.searchsorted(end_datetime, side="right")
+                yielded_until[symbol] = max(last, first)
+                slots = slots[first:last]
+                aligned_prices = align_bars(
+                    AlignBarsConfig(slots, batch_prices.get(symbol, EMPTY_BARS))
+                )
+                page[symbol] = (slots.to_pydatetime().tolist(), aligned_prices)
+            del batch_prices
+            yield page
+
+    def _pull_interval(
+        self, symbols: List[str], start_datetime: datetime, end_datetime: datetime
+    ) -> Dict[str, "MinuteBars"]:
+        _logger.debug(
+            f"Pulling missing data: {', '.join(symbols)} "
+            f"from {start_datetime} to {end_datetime}"
+        )
+        batch_prices = get_batch_prices(
+            GetBatchPricesConfig(
+                symbols,
                 self.alpaca_client,
-                missing_datetimes[0],
-                missing_datetimes[-1],
+                start_datetime,
+                end_datetime,
+                response_cache=self.response_cache,
+                rate_limiter=self.rate_limiter,
+                failures=self.failures,
             )
         )
+        bars_fetched = sum(len(prices) for prices in batch_prices.values())
+        METRICS.increment("bars_fetched", bars_fetched)
+        with self._gap_stats_lock:
+            self._gap_stats.bars_fetched += bars_fetched
+        return batch_prices
+
+    def _gap_intervals(
+        self, missing_datetimes: List[datetime]
+    ) -> List[Tuple[datetime, datetime]]:
+        positions = self._slot_grid.get_indexer(pd.DatetimeIndex(missing_datetimes))
+        if (positions < 0).any():
+            return self._span_intervals(missing_datetimes)
+
+        runs = split_slot_runs(
+            coalesce_slot_positions(positions, self.cfg.gap_tolerance_slots),
+            self.cfg.page_slots,
+        )
+        with self._gap_stats_lock:
+            self._gap_stats.span_slots += positions.max() - positions.min() + 1
+            self._gap_stats.requested_slots += sum(
+                end - start + 1 for start, end in runs
+            )
+
+        padding = timedelta(minutes=PRICE_TOLERANCE_MINUTES)
+        return [
+            (
+                self._slot_grid[start].to_pydatetime() - padding,
+                self._slot_grid[end].to_pydatetime() + padding,
+            )
+            for start, end in runs
+        ]
 
+    # datetimes off the slot grid cannot be coalesced, their whole span is still
+    # paged by the grid slots it covers so no request exceeds page_slots, and
+    # padded like the coalesced runs so the edge slots find nearby bars
+    def _span_intervals(
+        self, missing_datetimes: List[datetime]
+    ) -> List[Tuple[datetime, datetime]]:
+        first, last = min(missing_datetimes), max(missing_datetimes)
+        if len(self._slot_grid) == 0:
+            return [(first, last)]
+        start, end = self._slot_grid.searchsorted(pd.DatetimeIndex([first, last]))
+        runs = split_slot_runs(
+            [
+                (
+                    min(start, len(self._slot_grid) - 1),
+                    min(end, len(self._slot_grid) - 1),
+                )
+            ],
+            self.cfg.page_slots,
+        )
+        # each page ends where the next one starts so datetimes between the
+        # grid slots of two pages are still covered
+        bounds = [self._slot_grid[start].to_pydatetime() for start, _ in runs]
+        bounds.append(self._slot_grid[runs[-1][1]].to_pydatetime())
+        intervals = list(zip(bounds[:-1], bounds[1:]))
+
+        padding = timedelta(minutes=PRICE_TOLERANCE_MINUTES)
+        intervals[0] = (min(first, intervals[0][0]) - padding, intervals[0][1])
+        intervals[-1] = (intervals[-1][0], max(last, intervals[-1][1]) + padding)
+        return intervals
+
+    def log_summary(self) -> None:
+        self.failures.log_summary()
+        stats = self._gap_stats
+        if stats.span_slots == 0:
+            return
+        minutes_per_slot = 60 / GetDatabaseMissesConfig.record_frequency_minutes
+        bars_saved = round(
+            (stats.span_slots - stats.requested_slots) * minutes_per_slot
+        )
+        _logger.info(
+            f"fetched {stats.bars_fetched} bars for {stats.requested_slots} slots "
+            f"instead of spanning {stats.span_slots} slots, saving an estimated "
+            f"~{bars_saved} bars (~{bars_saved * ESTIMATED_BAR_BYTES / 1e6:.1f} MB "
+            f"estimated at {ESTIMATED_BAR_BYTES} bytes per bar)"
+        )
+
+    def batch_size(self) -> int:
+        return self.cfg.symbols_per_request
+
+    # pulled_data is either the raw bars or, for pages, the prices already
+    # aligned onto missing_datetimes
     def save_to_database(
         self,
         symbol: str,
@@ -98,25 +296,30 @@ class PricesDownloader(Downloader):
         if pulled_data is None or len(missing_datetimes) == 0 or len(pulled_data) == 0:
             return
 
-        dt_to_price = to_datetime_mapping(pulled_data)
+        if isinstance(pulled_data, pd.Series):
+            aligned_prices = pulled_data
+        else:
+            aligned_prices = align_bars(
+                AlignBarsConfig(pd.DatetimeIndex(missing_datetimes), pulled_data)
+            )
 
-        cfg = UpdateDatabaseConfig(
-            symbol,
-            self.database,
-            missing_datetimes,
-            dt_to_price,
-            self.cfg.database_entry_type,
+        update_count = fill_new_entries(
+            UpdateDatabaseConfig(
+                symbol,
+                self.database,
+                missing_datetimes,
+                aligned_prices,
+                self.cfg.database_entry_type,
+            )
         )
-        update_count = fill_new_entries(cfg)
-        new_rows = generate_new_rows(cfg)
+        METRICS.increment("entries_written", update_count)
 
-        has_new_rows = len(new_rows) > 0
-        if has_new_rows > 0:
-            self.database.add_rows(symbol, new_rows)
+        if update_count > 0:
+            _logger.debug(f"Marking database for saving: {symbol}")
+            self._checkpointer.mark_dirty(symbol)
 
-        if update_count > 0 or has_new_rows:
-            _logger.debug(f"Saving to database: {symbol}")
-            self.database.save(self.cfg.database_filepath)
+    def flush(self) -> None:
+        self._checkpointer.flush()
 
     def symbols(self) -> List[str]:
         return self.cfg.symbols
@@ -178,7 +381,7 @@ def get_ignored_sp500_symbols():
 class GetDatabaseMissesConfig:
     symbol: str
     database: DatabaseInterface
-    market_calendar: MarketCalendar
+    market_calendar: pd.Series
     ignored_date_strs: Set[str] = None
     ignored_symbols: Set[str] = None
     evaluation_hours: int = 6.5
@@ -186,32 +389,38 @@ class GetDatabaseMissesConfig:
     start_evaluation_time_str: str = "09:30:00"
     timezone: pytz.timezone = pytz.timezone("US/Eastern")
     years_examined: int = 5
+    slot_grid: pd.DatetimeIndex = None
+    calendar_cache_dir: str = None
 
     def set_defaults(self):
         self.ignored_date_strs = get_ignored_sp500_equity_dates()
         self.ignored_symbols = get_ignored_sp500_symbols()
+        if self.slot_grid is None:
+            with METRICS.timer("slot_grid_load"):
+                self.slot_grid = load_slot_grid(self.to_load_slot_grid_config())
+
+    def to_load_slot_grid_config(self) -> LoadSlotGridConfig:
+        return LoadSlotGridConfig(
+            self.market_calendar,
+            self.evaluation_hours,
+            self.record_frequency_minutes,
+            self.start_evaluation_time_str,
+            self.timezone,
+            self.calendar_cache_dir,
+        )
 
 
 def get_price_misses(cfg: GetDatabaseMissesConfig) -> List[datetime]:
-    missing_dt_lst = []
+    if cfg.symbol in cfg.ignored_symbols:
+        return []
 
-    for opening_dt in cfg.market_calendar:
-        base_dt = cfg.timezone.localize(
-            datetime.strptime(
-                f"{opening_dt.date()} {cfg.start_evaluation_time_str}",
-                "%Y-%m-%d %H:%M:%S",
-            )
-        )
-        for i in range(round(cfg.evaluation_hours * cfg.record_frequency_minutes) + 1):
-            loop_dt = base_dt + timedelta(minutes=i * 60 / cfg.record_frequency_minutes)
-            if (
-                cfg.symbol not in cfg.ignored_symbols
-                and str(loop_dt.date()) not in cfg.ignored_date_strs
-                and not cfg.database.contains(cfg.symbol, loop_dt)
-            ):
-                missing_dt_lst.append(loop_dt)
+    ignored_dates = pd.DatetimeIndex(list(cfg.ignored_date_strs)).tz_localize(
+        cfg.timezone
+    )
+    slot_grid = cfg.slot_grid[~cfg.slot_grid.normalize().isin(ignored_dates)]
+    METRICS.increment("slots_checked", len(slot_grid))
 
-    return missing_dt_lst
+    return cfg.database.missing(cfg.symbol, slot_grid).to_pydatetime().tolist()
 
 
 @dataclass
@@ -222,80 +431,304 @@ class GetPricesConfig:
     end_datetime: datetime
     time_frame_amount: int = 1
     time_frame_unit: TimeFrameUnit = TimeFrameUnit("Min")
+    response_cache: ResponseCache = None
+    rate_limiter: RateLimiter = None
+    failures: FailureLog = None
+
+
+def get_prices(cfg: GetPricesConfig) -> Optional["MinuteBars"]:
+    return get_batch_prices(
+        GetBatchPricesConfig(
+            [cfg.symbol],
+            cfg.stock_historical_data_client,
+            cfg.start_datetime,
+            cfg.end_datetime,
+            cfg.time_frame_amount,
+            cfg.time_frame_unit,
+            cfg.response_cache,
+            cfg.rate_limiter,
+            cfg.failures,
+        )
+    ).get(cfg.symbol)
 
 
-def get_prices(cfg: GetPricesConfig) -> List[Tuple[datetime, object]]:
+@dataclass
+class GapStats:
+    span_slots: int = 0
+    requested_slots: int = 0
+    bars_fetched: int = 0
+
+
+# splits sorted slot positions into (first, last) runs, runs separated by at
+# most tolerance_slots present slots are merged into one
+def coalesce_slot_positions(
+    positions: np.ndarray, tolerance_slots: int
+) -> List[Tuple[int, int]]:
+    positions = np.sort(positions)
+    breaks = np.flatnonzero(np.diff(positions) > tolerance_slots + 1)
+    starts = positions[np.concatenate([[0], breaks + 1])]
+    ends = positions[np.concatenate([breaks, [len(positions) - 1]])]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+# splits (first, last) runs into consecutive runs of at most max_slots slots
+def split_slot_runs(
+    runs: List[Tuple[int, int]], max_slots: int
+) -> List[Tuple[int, int]]:
+    return [
+        (page_start, min(page_start + max_slots - 1, end))
+        for start, end in runs
+        for page_start in range(start, end + 1, max_slots)
+    ]
+
+
+# gap intervals of different symbols that overlap or cover each other are
+# merged into one window requested for all of them, as long as the window stays
+# within the longest single interval so pages stay bounded. every symbol's
+# interval lies inside a window requested for that symbol
+def group_by_gap_intervals(
+    symbol_to_gaps: Dict[str, List[Tuple[datetime, datetime]]], max_group_size: int
+) -> List[Tuple[List[str], Tuple[datetime, datetime]]]:
+    intervals = sorted(
+        (start, end, symbol)
+        for symbol, gaps in symbol_to_gaps.items()
+        for start, end in gaps
+    )
+    if len(intervals) == 0:
+        return []
+    max_span = max(end - start for start, end, _ in intervals)
+
+    windows: List[Tuple[datetime, datetime, List[str]]] = []
+    for start, end, symbol in intervals:
+        if len(windows) > 0:
+            window_start, window_end, symbols = windows[-1]
+            merged_end = max(window_end, end)
+            if start <= window_end and merged_end - window_start <= max_span:
+                if symbol not in symbols:
+                    symbols.append(symbol)
+                windows[-1] = (window_start, merged_end, symbols)
+                continue
+        windows.append((start, end, [symbol]))
+
+    return [
+        (symbols[i : i + max_group_size], (start, end))
+        for start, end, symbols in windows
+        for i in range(0, len(symbols), max_group_size)
+    ]
+
+
+@dataclass
+class GetBatchPricesConfig:
+    symbols: List[str]
+    stock_historical_data_client: StockHistoricalDataClient
+    start_datetime: datetime
+    end_datetime: datetime
+    time_frame_amount: int = 1
+    time_frame_unit: TimeFrameUnit = TimeFrameUnit("Min")
+    response_cache: ResponseCache = None
+    rate_limiter: RateLimiter = None
+    failures: FailureLog = None
+
+
+# one symbol's bars as parallel arrays of utc epoch minutes and prices
+@dataclass
+class MinuteBars:
+    minutes: np.ndarray
+    prices: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.minutes)
+
+
+EMPTY_BARS = MinuteBars(np.zeros(0, dtype=np.int64), np.zeros(0))
+
+
+def concat_minute_bars(bars: List[MinuteBars]) -> MinuteBars:
+    if len(bars) == 0:
+        return EMPTY_BARS
+    return MinuteBars(
+        np.concatenate([b.minutes for b in bars]),
+        np.concatenate([b.prices for b in bars]),
+    )
+
+
+def unique_minute_bars(bars: MinuteBars) -> MinuteBars:
+    minutes, positions = np.unique(bars.minutes, return_index=True)
+    return MinuteBars(minutes, bars.prices[positions])
+
+
+# pages are requested one at a time through their next_page_token and reduced
+# to each symbol's minutes and closes as they arrive, so memory is bounded by
+# one page of bars instead of a model object per bar of the whole request
+def get_batch_prices(cfg: GetBatchPricesConfig) -> Dict[str, MinuteBars]:
+    start, end = cfg.start_datetime, cfg.end_datetime
+    if cfg.response_cache is not None:
+        start, end = cache_window(start, end)
+    request = StockBarsRequest(
+        symbol_or_symbols=cfg.symbols,
+        start=start,
+        end=end,
+        timeframe=TimeFrame(
+            amount=cfg.time_frame_amount,
+            unit=cfg.time_frame_unit,
+        ),
+    )
     try:
-        return [
-            (entry["timestamp"], entry)
-            for entry in cfg.stock_historical_data_client.get_stock_bars(
-                StockBarsRequest(
-                    symbol_or_symbols=cfg.symbol,
-                    start=cfg.start_datetime,
-                    end=cfg.end_datetime,
-                    timeframe=TimeFrame(
-                        amount=cfg.time_frame_amount,
-                        unit=cfg.time_frame_unit,
-                    ),
+        payload = cached_call(
+            cfg.response_cache,
+            "alpaca.stock_bars",
+            {
+                "symbols": sorted(cfg.symbols),
+                "start": start,
+                "end": end,
+                "timeframe": f"{cfg.time_frame_amount}{cfg.time_frame_unit.value}",
+            },
+            lambda: bars_to_payload(get_bar_pages(cfg, request.to_request_fields())),
+            historical=is_historical(end),
+        )
+        symbol_to_bars = bars_from_payload(payload)
+    except (AttributeError, ResourceError) as e:
+        _logger.warning(f"get_batch_prices for {', '.join(cfg.symbols)} failed: {e}")
+        if cfg.failures is not None:
+            for symbol in cfg.symbols:
+                cfg.failures.record(symbol, e)
+        return {}
+
+    return {
+        symbol: symbol_to_bars[symbol]
+        for symbol in cfg.symbols
+        if symbol in symbol_to_bars
+    }
+
+
+# gap intervals are widened to whole utc days before they are cached, so a
+# later run whose gaps moved within the same days reuses the response instead
+# of missing on the exact bounds. windows reaching past now keep their end
+def cache_window(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    start, end = to_utc_timestamp(start), to_utc_timestamp(end)
+    window_end = end.floor("D") + pd.Timedelta(days=1)
+    if window_end > pd.Timestamp.now(tz="UTC"):
+        window_end = end
+    return start.floor("D").to_pydatetime(), window_end.to_pydatetime()
+
+
+def to_utc_timestamp(dt: datetime) -> pd.Timestamp:
+    timestamp = pd.Timestamp(dt)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+# cached responses are plain json, each symbol's bars as [minutes, prices]
+def bars_to_payload(symbol_to_bars: Dict[str, MinuteBars]) -> Dict[str, list]:
+    return {
+        symbol: [bars.minutes.tolist(), bars.prices.tolist()]
+        for symbol, bars in symbol_to_bars.items()
+    }
+
+
+def bars_from_payload(payload: Dict[str, list]) -> Dict[str, MinuteBars]:
+    return {
+        symbol: MinuteBars(
+            np.array(minutes, dtype=np.int64), np.array(prices, dtype=float)
+        )
+        for symbol, (minutes, prices) in payload.items()
+    }
+
+
+def get_bar_pages(
+    cfg: GetBatchPricesConfig, params: Dict[str, object]
+) -> Dict[str, MinuteBars]:
+    symbol_to_pages: Dict[str, List[MinuteBars]] = {}
+    page_token = None
+    while True:
+        page_params = {**params, "limit": BARS_PER_PAGE}
+        if page_token is not None:
+            page_params["page_token"] = page_token
+        response = call_with_retry(
+            cfg.rate_limiter,
+            lambda: cfg.stock_historical_data_client.get("/stocks/bars", page_params),
+        )
+        for symbol, bars in (response.get("bars") or {}).items():
+            symbol_to_pages.setdefault(symbol, []).append(
+                MinuteBars(
+                    to_minutes([bar["t"] for bar in bars]),
+                    np.array([bar["c"] for bar in bars], dtype=float),
                 )
-            ).dict()[cfg.symbol]
-        ]
-    except AttributeError as e:
-        _logger.warning(f"get_prices for {cfg.symbol} was not successful", e)
-    return None
+            )
+        page_token = response.get("next_page_token")
+        if page_token is None:
+            break
+    return {
+        symbol: concat_minute_bars(pages) for symbol, pages in symbol_to_pages.items()
+    }
+
+
+# offsets in minutes tried for every slot, the first one with a bar wins
+PRICE_SEARCH_OFFSETS = [0, 1, -1, 2, -2, 3, -3, 4, -4]
 
 
 @dataclass
-class ExtractPriceConfig:
-    database: DatabaseInterface
-    target_datetime: datetime
-    datetime_to_data: Dict[datetime, object]
+class AlignBarsConfig:
+    slots: pd.DatetimeIndex
+    bars: Union[MinuteBars, List[Tuple[datetime, object]]]
+    price_field: str = "close"
+
+
+# bars are keyed by their minute, each pass of the loop resolves every still
+# empty slot against one offset at once instead of probing a dict per slot
+def align_bars(cfg: AlignBarsConfig) -> pd.Series:
+    prices = np.full(len(cfg.slots), np.nan)
+    if len(cfg.bars) == 0 or len(cfg.slots) == 0:
+        return pd.Series(prices, index=cfg.slots)
+
+    if isinstance(cfg.bars, MinuteBars):
+        bar_minutes, bar_prices = cfg.bars.minutes, cfg.bars.prices
+    else:
+        bar_minutes = to_minutes([dt for dt, _ in cfg.bars])
+        bar_prices = np.array(
+            [entry[cfg.price_field] for _, entry in cfg.bars], dtype=float
+        )
+    bar_minutes, first_positions = np.unique(bar_minutes, return_index=True)
+    bar_prices = bar_prices[first_positions]
+    if len(bar_minutes) < len(cfg.bars):
+        _logger.warning(
+            f"ignoring {len(cfg.bars) - len(bar_minutes)} bars with a duplicate minute"
+        )
 
+    slot_minutes = to_minutes(cfg.slots)
+    unfilled = np.arange(len(cfg.slots))
+    for offset in PRICE_SEARCH_OFFSETS:
+        targets = slot_minutes[unfilled] + offset
+        positions = np.searchsorted(bar_minutes, targets).clip(max=len(bar_minutes) - 1)
+        found = bar_minutes[positions] == targets
+        prices[unfilled[found]] = bar_prices[positions[found]]
+        unfilled = unfilled[~found]
+        if len(unfilled) == 0:
+            break
 
-def extract_price(cfg: ExtractPriceConfig) -> float:
-    price = 0
-    for i in [0, 1, -1, 2, -2, 3, -3, 4, -4]:
-        new_dt = cfg.target_datetime + timedelta(minutes=i)
-        key = datetime_key(new_dt)
-        if key in cfg.datetime_to_data:
-            return cfg.datetime_to_data[key]["close"]
-    return None
+    return pd.Series(prices, index=cfg.slots)
 
 
 @dataclass
 class UpdateDatabaseConfig:
     symbol: str
-    database: DatabaseInterface
+    database: ColumnarDatabaseInterface
     missing_datetimes: List[datetime]
-    datetime_to_data: Dict[datetime, object]
+    aligned_prices: pd.Series
     entry_type: str
 
-    def to_extract_price_config(self, dt: datetime) -> ExtractPriceConfig:
-        return ExtractPriceConfig(self.database, dt, self.datetime_to_data)
-
 
+# one batch covers both the slots already in the index and the new ones, the
+# database extends its index where needed
 def fill_new_entries(
     cfg: UpdateDatabaseConfig,
 ) -> int:
-    update_count = 0
-    for idx, dt in enumerate(cfg.missing_datetimes):
-        if cfg.database.contains_datetime(dt):
-            if not cfg.database.contains_symbol(cfg.symbol):
-                cfg.database.add_symbol(cfg.symbol, cfg.entry_type)
-
-            price = extract_price(cfg.to_extract_price_config(dt))
-            if price is not None:
-                cfg.database.add_entry(cfg.symbol, dt, price)
-                update_count += 1
-    return update_count
-
-
-# uses UpdateDatabaseConfig but actually does not need all its fields
-def generate_new_rows(cfg: UpdateDatabaseConfig) -> List[Tuple[datetime, object]]:
-    new_rows = []
-    for idx, dt in enumerate(cfg.missing_datetimes):
-        if not cfg.database.contains_datetime(dt):
-            price = extract_price(cfg.to_extract_price_config(dt))
-            if price is not None:
-                new_rows += [(dt, price)]
-    return new_rows
+    prices = cfg.aligned_prices.dropna()
+    if len(prices) == 0:
+        return 0
+
+    if not cfg.database.contains_symbol(cfg.symbol):
+        cfg.database.add_symbol(cfg.symbol, cfg.entry_type)
+    cfg.database.add_batch(cfg.symbol, prices.index, prices.values)
+    return len(prices)
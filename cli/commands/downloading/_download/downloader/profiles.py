@@ -6,12 +6,23 @@ from typing import Dict, List, Optional, Set, Tuple
 
 from polygon import RESTClient
 import pandas as pd
-from pandas_market_calendars.calendar_registry import MarketCalendar
 import pytz
 
+from .....exceptions import ResourceError
 from ..configs.download import DownloadConfig
+from .checkpoint import Checkpointer, FlushPolicy
 from .downloader import Downloader
-from .db import DatabaseInterface, DataframeDatabase
+from .build_database import build_database
+from .db import DatabaseInterface
+from .metrics import METRICS
+from .polygon_api import polygon_get
+from .rate_limit import FailureLog, RateLimiter, build_rate_limiter, call_with_retry
+from .response_cache import (
+    ResponseCache,
+    build_response_cache,
+    cached_call,
+    is_historical,
+)
 from .utils import (
     datetime_key,
     load_quarterly_calender,
@@ -29,26 +40,40 @@ class ProfilesDownloader(Downloader):
 
         self._polygon_client: Optional[RESTClient] = None
 
+        self.response_cache: Optional[ResponseCache] = build_response_cache(cfg)
+        self.rate_limiter: RateLimiter = build_rate_limiter("polygon", cfg)
+        self.failures = FailureLog()
+
         self._database: Optional[DatabaseInterface] = None
         if cfg.use_existing_db and exists(cfg.database_filepath):
             _logger.info("loading existing database")
-            self._database = DataframeDatabase()
+            self._database = build_database(cfg)
             self._database.load(cfg.database_filepath)
 
+        self._checkpointer = Checkpointer(
+            lambda: self.database.save(self.cfg.database_filepath),
+            FlushPolicy(cfg.flush_every_symbols, cfg.flush_every_seconds),
+        )
+
         self.target_datetimes = load_quarterly_calender(cfg.years_examined)
 
     @property
     def polygon_client(self) -> RESTClient:
         if self._polygon_client is None:
             _logger.info("loading polygon client")
-            self._polygon_client = RESTClient(api_key=self.cfg.polygon_api_key)
+            base_url = {}
+            if self.cfg.polygon_base_url is not None:
+                base_url["base"] = self.cfg.polygon_base_url
+            self._polygon_client = RESTClient(
+                api_key=self.cfg.polygon_api_key, **base_url
+            )
         return self._polygon_client
 
     @property
     def database(self) -> DatabaseInterface:
         if self._database is None:
             _logger.info("loading new database")
-            self._database = DataframeDatabase()
+            self._database = build_database(self.cfg)
         return self._database
 
     def find_missing_dates(self, symbol: str) -> List[datetime.date]:
@@ -70,6 +95,9 @@ class ProfilesDownloader(Downloader):
                 symbol,
                 self.polygon_client,
                 missing_datetimes,
+                self.response_cache,
+                self.rate_limiter,
+                self.failures,
             )
         )
 
@@ -84,23 +112,24 @@ class ProfilesDownloader(Downloader):
 
         dt_to_profile = to_datetime_mapping(pulled_data)
 
-        cfg = UpdateDatabaseConfig(
-            symbol,
-            self.database,
-            missing_datetimes,
-            dt_to_profile,
-            self.cfg.database_entry_type,
+        new_rows = generate_new_rows(
+            UpdateDatabaseConfig(
+                symbol, self.database, missing_datetimes, dt_to_profile
+            )
         )
-        update_count = fill_new_entries(cfg)
-        new_rows = generate_new_rows(cfg)
+        if len(new_rows) == 0:
+            return
+
+        self.database.add_rows(symbol, new_rows)
+        METRICS.increment("entries_written", len(new_rows))
+        _logger.debug(f"Marking database for saving: {symbol}")
+        self._checkpointer.mark_dirty(symbol)
 
-        has_new_rows = len(new_rows) > 0
-        if has_new_rows > 0:
-            self.database.add_rows(symbol, new_rows)
+    def flush(self) -> None:
+        self._checkpointer.flush()
 
-        if update_count > 0 or has_new_rows:
-            _logger.debug(f"Saving to database: {symbol}")
-            self.database.save(self.cfg.database_filepath)
+    def log_summary(self) -> None:
+        self.failures.log_summary()
 
     def symbols(self) -> List[str]:
         return self.cfg.symbols
@@ -174,6 +203,7 @@ class GetDatabaseMissesConfig:
 
 def get_profile_misses(cfg: GetDatabaseMissesConfig) -> List[datetime]:
     missing_dt_lst = []
+    METRICS.increment("slots_checked", len(cfg.datetimes))
 
     for dt in cfg.datetimes:
         if not cfg.database.contains(cfg.symbol, dt):
@@ -187,19 +217,45 @@ class GetProfilesConfig:
     symbol: str
     polygon_client: RESTClient
     datetimes: List[datetime]
+    response_cache: ResponseCache = None
+    rate_limiter: RateLimiter = None
+    failures: FailureLog = None
 
 
 def get_profiles(cfg: GetProfilesConfig) -> List[Tuple[datetime, object]]:
     profiles: List[Tuple[datetime, object]] = []
     for dt in cfg.datetimes:
-        val = cfg.polygon_client.get_ticker_details(
-            ticker=cfg.symbol, date=str(dt.date())
-        )
+        try:
+            val = cached_call(
+                cfg.response_cache,
+                "polygon.ticker_details",
+                {"ticker": cfg.symbol, "date": str(dt.date())},
+                lambda: call_with_retry(
+                    cfg.rate_limiter,
+                    lambda: polygon_get(
+                        cfg.polygon_client,
+                        f"/v3/reference/tickers/{cfg.symbol}",
+                        {"date": str(dt.date())},
+                    ).get("results"),
+                ),
+                historical=is_historical(dt),
+            )
+        except ResourceError as e:
+            _logger.warning(f"Skipping profile for {dt} {cfg.symbol}: {e}")
+            if cfg.failures is not None:
+                cfg.failures.record(cfg.symbol, e)
+            continue
         if val is None:
             _logger.warn(f"None when pulling profile for {dt} {cfg.symbol}")
             continue
         profiles.append(
-            (dt, {"total_employees": val.total_employees, "market_cap": val.market_cap})
+            (
+                dt,
+                {
+                    "total_employees": val.get("total_employees"),
+                    "market_cap": val.get("market_cap"),
+                },
+            )
         )
     return profiles
 
@@ -217,34 +273,17 @@ class UpdateDatabaseConfig:
     database: DatabaseInterface
     missing_datetimes: List[datetime]
     datetime_to_data: Dict[datetime, object]
-    entry_type: str
 
     def to_extract_price_config(self, dt: datetime) -> ExtractPriceConfig:
         return ExtractPriceConfig(self.database, dt, self.datetime_to_data)
 
 
-def fill_new_entries(
-    cfg: UpdateDatabaseConfig,
-) -> int:
-    update_count = 0
-    for idx, dt in enumerate(cfg.missing_datetimes):
-        if cfg.database.contains_datetime(dt):
-            if not cfg.database.contains_symbol(cfg.symbol):
-                cfg.database.add_symbol(cfg.symbol, cfg.entry_type)
-
-            profile = cfg.datetime_to_data[datetime_key(dt)]
-            if profile is not None:
-                cfg.database.add_entry(cfg.symbol, dt, profile)
-                update_count += 1
-    return update_count
-
-
-# uses UpdateDatabaseConfig but actually does not need all its fields
+# datetimes the pull skipped, e.g. after a failed request, have no entry in
+# datetime_to_data and stay missing until the next run
 def generate_new_rows(cfg: UpdateDatabaseConfig) -> List[Tuple[datetime, object]]:
     new_rows = []
-    for idx, dt in enumerate(cfg.missing_datetimes):
-        if not cfg.database.contains_datetime(dt):
-            profile = cfg.datetime_to_data[datetime_key(dt)]
-            if profile is not None:
-                new_rows += [(dt, profile)]
+    for dt in cfg.missing_datetimes:
+        profile = cfg.datetime_to_data.get(datetime_key(dt))
+        if profile is not None:
+            new_rows.append((dt, profile))
     return new_rows
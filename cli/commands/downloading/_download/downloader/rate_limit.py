@@ -0,0 +1,214 @@
+from dataclasses import dataclass
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .....exceptions import ResourceError
+from ..configs.download import DownloadConfig
+from .metrics import METRICS
+
+_logger = logging.getLogger(__name__)
+
+RATE_LIMITED_STATUS = 429
+TRANSIENT_STATUSES = {RATE_LIMITED_STATUS, 500, 502, 503, 504}
+# after a 429 the rate is multiplied by this, every success adds this fraction
+# of the configured rate back until the configured rate is reached again
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_FRACTION = 0.05
+MIN_RATE_FRACTION = 0.05
+# rounding can leave a refilled bucket a hair below one token, which would
+# otherwise spin on sleeps too short to change the clock
+TOKEN_EPSILON = 1e-9
+
+
+@dataclass
+class RateLimitConfig:
+    requests_per_minute: float
+    max_retries: int = 5
+    base_backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 60.0
+
+
+# a token bucket refilled at an adaptive rate, every thread calling the same
+# provider takes its tokens from the same bucket
+class RateLimiter:
+    def __init__(self, provider: str, cfg: RateLimitConfig):
+        self.provider = provider
+        self.cfg = cfg
+        self.max_rate = cfg.requests_per_minute / 60
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if now < self._blocked_until:
+                    wait_seconds = self._blocked_until - now
+                elif self._tokens >= 1 - TOKEN_EPSILON:
+                    self._tokens = max(0.0, self._tokens - 1)
+                    return
+                else:
+                    wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(
+                self.max_rate, self.rate + self.max_rate * RATE_INCREASE_FRACTION
+            )
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        with self._lock:
+            self.rate = max(
+                self.max_rate * MIN_RATE_FRACTION, self.rate * RATE_DECREASE_FACTOR
+            )
+            self._tokens = 0.0
+            if retry_after is not None:
+                self._blocked_until = max(
+                    self._blocked_until, time.monotonic() + retry_after
+                )
+        _logger.warning(
+            f"{self.provider} rate limited, slowing to "
+            f"{self.rate * 60:.1f} requests per minute"
+        )
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+# one limiter per provider and process, the first config asking for it sets
+# its quota
+def get_rate_limiter(provider: str, cfg: RateLimitConfig) -> RateLimiter:
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = RateLimiter(provider, cfg)
+        return _rate_limiters[provider]
+
+
+def build_rate_limiter(provider: str, cfg: DownloadConfig) -> RateLimiter:
+    requests_per_minute = {
+        "alpaca": cfg.alpaca_requests_per_minute,
+        "polygon": cfg.polygon_requests_per_minute,
+    }[provider]
+    return get_rate_limiter(
+        provider,
+        RateLimitConfig(requests_per_minute, max_retries=cfg.max_retries),
+    )
+
+
+# retries rate limited and transient failures with full jitter exponential
+# backoff, anything else or running out of retries raises a ResourceError
+def call_with_retry(rate_limiter: Optional[RateLimiter], fetch: Callable[[], object]):
+    if rate_limiter is None:
+        METRICS.increment("api_calls")
+        return fetch()
+
+    cfg = rate_limiter.cfg
+    for attempt in range(cfg.max_retries + 1):
+        with METRICS.timer("rate_limit_wait"):
+            rate_limiter.acquire()
+        METRICS.increment("api_calls")
+        try:
+            response = fetch()
+        except Exception as e:
+            status, retry_after = error_details(e)
+            if not is_transient(e, status) or attempt == cfg.max_retries:
+                raise ResourceError(
+                    f"{rate_limiter.provider} request failed after {attempt + 1} "
+                    f"attempts: {type(e).__name__}: {e}"
+                ) from e
+
+            METRICS.increment("api_retries")
+            if status == RATE_LIMITED_STATUS:
+                METRICS.increment("api_rate_limited")
+                rate_limiter.on_rate_limited(retry_after)
+            wait_seconds = max(
+                retry_after or 0.0,
+                backoff_seconds(
+                    attempt, cfg.base_backoff_seconds, cfg.max_backoff_seconds
+                ),
+            )
+            _logger.debug(
+                f"{rate_limiter.provider} request failed ({type(e).__name__}: {e}), "
+                f"retrying in {wait_seconds:.1f}s"
+            )
+            time.sleep(wait_seconds)
+            continue
+
+        rate_limiter.on_success()
+        return response
+
+
+def backoff_seconds(attempt: int, base_seconds: float, max_seconds: float) -> float:
+    return random.uniform(0, min(max_seconds, base_seconds * 2**attempt))
+
+
+# the sdks raise different errors, the status and Retry-After header are read
+# from whichever of them carries a response
+def error_details(error: Exception) -> Tuple[Optional[int], Optional[float]]:
+    response = None
+    for holder in (error, getattr(error, "_http_error", None)):
+        response = getattr(holder, "response", None)
+        if response is not None:
+            break
+
+    status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    if status is None and "429" in str(error):
+        status = RATE_LIMITED_STATUS
+
+    retry_after = None
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            retry_after = float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = None
+    return status, retry_after
+
+
+def is_transient(error: Exception, status: Optional[int]) -> bool:
+    if status is not None:
+        return status in TRANSIENT_STATUSES
+    return isinstance(error, (OSError, TimeoutError)) or type(error).__name__ in {
+        "MaxRetryError",
+        "ProtocolError",
+        "ReadTimeoutError",
+    }
+
+
+# symbols whose requests failed, reported at the end of a run instead of
+# leaving silent holes for the next run to find
+class FailureLog:
+    def __init__(self):
+        self._failures: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def record(self, symbol: str, error: Exception) -> None:
+        METRICS.increment("failed_requests")
+        with self._lock:
+            self._failures.append((symbol, str(error)))
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return sorted({symbol for symbol, _ in self._failures})
+
+    def log_summary(self) -> None:
+        symbols = self.symbols()
+        if len(symbols) == 0:
+            return
+        _logger.error(
+            f"{len(self._failures)} requests failed for {len(symbols)} symbols, "
+            f"their data is missing until the next run: {', '.join(symbols)}"
+        )
@@ -0,0 +1,116 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .db import DatabaseInterface, save_parquet, to_utc_index
+
+
+# stores dict entries in long form, one row per (symbol, datetime) and one
+# natively typed column per entry field, e.g. float64 market caps that can be
+# filtered with a vectorized predicate on frame(). records are sparse, e.g.
+# quarterly, so membership is kept as the utc nanoseconds of each symbol's
+# records rather than a bitmap over every minute
+class RecordDatabase(DatabaseInterface):
+    def __init__(self, entry_fields: Dict[str, str]):
+        self.entry_fields = entry_fields
+        self._df = self._empty_frame()
+        self._pending: List[Dict[str, object]] = []
+        self._record_times: Dict[str, Set[int]] = {}
+
+    def add_entry(self, symbol: str, dt: datetime, entry: object) -> None:
+        if entry is None:
+            return
+        self.add_batch(symbol, [dt], [entry])
+
+    def add_rows(self, symbol: str, new_rows: List[Tuple[datetime, object]]) -> None:
+        if len(new_rows) == 0:
+            return
+        dtimes, entries = zip(*new_rows)
+        self.add_batch(symbol, dtimes, entries)
+
+    def add_batch(
+        self, symbol: str, dtimes: Sequence[datetime], entries: Sequence[object]
+    ) -> None:
+        added = []
+        for dt, entry in zip(dtimes, entries):
+            if entry is None:
+                continue
+            self._pending.append(self._to_record(symbol, dt, entry))
+            added.append(dt)
+        self._add_record_times(symbol, added)
+
+    def contains(self, symbol: str, dtime: datetime) -> bool:
+        record_times = self._record_times.get(symbol)
+        if record_times is None:
+            return False
+        return int(to_utc_index([dtime]).asi8[0]) in record_times
+
+    def contains_symbol(self, symbol: str) -> bool:
+        return symbol in self._record_times
+
+    def missing(self, symbol: str, dtimes: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        record_times = self._record_times.get(symbol)
+        if record_times is None or len(dtimes) == 0:
+            return dtimes
+        stored = np.fromiter(record_times, dtype=np.int64, count=len(record_times))
+        return dtimes[~np.isin(to_utc_index(dtimes).asi8, stored)]
+
+    def frame(self) -> pd.DataFrame:
+        if len(self._pending) > 0:
+            pending = self._typed(pd.DataFrame.from_records(self._pending))
+            self._df = pd.concat([self._df, pending], ignore_index=True)
+            self._df = (
+                self._df.drop_duplicates(["symbol", "datetime"], keep="last")
+                .sort_values(["symbol", "datetime"])
+                .reset_index(drop=True)
+            )
+            self._pending = []
+        return self._df
+
+    def load(self, filepath: str) -> None:
+        df = pd.read_parquet(filepath)
+        if "symbol" not in df.columns:
+            df = from_wide_frame(df)
+        self._df = self._typed(df)
+        self._pending = []
+
+        self._record_times = {}
+        for symbol, dtimes in self._df.groupby("symbol")["datetime"]:
+            self._add_record_times(symbol, dtimes)
+
+    def save(self, filepath: str) -> None:
+        save_parquet(self.frame(), filepath)
+
+    def _add_record_times(self, symbol: str, dtimes: Iterable[datetime]) -> None:
+        utc_values = to_utc_index(list(dtimes)).asi8
+        if len(utc_values) > 0:
+            self._record_times.setdefault(symbol, set()).update(utc_values.tolist())
+
+    def _to_record(self, symbol: str, dt: datetime, entry: object) -> Dict[str, object]:
+        record = {"symbol": symbol, "datetime": dt}
+        for field in self.entry_fields:
+            record[field] = entry.get(field)
+        return record
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.reindex(columns=["symbol", "datetime", *self.entry_fields])
+        df["symbol"] = df["symbol"].astype("string")
+        df["datetime"] = pd.to_datetime(df["datetime"])
+        for field, dtype in self.entry_fields.items():
+            df[field] = pd.to_numeric(df[field]).astype(dtype)
+        return df
+
+    def _empty_frame(self) -> pd.DataFrame:
+        return self._typed(pd.DataFrame())
+
+
+# databases written before the long form kept one object column of dicts per
+# symbol, indexed by datetime
+def from_wide_frame(df: pd.DataFrame) -> pd.DataFrame:
+    records = []
+    for symbol in df.columns:
+        for dt, entry in df[symbol].dropna().items():
+            records.append({"symbol": symbol, "datetime": dt, **entry})
+    return pd.DataFrame.from_records(records)
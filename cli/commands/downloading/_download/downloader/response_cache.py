@@ -0,0 +1,188 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from .....exceptions import ResourceError
+from ..configs.download import DownloadConfig
+from .metrics import METRICS
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT_TTLS: Dict[str, Optional[float]] = {
+    "alpaca.stock_bars": 15 * 60,
+    "polygon.ticker_details": 24 * 60 * 60,
+    "polygon.stock_financials": 24 * 60 * 60,
+}
+# temporary files older than this were left behind by a crashed write, younger
+# ones may still be written by another process sharing the cache
+STALE_TMP_SECONDS = 60 * 60
+
+
+@dataclass
+class ResponseCacheConfig:
+    cache_dir: str
+    max_bytes: int = 2 * 1024**3
+    offline: bool = False
+    endpoint_ttls: Dict[str, Optional[float]] = field(
+        default_factory=lambda: dict(DEFAULT_ENDPOINT_TTLS)
+    )
+
+
+# responses are plain json payloads stored in one file per (endpoint, params)
+# key, so no sdk upgrade can make them unreadable. the file mtime doubles as the
+# last access time for least recently used eviction
+class ResponseCache:
+    def __init__(self, cfg: ResponseCacheConfig):
+        self.cfg = cfg
+        self._lock = threading.Lock()
+        os.makedirs(cfg.cache_dir, exist_ok=True)
+
+        self._entries: Dict[str, Tuple[int, float]] = {}
+        now = time.time()
+        for entry in os.scandir(cfg.cache_dir):
+            if entry.name.endswith(".tmp"):
+                remove_if_stale(entry, now)
+            elif entry.name.endswith(".pkl"):
+                # pickled sdk objects written by an older layout
+                os.remove(entry.path)
+            elif entry.name.endswith(".json"):
+                stat = entry.stat()
+                self._entries[entry.name[: -len(".json")]] = (
+                    stat.st_size,
+                    stat.st_mtime,
+                )
+        self._total_bytes = sum(size for size, _ in self._entries.values())
+
+    # a ttl of None means the response never expires, offline mode serves any
+    # cached response regardless of its age and fails on a miss
+    def get_or_fetch(
+        self,
+        endpoint: str,
+        params: Dict[str, object],
+        fetch: Callable[[], object],
+        historical: bool = False,
+    ) -> object:
+        key = cache_key(endpoint, params)
+        ttl = None if historical else self.cfg.endpoint_ttls.get(endpoint)
+
+        cached = self._read(key)
+        if cached is not None:
+            fetched_at, response = cached
+            if self.cfg.offline or ttl is None or time.time() - fetched_at < ttl:
+                METRICS.increment("cache_hits")
+                return response
+        METRICS.increment("cache_misses")
+
+        if self.cfg.offline:
+            raise ResourceError(
+                f"offline and no cached response for {endpoint} {params}"
+            )
+
+        response = fetch()
+        self._write(key, (time.time(), response))
+        return response
+
+    def _read(self, key: str) -> Optional[Tuple[float, object]]:
+        filepath = self._filepath(key)
+        try:
+            with open(filepath, "r") as f:
+                cached = json.load(f)
+            cached = (float(cached["fetched_at"]), cached["response"])
+        except FileNotFoundError:
+            return None
+        # whatever makes a cached response unreadable, it is fetched again
+        except Exception as e:
+            _logger.warning(f"dropping unreadable cached response {filepath}: {e}")
+            return None
+
+        now = time.time()
+        # another thread may have evicted the file since it was read
+        try:
+            os.utime(filepath, (now, now))
+        except FileNotFoundError:
+            return cached
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (self._entries[key][0], now)
+        return cached
+
+    def _write(self, key: str, cached: Tuple[float, object]) -> None:
+        filepath = self._filepath(key)
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fetched_at, response = cached
+        with open(tmp_filepath, "w") as f:
+            json.dump({"fetched_at": fetched_at, "response": response}, f)
+        os.replace(tmp_filepath, filepath)
+
+        with self._lock:
+            size = os.path.getsize(filepath)
+            previous_size, _ = self._entries.get(key, (0, 0))
+            self._entries[key] = (size, time.time())
+            self._total_bytes += size - previous_size
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._total_bytes <= self.cfg.max_bytes:
+            return
+        for key, (size, _) in sorted(self._entries.items(), key=lambda e: e[1][1]):
+            if self._total_bytes <= self.cfg.max_bytes * 0.9:
+                break
+            try:
+                os.remove(self._filepath(key))
+            except FileNotFoundError:
+                pass
+            del self._entries[key]
+            self._total_bytes -= size
+
+    def _filepath(self, key: str) -> str:
+        return os.path.join(self.cfg.cache_dir, f"{key}.json")
+
+
+def remove_if_stale(entry: os.DirEntry, now: float) -> None:
+    try:
+        if now - entry.stat().st_mtime >= STALE_TMP_SECONDS:
+            os.remove(entry.path)
+    except FileNotFoundError:
+        pass
+
+
+def build_response_cache(cfg: DownloadConfig) -> Optional[ResponseCache]:
+    if not cfg.use_response_cache:
+        return None
+    return ResponseCache(
+        ResponseCacheConfig(
+            cache_dir=cfg.response_cache_dir,
+            max_bytes=cfg.response_cache_max_bytes,
+            offline=cfg.offline,
+        )
+    )
+
+
+def cache_key(endpoint: str, params: Dict[str, object]) -> str:
+    payload = json.dumps(
+        {"endpoint": endpoint, "params": params}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_historical(end: datetime) -> bool:
+    end_date = end.date() if isinstance(end, datetime) else end
+    return end_date < datetime.now().date()
+
+
+def cached_call(
+    response_cache: Optional[ResponseCache],
+    endpoint: str,
+    params: Dict[str, object],
+    fetch: Callable[[], object],
+    historical: bool = False,
+) -> object:
+    if response_cache is None:
+        return fetch()
+    return response_cache.get_or_fetch(endpoint, params, fetch, historical)
@@ -1,11 +1,15 @@
+import dataclasses
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+import hashlib
 import logging
-from typing import Dict, List, Tuple
+import os
+import time
+from typing import Callable, Dict, List, Tuple
 
+import numpy as np
 import pandas as pd
-from pandas_market_calendars import get_calendar
-from pandas_market_calendars.calendar_registry import MarketCalendar
+import pytz
 
 _logger = logging.getLogger(__name__)
 
@@ -16,12 +20,172 @@ class LoadMarketCalendarConfig:
     end_date: str
     exchange: str = "NYSE"
     column_name: str = "market_open"
-
-
-def load_market_calendar(cfg: LoadMarketCalendarConfig) -> MarketCalendar:
-    return get_calendar(cfg.exchange).schedule(
+    cache_dir: str = None
+
+
+# cached arrays not loaded for this long belong to ranges no run asks for anymore
+CALENDAR_CACHE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+
+# the schedule is cached for the whole calendar years around the range, so the
+# cache key only changes once a year, and sliced to the range after loading
+def load_market_calendar(cfg: LoadMarketCalendarConfig) -> pd.Series:
+    start, end = pd.Timestamp(cfg.start_date), pd.Timestamp(cfg.end_date)
+    calendar = load_whole_years_calendar(
+        cfg.exchange, cfg.column_name, start.year, end.year, cfg.cache_dir
+    )
+    return calendar[
+        (calendar.index >= start.normalize()) & (calendar.index <= end.normalize())
+    ]
+
+
+def load_whole_years_calendar(
+    exchange: str, column_name: str, first_year: int, last_year: int, cache_dir: str
+) -> pd.Series:
+    whole_years = LoadMarketCalendarConfig(
+        start_date=f"{first_year}-01-01",
+        end_date=f"{last_year}-12-31",
+        exchange=exchange,
+        column_name=column_name,
+    )
+    calendar = load_cached_int64_array(
+        cache_dir,
+        cache_key("market_calendar", exchange, column_name, first_year, last_year),
+        lambda: build_market_calendar(whole_years),
+    )
+    return pd.Series(
+        pd.DatetimeIndex(calendar[:, 1]).tz_localize("UTC"),
+        index=pd.DatetimeIndex(calendar[:, 0]),
+        name=column_name,
+    )
+
+
+def build_market_calendar(cfg: LoadMarketCalendarConfig) -> np.ndarray:
+    from pandas_market_calendars import get_calendar
+
+    calendar = get_calendar(cfg.exchange).schedule(
         start_date=str(cfg.start_date), end_date=str(cfg.end_date)
     )[cfg.column_name]
+    return np.column_stack(
+        [
+            calendar.index.values.astype("datetime64[ns]").view(np.int64),
+            pd.DatetimeIndex(calendar).tz_convert("UTC").asi8,
+        ]
+    )
+
+
+@dataclass
+class LoadSlotGridConfig:
+    market_calendar: pd.Series
+    evaluation_hours: float
+    record_frequency_minutes: int
+    start_evaluation_time_str: str
+    timezone: pytz.timezone
+    cache_dir: str = None
+    exchange: str = "NYSE"
+
+
+# the grid is cached for the whole calendar years of the exchange, like the
+# calendar, and filtered down to the sessions of market_calendar. a calendar
+# with sessions the exchange does not have gets a grid built for it alone
+def load_slot_grid(cfg: LoadSlotGridConfig) -> pd.DatetimeIndex:
+    sessions = pd.DatetimeIndex(cfg.market_calendar.index).tz_localize(None).normalize()
+    if cfg.cache_dir is None or len(sessions) == 0:
+        return build_slot_grid(cfg)
+
+    first_year, last_year = sessions.min().year, sessions.max().year
+    whole_years = load_whole_years_calendar(
+        cfg.exchange,
+        LoadMarketCalendarConfig.column_name,
+        first_year,
+        last_year,
+        cfg.cache_dir,
+    )
+    if not sessions.isin(whole_years.index).all():
+        return build_slot_grid(cfg)
+
+    key = cache_key(
+        "slot_grid",
+        cfg.exchange,
+        first_year,
+        last_year,
+        cfg.evaluation_hours,
+        cfg.record_frequency_minutes,
+        cfg.start_evaluation_time_str,
+        str(cfg.timezone),
+    )
+    slot_grid = load_cached_int64_array(
+        cfg.cache_dir,
+        key,
+        lambda: build_slot_grid(
+            dataclasses.replace(cfg, market_calendar=whole_years)
+        ).asi8,
+    )
+    slot_grid = pd.DatetimeIndex(slot_grid).tz_localize("UTC").tz_convert(cfg.timezone)
+    return slot_grid[slot_grid.tz_localize(None).normalize().isin(sessions)]
+
+
+# every trading day contributes the same wall clock slots, starting at
+# start_evaluation_time_str and spaced 60 / record_frequency_minutes apart
+def build_slot_grid(cfg: LoadSlotGridConfig) -> pd.DatetimeIndex:
+    slot_count = round(cfg.evaluation_hours * cfg.record_frequency_minutes) + 1
+    slot_offsets = pd.to_timedelta(
+        np.arange(slot_count) * 60 / cfg.record_frequency_minutes, unit="m"
+    )
+
+    trading_days = pd.DatetimeIndex(cfg.market_calendar).tz_localize(None).normalize()
+    base_dts = trading_days + pd.Timedelta(cfg.start_evaluation_time_str)
+
+    naive_grid = pd.DatetimeIndex(
+        (base_dts.values.reshape(-1, 1) + slot_offsets.values.reshape(1, -1)).ravel()
+    )
+    return naive_grid.tz_localize(cfg.timezone)
+
+
+def cache_key(*parts: object) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# a cached array that cannot be read, e.g. after a crash truncated it, is
+# rebuilt. loading touches the file so prune_cached_arrays keeps arrays in use
+def load_cached_int64_array(
+    cache_dir: str, key: str, build: Callable[[], np.ndarray]
+) -> np.ndarray:
+    if cache_dir is None:
+        return build()
+
+    filepath = os.path.join(cache_dir, f"{key}.npy")
+    if os.path.exists(filepath):
+        try:
+            array = np.load(filepath, mmap_mode="r")
+            os.utime(filepath)
+            return array
+        except (OSError, ValueError, EOFError) as e:
+            _logger.warning(f"rebuilding unreadable cached array {filepath}: {e}")
+
+    array = np.asarray(build(), dtype=np.int64)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_filepath = f"{filepath}.{os.getpid()}.tmp.npy"
+    np.save(tmp_filepath, array)
+    os.replace(tmp_filepath, filepath)
+    prune_cached_arrays(cache_dir)
+    return array
+
+
+def prune_cached_arrays(cache_dir: str) -> None:
+    now = time.time()
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".npy"):
+            continue
+        try:
+            if now - entry.stat().st_mtime > CALENDAR_CACHE_MAX_AGE_SECONDS:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
 
 
 def to_datetime_mapping(
@@ -32,10 +196,7 @@ def to_datetime_mapping(
         key = datetime_key(dt)
 
         if key in mapping:
-            import pdb
-
-            pdb.set_trace()
-            _logger.warn(
+            _logger.warning(
                 f"found a duplicate datetime key while building mapping: ({str(key)}, {obj})"
             )
         else:
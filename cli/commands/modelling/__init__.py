@@ -0,0 +1,24 @@
+import argparse
+
+from ._features import features_cmd
+from ._pit_join import pit_join_cmd
+
+
+def modelling_cmd(parent: argparse._SubParsersAction) -> None:
+    modelling_parser = parent.add_parser(
+        "modelling",
+        help="Command for building model inputs",
+    )
+    modelling_subparser = modelling_parser.add_subparsers(
+        title="modelling-sub-commands",
+        metavar="",
+        dest="modelling_sub_cmd",
+    )
+
+    cmds = [
+        features_cmd,
+        pit_join_cmd,
+    ]
+
+    for cmd in cmds:
+        cmd(modelling_subparser)
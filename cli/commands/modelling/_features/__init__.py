@@ -0,0 +1,83 @@
+import logging
+import argparse
+import time
+
+from ....exceptions import ConfigError
+
+__all__ = ["features_cmd"]
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURES = [
+    "returns",
+    "log_returns",
+    "volatility_78",
+    "moving_average_12",
+    "moving_average_78",
+]
+
+
+def features_cmd(parent: argparse._SubParsersAction) -> None:
+    features_cmd = parent.add_parser(
+        "features",
+        help="Materialize features from the prices database",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="compute named features per symbol into feature=/symbol= partitioned\n"
+        "parquet files, later runs only compute the prices appended since the\n"
+        "previous one",
+    )
+    features_cmd.add_argument(
+        "--database",
+        default="./data/sp500_equity_prices.parquet",
+        help="the prices database written by `downloading download`, a parquet\n"
+        "file or a partitioned directory",
+    )
+    features_cmd.add_argument(
+        "--output",
+        default="./data/sp500_equity_features",
+        help="the feature store directory",
+    )
+    features_cmd.add_argument(
+        "--features",
+        nargs="+",
+        default=DEFAULT_FEATURES,
+        help="the features to materialize",
+    )
+    features_cmd.add_argument(
+        "--symbols",
+        nargs="+",
+        default=None,
+        help="only materialize these symbols",
+    )
+    features_cmd.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="drop the store and recompute every feature from the full history",
+    )
+
+    features_cmd.set_defaults(func=_features_func)
+    return
+
+
+def _features_func(args: argparse.Namespace) -> None:
+    from core.feature_store import MaterializeFeaturesConfig, materialize_features
+
+    cfg = MaterializeFeaturesConfig(
+        prices_filepath=args.database,
+        store_dir=args.output,
+        features=args.features,
+        symbols=args.symbols,
+        rebuild=args.rebuild,
+    )
+
+    start_time = time.perf_counter()
+    try:
+        row_counts = materialize_features(cfg)
+    except KeyError as e:
+        raise ConfigError(str(e))
+    for feature, row_count in row_counts.items():
+        _logger.info(f"{feature}: {row_count} new rows")
+    _logger.info(
+        f"materialized features to {args.output} in "
+        f"{time.perf_counter() - start_time:.1f}s"
+    )
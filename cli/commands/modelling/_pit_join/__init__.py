@@ -0,0 +1,77 @@
+import logging
+import argparse
+import time
+
+from ....exceptions import ConfigError
+
+__all__ = ["pit_join_cmd"]
+
+_logger = logging.getLogger(__name__)
+
+
+def pit_join_cmd(parent: argparse._SubParsersAction) -> None:
+    pit_join_cmd = parent.add_parser(
+        "pit-join",
+        help="Join profiles and financials onto the price slots as of each slot",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="attach the latest known profile and financial values to every price\n"
+        "slot of every symbol, one parquet file per symbol. symbols whose inputs\n"
+        "did not change since the previous run are left as they are",
+    )
+    pit_join_cmd.add_argument(
+        "--prices",
+        default="./data/sp500_equity_prices.parquet",
+        help="the prices database, a parquet file or a partitioned directory",
+    )
+    pit_join_cmd.add_argument(
+        "--profiles",
+        default="./data/sp500_equity_profiles.parquet",
+        help="the profiles database",
+    )
+    pit_join_cmd.add_argument(
+        "--financials",
+        default="./data/sp500_equity_financials.parquet",
+        help="the financials database",
+    )
+    pit_join_cmd.add_argument(
+        "--output",
+        default="./data/sp500_equity_pit",
+        help="the directory the joined symbols are written to",
+    )
+    pit_join_cmd.add_argument(
+        "--symbols",
+        nargs="+",
+        default=None,
+        help="only join these symbols",
+    )
+    pit_join_cmd.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="drop the output and join every symbol again",
+    )
+
+    pit_join_cmd.set_defaults(func=_pit_join_func)
+    return
+
+
+def _pit_join_func(args: argparse.Namespace) -> None:
+    from core.pit_join import PointInTimeJoinConfig, build_point_in_time
+
+    cfg = PointInTimeJoinConfig(
+        prices_filepath=args.prices,
+        record_filepaths={"profiles": args.profiles, "financials": args.financials},
+        output_dir=args.output,
+        symbols=args.symbols,
+        rebuild=args.rebuild,
+    )
+
+    start_time = time.perf_counter()
+    try:
+        summary = build_point_in_time(cfg)
+    except ValueError as e:
+        raise ConfigError(str(e))
+    _logger.info(
+        f"joined {len(summary.rebuilt)} symbols, appended new slots of "
+        f"{len(summary.appended)} symbols, reused {len(summary.reused)} unchanged "
+        f"symbols in {time.perf_counter() - start_time:.1f}s"
+    )
@@ -0,0 +1,117 @@
+# System imports
+from contextlib import contextmanager
+import io
+import logging
+import time
+from typing import Iterator, Optional
+
+_logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ["cpu", "mem"]
+# rows of the sorted cProfile stats and allocation sites in the reports
+REPORT_LIMIT = 60
+TRACEMALLOC_FRAMES = 10
+
+
+def default_output(mode: str) -> str:
+    return f"./profile-{mode}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+
+
+# wraps a command run in cProfile or tracemalloc and writes the report even
+# when the command fails, so a crashing production run still leaves one
+@contextmanager
+def profile(mode: Optional[str], output: Optional[str] = None) -> Iterator[None]:
+    if mode is None:
+        yield
+        return
+
+    output = output or default_output(mode)
+    if mode == "cpu":
+        with _cpu_profile(output):
+            yield
+    elif mode == "mem":
+        with _memory_profile(output):
+            yield
+    else:
+        raise ValueError(f"unknown profile mode {mode}, use one of {PROFILE_MODES}")
+
+
+# cProfile only sees the thread it is enabled on, so every thread started while
+# profiling enables a profiler of its own through threading.setprofile and the
+# per thread stats are merged into one report
+@contextmanager
+def _cpu_profile(output: str) -> Iterator[None]:
+    import cProfile
+    import pstats
+    import threading
+
+    profilers = [cProfile.Profile()]
+    profilers_lock = threading.Lock()
+
+    def profile_thread(frame, event, arg) -> None:
+        thread_profiler = cProfile.Profile()
+        with profilers_lock:
+            profilers.append(thread_profiler)
+        # replaces this hook for the rest of the thread
+        thread_profiler.enable()
+
+    threading.setprofile(profile_thread)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        with profilers_lock:
+            thread_count = len(profilers)
+            stats = pstats.Stats(*profilers)
+
+        report = io.StringIO()
+        report.write(f"merged profiles of {thread_count} threads\n")
+        for sort_key in ("cumulative", "tottime"):
+            report.write(f"sorted by {sort_key}\n")
+            stats.stream = report
+            stats.sort_stats(sort_key).print_stats(REPORT_LIMIT)
+        stats.dump_stats(f"{output}.pstats")
+        with open(output, "w") as f:
+            f.write(report.getvalue())
+        _logger.info(f"wrote cpu profile to {output} and {output}.pstats")
+
+
+# the report lists the allocation sites that grew the most between the start
+# and the end of the command, plus the peak traced memory
+@contextmanager
+def _memory_profile(output: str) -> Iterator[None]:
+    import tracemalloc
+
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ]
+        before, after = before.filter_traces(filters), after.filter_traces(filters)
+        with open(output, "w") as f:
+            f.write(
+                f"traced memory: current {current / 1e6:.1f} MB, "
+                f"peak {peak / 1e6:.1f} MB\n\n"
+            )
+            f.write(f"top {REPORT_LIMIT} allocation sites by growth\n")
+            for stat in after.compare_to(before, "lineno")[:REPORT_LIMIT]:
+                f.write(f"{stat}\n")
+            f.write(f"\ntop {REPORT_LIMIT // 6} allocation tracebacks by growth\n")
+            for stat in after.compare_to(before, "traceback")[: REPORT_LIMIT // 6]:
+                f.write(f"\n{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+        _logger.info(
+            f"wrote memory profile to {output} (peak {peak / 1e6:.1f} MB traced)"
+        )
@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+
+NANOSECONDS_PER_YEAR = 365.25 * 24 * 60 * 60 * 1_000_000_000
+# rows simulated per step, bounds the temporaries to a few chunk sized arrays
+CHUNK_ROWS = 8192
+
+
+@dataclass
+class BacktestConfig:
+    transaction_cost_bps: float = 1.0
+    initial_capital: float = 1.0
+    periods_per_year: float = 252 * 79
+
+
+@dataclass
+class BacktestResult:
+    returns: np.ndarray
+    gross_returns: np.ndarray
+    costs: np.ndarray
+    turnover: np.ndarray
+    equity: np.ndarray
+
+    def metrics(self, periods_per_year: float) -> Dict[str, float]:
+        if len(self.returns) == 0:
+            return {}
+        volatility = float(np.std(self.returns) * np.sqrt(periods_per_year))
+        mean_return = float(np.mean(self.returns) * periods_per_year)
+        running_max = np.maximum.accumulate(self.equity)
+        return {
+            "total_return": float(self.equity[-1] / self.equity[0] - 1),
+            "annualized_return": mean_return,
+            "annualized_volatility": volatility,
+            "sharpe": mean_return / volatility if volatility > 0 else float("nan"),
+            "max_drawdown": float(np.max(1 - self.equity / running_max)),
+            "average_turnover": float(np.mean(self.turnover)),
+            "total_costs": float(np.sum(self.costs)),
+        }
+
+
+# weights[t] is decided with prices up to and including bar t and held from
+# bar t to bar t + 1, so the last row of weights is never held. Bars where a
+# symbol has no price on either side contribute no return for it.
+def run_backtest(
+    prices: np.ndarray, weights: np.ndarray, cfg: BacktestConfig
+) -> BacktestResult:
+    if prices.shape != weights.shape:
+        raise ValueError(
+            f"prices {prices.shape} and weights {weights.shape} must have the same shape"
+        )
+
+    period_count = max(prices.shape[0] - 1, 0)
+    gross_returns = np.zeros(period_count)
+    turnover = np.zeros(period_count)
+    previous_weights = np.zeros(prices.shape[1])
+    for start in range(0, period_count, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, period_count)
+        held = np.nan_to_num(np.asarray(weights[start:end], dtype=np.float64))
+
+        asset_returns = np.asarray(prices[start + 1 : end + 1], dtype=np.float64)
+        asset_returns = asset_returns / prices[start:end] - 1
+        np.nan_to_num(asset_returns, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+        gross_returns[start:end] = np.einsum("ij,ij->i", held, asset_returns)
+        trades = np.diff(held, axis=0, prepend=previous_weights[np.newaxis, :])
+        turnover[start:end] = np.abs(trades).sum(axis=1)
+        previous_weights = held[-1]
+
+    costs = turnover * cfg.transaction_cost_bps / 10_000
+    returns = gross_returns - costs
+    equity = cfg.initial_capital * np.concatenate([[1.0], np.cumprod(1 + returns)])
+    return BacktestResult(returns, gross_returns, costs, turnover, equity)
+
+
+def periods_per_year(timestamps: np.ndarray) -> float:
+    if len(timestamps) < 2:
+        return BacktestConfig.periods_per_year
+    return (len(timestamps) - 1) / (
+        (timestamps[-1] - timestamps[0]) / NANOSECONDS_PER_YEAR
+    )
@@ -0,0 +1,220 @@
+from dataclasses import dataclass
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .features import FEATURES, Feature
+from .files import atomic_to_parquet
+
+_logger = logging.getLogger(__name__)
+
+WATERMARKS_FILENAME = "_watermarks.json"
+# a partition holding more part files than this is rewritten as one
+MAX_PART_FILES = 8
+
+
+@dataclass
+class MaterializeFeaturesConfig:
+    prices_filepath: str
+    store_dir: str
+    features: List[str]
+    symbols: Optional[List[str]] = None
+    rebuild: bool = False
+
+
+# one directory per feature=/symbol= partition holding datetime, value part
+# files, next to a json of the last materialized datetime per feature and
+# symbol and a fingerprint of the prices up to it. only prices after a
+# watermark are computed on later runs, unless the prices before it changed
+class FeatureStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._watermarks: Dict[str, Dict[str, List[int]]] = {}
+        watermarks_filepath = os.path.join(root, WATERMARKS_FILENAME)
+        if os.path.exists(watermarks_filepath):
+            with open(watermarks_filepath) as f:
+                self._watermarks = json.load(f)
+
+    def watermark(self, feature: str, symbol: str) -> Optional[pd.Timestamp]:
+        value = self._watermarks.get(feature, {}).get(symbol)
+        if value is None:
+            return None
+        # stores written before fingerprints were kept hold the datetime only
+        watermark = value[0] if isinstance(value, list) else value
+        return pd.Timestamp(watermark, tz="UTC")
+
+    def history_fingerprint(self, feature: str, symbol: str) -> Optional[int]:
+        value = self._watermarks.get(feature, {}).get(symbol)
+        return value[1] if isinstance(value, list) else None
+
+    def append(self, feature: str, symbol: str, values: pd.Series) -> None:
+        if len(values) == 0:
+            return
+        partition_dir = self._partition_dir(feature, symbol)
+        write_part(partition_dir, values)
+        if len(part_files(partition_dir)) > MAX_PART_FILES:
+            self._compact(feature, symbol)
+
+    def clear(self, feature: str, symbol: str) -> None:
+        shutil.rmtree(self._partition_dir(feature, symbol), ignore_errors=True)
+        self._watermarks.get(feature, {}).pop(symbol, None)
+
+    def advance(
+        self, feature: str, symbol: str, watermark: pd.Timestamp, fingerprint: int
+    ) -> None:
+        self._watermarks.setdefault(feature, {})[symbol] = [
+            watermark.value,
+            fingerprint,
+        ]
+
+    def save_watermarks(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        filepath = os.path.join(self.root, WATERMARKS_FILENAME)
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_filepath, "w") as f:
+            json.dump(self._watermarks, f)
+        os.replace(tmp_filepath, filepath)
+
+    def load(self, feature: str, symbol: str) -> pd.Series:
+        partition_dir = self._partition_dir(feature, symbol)
+        if len(part_files(partition_dir)) == 0:
+            return pd.Series(dtype="float64", index=pd.DatetimeIndex([], tz="UTC"))
+        df = pd.read_parquet(partition_dir)
+        values = pd.Series(
+            df["value"].values,
+            index=pd.DatetimeIndex(pd.to_datetime(df["datetime"], utc=True)),
+            name=feature,
+        )
+        return values[~values.index.duplicated(keep="last")].sort_index()
+
+    def _partition_dir(self, feature: str, symbol: str) -> str:
+        return os.path.join(self.root, f"feature={feature}", f"symbol={symbol}")
+
+    # the merged part is newer than every part it replaces, so a crash before
+    # the old parts are removed still reads back the same values
+    def _compact(self, feature: str, symbol: str) -> None:
+        partition_dir = self._partition_dir(feature, symbol)
+        old_parts = part_files(partition_dir)
+        write_part(partition_dir, self.load(feature, symbol))
+        for filename in old_parts:
+            os.remove(os.path.join(partition_dir, filename))
+
+
+def write_part(partition_dir: str, values: pd.Series) -> None:
+    os.makedirs(partition_dir, exist_ok=True)
+    atomic_to_parquet(
+        pd.DataFrame({"datetime": values.index, "value": values.values}),
+        os.path.join(
+            partition_dir, f"part-{time.time_ns()}-{uuid.uuid4().hex}.parquet"
+        ),
+    )
+
+
+def part_files(partition_dir: str) -> List[str]:
+    if not os.path.isdir(partition_dir):
+        return []
+    return sorted(
+        filename
+        for filename in os.listdir(partition_dir)
+        if filename.endswith(".parquet")
+    )
+
+
+# reads the prices database written by either the dataframe or the
+# partitioned backend, yielding each symbol's valid prices on a UTC index
+def iter_symbol_prices(
+    prices_filepath: str, symbols: Optional[List[str]] = None
+) -> Iterator[Tuple[str, pd.Series]]:
+    if os.path.isdir(prices_filepath):
+        available = sorted(
+            name[len("symbol=") :]
+            for name in os.listdir(prices_filepath)
+            if name.startswith("symbol=")
+        )
+        for symbol in available if symbols is None else symbols:
+            symbol_dir = os.path.join(prices_filepath, f"symbol={symbol}")
+            if not os.path.isdir(symbol_dir):
+                continue
+            df = pd.read_parquet(symbol_dir, columns=["datetime", "entry"])
+            prices = pd.Series(
+                df["entry"].values.astype("float64"),
+                index=pd.DatetimeIndex(pd.to_datetime(df["datetime"], utc=True)),
+            )
+            prices = prices[~prices.index.duplicated(keep="last")]
+            yield symbol, prices.dropna().sort_index()
+        return
+
+    df = pd.read_parquet(prices_filepath, columns=symbols)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index, utc=True))
+    df = df.sort_index()
+    for symbol in df.columns:
+        yield symbol, df[symbol].astype("float64").dropna()
+
+
+# a running hash of the prices, entry i fingerprints every row up to row i.
+# inserting, dropping or changing a row changes every later entry
+def history_fingerprints(prices: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(prices).to_numpy().cumsum()
+
+
+def fingerprint_until(
+    prices: pd.Series, fingerprints: np.ndarray, watermark: pd.Timestamp
+) -> int:
+    rows = prices.index.searchsorted(watermark, side="right")
+    return 0 if rows == 0 else int(fingerprints[rows - 1])
+
+
+# recomputes each feature from `lookback` rows before the watermark so rolling
+# windows over the new rows match a full recomputation
+def compute_increment(
+    feature: Feature, prices: pd.Series, watermark: Optional[pd.Timestamp]
+) -> pd.Series:
+    if watermark is None:
+        return feature.compute(prices).dropna()
+    first_new = prices.index.searchsorted(watermark, side="right")
+    if first_new >= len(prices):
+        return prices.iloc[:0]
+    window = prices.iloc[max(first_new - feature.lookback, 0) :]
+    return feature.compute(window).loc[prices.index[first_new] :].dropna()
+
+
+def materialize_features(cfg: MaterializeFeaturesConfig) -> Dict[str, int]:
+    unknown = [feature for feature in cfg.features if feature not in FEATURES]
+    if len(unknown) > 0:
+        raise KeyError(f"unknown features {unknown}, use any of {sorted(FEATURES)}")
+
+    if cfg.rebuild and os.path.isdir(cfg.store_dir):
+        shutil.rmtree(cfg.store_dir)
+    store = FeatureStore(cfg.store_dir)
+
+    row_counts = {feature: 0 for feature in cfg.features}
+    for symbol, prices in iter_symbol_prices(cfg.prices_filepath, cfg.symbols):
+        if len(prices) == 0:
+            continue
+        fingerprints = history_fingerprints(prices)
+        for name in cfg.features:
+            watermark = store.watermark(name, symbol)
+            if watermark is not None and store.history_fingerprint(
+                name, symbol
+            ) != fingerprint_until(prices, fingerprints, watermark):
+                _logger.warning(
+                    f"prices of {symbol} before the {name} watermark changed, "
+                    "recomputing all of it"
+                )
+                store.clear(name, symbol)
+                watermark = None
+
+            values = compute_increment(FEATURES[name], prices, watermark)
+            store.append(name, symbol, values)
+            store.advance(name, symbol, prices.index[-1], int(fingerprints[-1]))
+            row_counts[name] += len(values)
+        _logger.debug(f"materialized features for {symbol}")
+    store.save_watermarks()
+    return row_counts
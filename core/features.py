@@ -0,0 +1,43 @@
+from dataclasses import dataclass
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+
+# a feature maps one symbol's valid prices to a series on the same index,
+# lookback is the number of earlier rows a value depends on so incremental
+# runs can recompute only the new rows
+@dataclass
+class Feature:
+    compute: Callable[[pd.Series], pd.Series]
+    lookback: int
+
+
+def returns(prices: pd.Series) -> pd.Series:
+    return prices.pct_change()
+
+
+def log_returns(prices: pd.Series) -> pd.Series:
+    return np.log(prices).diff()
+
+
+def rolling_volatility(window: int) -> Feature:
+    return Feature(
+        lambda prices: log_returns(prices).rolling(window).std(), lookback=window
+    )
+
+
+def moving_average(window: int) -> Feature:
+    return Feature(lambda prices: prices.rolling(window).mean(), lookback=window - 1)
+
+
+FEATURES: Dict[str, Feature] = {
+    "returns": Feature(returns, lookback=1),
+    "log_returns": Feature(log_returns, lookback=1),
+    "volatility_12": rolling_volatility(12),
+    "volatility_78": rolling_volatility(78),
+    "moving_average_12": moving_average(12),
+    "moving_average_78": moving_average(78),
+    "moving_average_390": moving_average(390),
+}
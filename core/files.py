@@ -0,0 +1,17 @@
+import os
+
+import pandas as pd
+
+
+# readers never observe a partially written file, a crash mid write leaves the
+# previous version in place. returns the bytes written
+def atomic_to_parquet(df: pd.DataFrame, filepath: str) -> int:
+    tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_filepath)
+        size = os.path.getsize(tmp_filepath)
+        os.replace(tmp_filepath, filepath)
+        return size
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
@@ -0,0 +1,212 @@
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+import uuid
+
+import pandas as pd
+
+from .feature_store import (
+    fingerprint_until,
+    history_fingerprints,
+    iter_symbol_prices,
+    part_files,
+)
+from .files import atomic_to_parquet
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "_manifest.json"
+RECORD_KEY_COLUMNS = ["symbol", "datetime"]
+# a symbol holding more part files than this is rewritten as one
+MAX_PART_FILES = 8
+
+
+@dataclass
+class PointInTimeJoinConfig:
+    prices_filepath: str
+    record_filepaths: Dict[str, str]
+    output_dir: str
+    symbols: Optional[List[str]] = None
+    # naive record dates (the quarterly calendar) are midnights in this zone
+    timezone: str = "US/Eastern"
+    rebuild: bool = False
+
+
+@dataclass
+class PointInTimeJoinSummary:
+    rebuilt: List[str] = field(default_factory=list)
+    appended: List[str] = field(default_factory=list)
+    reused: List[str] = field(default_factory=list)
+
+
+# reads a long form database written by RecordDatabase, keyed by symbol with
+# UTC datetimes sorted within each symbol. symbols without records get an
+# empty frame under the "" key so every output has the same columns
+def load_records(filepath: str, timezone: str) -> Dict[str, pd.DataFrame]:
+    if not os.path.exists(filepath):
+        _logger.warning(f"{filepath} does not exist, joining without it")
+        return {"": pd.DataFrame({"datetime": pd.DatetimeIndex([], tz="UTC")})}
+    df = pd.read_parquet(filepath)
+    if "symbol" not in df.columns:
+        raise ValueError(
+            f"{filepath} is not in long form, run `downloading download` once to migrate it"
+        )
+    dtimes = pd.DatetimeIndex(pd.to_datetime(df["datetime"]))
+    if dtimes.tz is None:
+        dtimes = dtimes.tz_localize(timezone)
+    df["datetime"] = dtimes.tz_convert("UTC")
+    df = df.sort_values(RECORD_KEY_COLUMNS, kind="stable")
+    records = {
+        str(symbol): symbol_records.drop(columns="symbol").reset_index(drop=True)
+        for symbol, symbol_records in df.groupby("symbol", sort=False)
+    }
+    records[""] = df.iloc[:0].drop(columns="symbol")
+    return records
+
+
+# every price slot gets the latest record at or before it, a record keyed on a
+# date is treated as known from that date's midnight onwards
+def join_symbol(prices: pd.Series, records: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    joined = pd.DataFrame({"datetime": prices.index, "price": prices.values})
+    for name, dataset in records.items():
+        overlap = set(joined.columns) & (set(dataset.columns) - {"datetime"})
+        if len(overlap) > 0:
+            raise ValueError(f"{name} fields {sorted(overlap)} are already joined")
+        joined = pd.merge_asof(
+            joined,
+            dataset.astype({"datetime": joined["datetime"].dtype}),
+            on="datetime",
+            direction="backward",
+        )
+    return joined
+
+
+def records_fingerprint(records: Dict[str, pd.DataFrame]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(records):
+        digest.update(name.encode())
+        digest.update(
+            pd.util.hash_pandas_object(records[name], index=False).values.tobytes()
+        )
+    return digest.hexdigest()
+
+
+# the manifest holds every symbol's last joined slot, a fingerprint of its
+# prices up to that slot and one of its records. only slots after the last one
+# are joined and appended as a new part, a symbol is joined again in full when
+# its records or the prices up to its last slot changed
+def build_point_in_time(cfg: PointInTimeJoinConfig) -> PointInTimeJoinSummary:
+    if cfg.rebuild and os.path.isdir(cfg.output_dir):
+        shutil.rmtree(cfg.output_dir)
+    os.makedirs(cfg.output_dir, exist_ok=True)
+
+    manifest_filepath = os.path.join(cfg.output_dir, MANIFEST_FILENAME)
+    manifest: Dict[str, object] = {}
+    if os.path.exists(manifest_filepath):
+        with open(manifest_filepath) as f:
+            manifest = json.load(f)
+
+    datasets = {
+        name: load_records(filepath, cfg.timezone)
+        for name, filepath in cfg.record_filepaths.items()
+    }
+
+    summary = PointInTimeJoinSummary()
+    for symbol, prices in iter_symbol_prices(cfg.prices_filepath, cfg.symbols):
+        records = {
+            name: dataset.get(symbol, dataset[""]) for name, dataset in datasets.items()
+        }
+        symbol_records_fingerprint = records_fingerprint(records)
+        fingerprints = history_fingerprints(prices)
+        partition_dir = point_in_time_dir(cfg.output_dir, symbol)
+
+        # manifests written before incremental joins hold a single fingerprint
+        entry = manifest.get(symbol)
+        last_slot = None
+        if (
+            isinstance(entry, dict)
+            and entry["last_slot"] is not None
+            and entry["records"] == symbol_records_fingerprint
+            and len(part_files(partition_dir)) > 0
+        ):
+            last_slot = pd.Timestamp(entry["last_slot"], tz="UTC")
+            if entry["prices"] != fingerprint_until(prices, fingerprints, last_slot):
+                last_slot = None
+
+        if last_slot is None:
+            clear_point_in_time(cfg.output_dir, symbol)
+            new_prices = prices
+            summary.rebuilt.append(symbol)
+        else:
+            new_prices = prices.iloc[prices.index.searchsorted(last_slot, "right") :]
+            if len(new_prices) == 0:
+                summary.reused.append(symbol)
+                continue
+            summary.appended.append(symbol)
+
+        write_joined_part(partition_dir, join_symbol(new_prices, records))
+        if len(part_files(partition_dir)) > MAX_PART_FILES:
+            compact_point_in_time(cfg.output_dir, symbol)
+        manifest[symbol] = {
+            "last_slot": prices.index[-1].value if len(prices) > 0 else None,
+            "prices": int(fingerprints[-1]) if len(prices) > 0 else 0,
+            "records": symbol_records_fingerprint,
+        }
+
+    tmp_filepath = f"{manifest_filepath}.{os.getpid()}.tmp"
+    with open(tmp_filepath, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_filepath, manifest_filepath)
+    return summary
+
+
+def point_in_time_dir(output_dir: str, symbol: str) -> str:
+    return os.path.join(output_dir, f"symbol={symbol}")
+
+
+def write_joined_part(partition_dir: str, joined: pd.DataFrame) -> None:
+    os.makedirs(partition_dir, exist_ok=True)
+    atomic_to_parquet(
+        joined,
+        os.path.join(
+            partition_dir, f"part-{time.time_ns()}-{uuid.uuid4().hex}.parquet"
+        ),
+    )
+
+
+# outputs written before incremental joins are a single symbol=S.parquet file
+def clear_point_in_time(output_dir: str, symbol: str) -> None:
+    shutil.rmtree(point_in_time_dir(output_dir, symbol), ignore_errors=True)
+    legacy_filepath = f"{point_in_time_dir(output_dir, symbol)}.parquet"
+    if os.path.exists(legacy_filepath):
+        os.remove(legacy_filepath)
+
+
+# the merged part is newer than every part it replaces, so a crash before the
+# old parts are removed still reads back the same rows
+def compact_point_in_time(output_dir: str, symbol: str) -> None:
+    partition_dir = point_in_time_dir(output_dir, symbol)
+    old_parts = part_files(partition_dir)
+    write_joined_part(partition_dir, load_point_in_time(output_dir, symbol))
+    for filename in old_parts:
+        os.remove(os.path.join(partition_dir, filename))
+
+
+def load_point_in_time(output_dir: str, symbol: str) -> pd.DataFrame:
+    partition_dir = point_in_time_dir(output_dir, symbol)
+    if len(part_files(partition_dir)) == 0:
+        raise FileNotFoundError(f"no point in time join of {symbol} in {output_dir}")
+    joined = pd.concat(
+        [
+            pd.read_parquet(os.path.join(partition_dir, filename))
+            for filename in part_files(partition_dir)
+        ],
+        ignore_index=True,
+    )
+    joined = joined.drop_duplicates("datetime", keep="last")
+    return joined.sort_values("datetime", kind="stable").reset_index(drop=True)
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+import os
+import shutil
+from typing import List
+
+import numpy as np
+
+PRICES_FILENAME = "prices.npy"
+TIMESTAMPS_FILENAME = "timestamps.npy"
+SYMBOLS_FILENAME = "symbols.npy"
+
+
+# a read only time x symbol float64 matrix with its epoch nanosecond (UTC)
+# timestamps and symbols, opened as memory maps so every process reading the
+# same directory shares one page cached copy
+@dataclass
+class PriceMatrix:
+    prices: np.ndarray
+    timestamps: np.ndarray
+    symbols: np.ndarray
+
+    @classmethod
+    def open(cls, directory: str) -> "PriceMatrix":
+        return cls(
+            prices=np.load(os.path.join(directory, PRICES_FILENAME), mmap_mode="r"),
+            timestamps=np.load(
+                os.path.join(directory, TIMESTAMPS_FILENAME), mmap_mode="r"
+            ),
+            symbols=np.load(os.path.join(directory, SYMBOLS_FILENAME), mmap_mode="r"),
+        )
+
+    def symbol_position(self, symbol: str) -> int:
+        positions = np.flatnonzero(self.symbols == symbol)
+        if len(positions) == 0:
+            raise KeyError(symbol)
+        return int(positions[0])
+
+    def symbol_prices(self, symbol: str) -> np.ndarray:
+        return self.prices[:, self.symbol_position(symbol)]
+
+    def symbol_list(self) -> List[str]:
+        return self.symbols.tolist()
+
+
+# the matrix is written to a sibling directory first and swapped in afterwards
+# so readers never see a mix of old and new arrays
+def export_price_matrix(database_filepath: str, directory: str) -> PriceMatrix:
+    import pandas as pd
+
+    df = pd.read_parquet(database_filepath)
+    index = pd.DatetimeIndex(pd.to_datetime(df.index, utc=True))
+    order = np.argsort(index.asi8, kind="stable")
+    columns = sorted(df.columns)
+
+    tmp_directory = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(tmp_directory)
+    try:
+        np.save(
+            os.path.join(tmp_directory, PRICES_FILENAME),
+            np.ascontiguousarray(
+                df[columns].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+            ),
+        )
+        np.save(os.path.join(tmp_directory, TIMESTAMPS_FILENAME), index.asi8[order])
+        np.save(
+            os.path.join(tmp_directory, SYMBOLS_FILENAME), np.array(columns, dtype=str)
+        )
+
+        old_directory = f"{directory}.{os.getpid()}.old"
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    return PriceMatrix.open(directory)
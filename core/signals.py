@@ -0,0 +1,128 @@
+import importlib
+import inspect
+from typing import Callable, Dict
+
+import numpy as np
+
+Signal = Callable[..., np.ndarray]
+
+
+# every signal maps a time x symbol price matrix to a weights matrix of the same
+# shape where row t only depends on prices up to row t
+
+
+def forward_fill(prices: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(prices)
+    last_valid = np.where(valid, np.arange(prices.shape[0])[:, np.newaxis], 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    return np.take_along_axis(np.asarray(prices), last_valid, axis=0)
+
+
+# raised for signal parameters outside what the signal accepts, anything else a
+# signal raises is a bug in it and is not reported as a bad parameter
+class SignalParameterError(ValueError):
+    pass
+
+
+# windows are counted in rows and have to fit into the history
+def check_window(name: str, window: int, prices: np.ndarray) -> int:
+    if isinstance(window, bool) or not isinstance(window, (int, np.integer)):
+        raise SignalParameterError(
+            f"{name} has to be an integer, got {type(window).__name__} {window!r}"
+        )
+    window = int(window)
+    if window < 1:
+        raise SignalParameterError(f"{name} has to be at least 1, got {window}")
+    if window > prices.shape[0]:
+        raise SignalParameterError(
+            f"{name} of {window} rows is longer than the {prices.shape[0]} rows of "
+            "price history"
+        )
+    return window
+
+
+def trailing_return(prices: np.ndarray, lookback: int) -> np.ndarray:
+    lookback = check_window("lookback", lookback, prices)
+    filled = forward_fill(prices)
+    returns = np.full(filled.shape, np.nan)
+    returns[lookback:] = filled[lookback:] / filled[:-lookback] - 1
+    return returns
+
+
+def moving_average(prices: np.ndarray, window: int) -> np.ndarray:
+    window = check_window("moving average window", window, prices)
+    filled = np.nan_to_num(forward_fill(prices))
+    cumulative = np.cumsum(filled, axis=0)
+    averages = np.full(filled.shape, np.nan)
+    averages[window - 1] = cumulative[window - 1] / window
+    averages[window:] = (cumulative[window:] - cumulative[:-window]) / window
+    return averages
+
+
+# scales every row so its absolute weights sum to one, rows without any
+# signal stay flat
+def normalize_gross(raw_weights: np.ndarray) -> np.ndarray:
+    raw_weights = np.nan_to_num(raw_weights)
+    gross = np.abs(raw_weights).sum(axis=1, keepdims=True)
+    return np.divide(
+        raw_weights, gross, out=np.zeros_like(raw_weights), where=gross > 0
+    )
+
+
+def equal_weight(prices: np.ndarray) -> np.ndarray:
+    return normalize_gross((~np.isnan(prices)).astype(np.float64))
+
+
+def momentum(prices: np.ndarray, lookback: int = 78) -> np.ndarray:
+    returns = trailing_return(prices, lookback)
+    valid = ~np.isnan(returns)
+    counts = valid.sum(axis=1, keepdims=True)
+    totals = np.where(valid, returns, 0.0).sum(axis=1, keepdims=True)
+    demeaned = returns - totals / np.maximum(counts, 1)
+    return normalize_gross(demeaned)
+
+
+def mean_reversion(prices: np.ndarray, lookback: int = 12) -> np.ndarray:
+    return -momentum(prices, lookback)
+
+
+def moving_average_crossover(
+    prices: np.ndarray, fast: int = 12, slow: int = 78
+) -> np.ndarray:
+    is_long = moving_average(prices, fast) > moving_average(prices, slow)
+    return normalize_gross((is_long & ~np.isnan(prices)).astype(np.float64))
+
+
+SIGNALS: Dict[str, Signal] = {
+    "equal_weight": equal_weight,
+    "momentum": momentum,
+    "mean_reversion": mean_reversion,
+    "moving_average_crossover": moving_average_crossover,
+}
+
+
+# either a name from SIGNALS or a `package.module:function` path
+def load_signal(name: str) -> Signal:
+    if name in SIGNALS:
+        return SIGNALS[name]
+    if ":" not in name:
+        raise KeyError(f"unknown signal {name}, use one of {sorted(SIGNALS)}")
+    module_name, function_name = name.split(":", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# params have to be keyword arguments the signal takes besides the prices
+def check_params(signal: Signal, params: Dict[str, object]) -> None:
+    parameters = list(inspect.signature(signal).parameters.values())[1:]
+    if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+        return
+    names = [
+        parameter.name
+        for parameter in parameters
+        if parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY)
+    ]
+    unknown = sorted(set(params) - set(names))
+    if len(unknown) > 0:
+        raise SignalParameterError(
+            f"unknown parameters {unknown}, the signal takes {names}"
+        )
@@ -0,0 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+import itertools
+from multiprocessing import shared_memory
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .backtest import BacktestConfig, run_backtest
+from .signals import load_signal
+
+# the worker side view of the shared prices, set once per process by the
+# pool initializer
+_shared_memory: Optional[shared_memory.SharedMemory] = None
+_shared_prices: Optional[np.ndarray] = None
+
+
+@dataclass
+class SharedArraySpec:
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+@dataclass
+class SweepConfig:
+    signal: str
+    param_sets: List[Dict[str, object]]
+    backtest: BacktestConfig
+    workers: Optional[int] = None
+
+
+# copies the array into a named shared memory block once, workers attach to
+# it by name so nothing but the spec is pickled
+@contextmanager
+def share_array(array: np.ndarray) -> Iterator[SharedArraySpec]:
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    try:
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[:] = array
+        del shared
+        yield SharedArraySpec(block.name, array.shape, array.dtype.str)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def attach_shared_prices(spec: SharedArraySpec) -> None:
+    global _shared_memory, _shared_prices
+    _shared_memory = shared_memory.SharedMemory(name=spec.name)
+    _shared_prices = np.ndarray(
+        spec.shape, dtype=np.dtype(spec.dtype), buffer=_shared_memory.buf
+    )
+    _shared_prices.flags.writeable = False
+
+
+def evaluate_param_set(
+    signal_name: str, params: Dict[str, object], cfg: BacktestConfig
+) -> Dict[str, object]:
+    weights = load_signal(signal_name)(_shared_prices, **params)
+    result = run_backtest(_shared_prices, weights, cfg)
+    return {**params, **result.metrics(cfg.periods_per_year)}
+
+
+def param_grid(
+    grid: Dict[str, List[object]], fixed: Dict[str, object] = None
+) -> List[Dict[str, object]]:
+    keys = list(grid)
+    return [
+        {**(fixed or {}), **dict(zip(keys, values))}
+        for values in itertools.product(*(grid[key] for key in keys))
+    ]
+
+
+def run_sweep(prices: np.ndarray, cfg: SweepConfig) -> List[Dict[str, object]]:
+    workers = min(cfg.workers or os.cpu_count() or 1, max(len(cfg.param_sets), 1))
+    with share_array(prices) as spec:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=attach_shared_prices,
+            initargs=(spec,),
+        ) as executor:
+            return list(
+                executor.map(
+                    evaluate_param_set,
+                    itertools.repeat(cfg.signal),
+                    cfg.param_sets,
+                    itertools.repeat(cfg.backtest),
+                )
+            )
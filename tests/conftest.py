@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from cli.commands.downloading._download.configs.download import (
+    DatabaseEnum,
+    DownloadConfig,
+    DownloaderEnum,
+)
+from cli.commands.downloading._download.downloader import rate_limit
+
+FINANCIALS_FIELDS = {"gross_margin": "float64", "revenue_diff": "float64"}
+PROFILES_FIELDS = {"total_employees": "Int64", "market_cap": "float64"}
+
+
+# rate limiters are shared per process, every test starts with full buckets
+@pytest.fixture(autouse=True)
+def fresh_rate_limiters(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_rate_limiters", {})
+
+
+def record_config(
+    directory: str, downloader_enum: DownloaderEnum, entry_fields: dict, **kwargs
+) -> DownloadConfig:
+    defaults = dict(
+        database_filepath=os.path.join(directory, "records.parquet"),
+        database_enum=DatabaseEnum.RecordDatabase,
+        entry_fields=entry_fields,
+        downloader_enum=downloader_enum,
+        symbols=["AAA", "BBB"],
+        use_existing_db=False,
+        years_examined=1,
+        use_response_cache=False,
+        response_cache_dir=os.path.join(directory, "responses"),
+        polygon_requests_per_minute=1e9,
+        max_retries=0,
+    )
+    return DownloadConfig(**{**defaults, **kwargs})
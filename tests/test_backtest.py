@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from core import backtest
+from core.backtest import BacktestConfig, run_backtest
+
+
+# the weights decided on a bar earn the return of the bar after it
+def test_weights_are_held_for_the_next_bar():
+    prices = np.array([[100.0], [110.0], [121.0], [121.0]])
+    weights = np.array([[0.0], [1.0], [0.0], [1.0]])
+
+    result = run_backtest(prices, weights, BacktestConfig(transaction_cost_bps=0))
+
+    np.testing.assert_allclose(result.gross_returns, [0.0, 0.1, 0.0])
+    np.testing.assert_allclose(result.turnover, [0.0, 1.0, 1.0])
+
+
+# two symbols over three bars, worked out by hand with 10 bps of costs
+def test_returns_and_costs_of_a_small_portfolio():
+    prices = np.array([[100.0, 50.0], [110.0, 50.0], [99.0, 55.0]])
+    weights = np.array([[0.5, 0.5], [1.0, 0.0], [0.0, 1.0]])
+
+    result = run_backtest(
+        prices, weights, BacktestConfig(transaction_cost_bps=10, initial_capital=2)
+    )
+
+    np.testing.assert_allclose(result.gross_returns, [0.05, -0.1])
+    np.testing.assert_allclose(result.turnover, [1.0, 1.0])
+    np.testing.assert_allclose(result.costs, [0.001, 0.001])
+    np.testing.assert_allclose(result.returns, [0.049, -0.101])
+    np.testing.assert_allclose(result.equity, [2.0, 2 * 1.049, 2 * 1.049 * 0.899])
+
+
+# a symbol without a price on either side of a bar contributes no return
+def test_missing_prices_contribute_nothing():
+    prices = np.array([[100.0, np.nan], [110.0, 50.0], [110.0, np.nan]])
+    weights = np.array([[0.5, 0.5], [0.5, 0.5], [0.0, 0.0]])
+
+    result = run_backtest(prices, weights, BacktestConfig(transaction_cost_bps=0))
+
+    np.testing.assert_allclose(result.gross_returns, [0.05, 0.0])
+
+
+def test_chunks_match_a_single_pass(monkeypatch):
+    rng = np.random.default_rng(0)
+    prices = 100 + rng.random((50, 3)).cumsum(axis=0)
+    weights = rng.random((50, 3))
+    cfg = BacktestConfig(transaction_cost_bps=5)
+
+    single = run_backtest(prices, weights, cfg)
+    monkeypatch.setattr(backtest, "CHUNK_ROWS", 7)
+    chunked = run_backtest(prices, weights, cfg)
+
+    np.testing.assert_allclose(chunked.returns, single.returns)
+    np.testing.assert_allclose(chunked.turnover, single.turnover)
+
+
+def test_shapes_have_to_match():
+    with pytest.raises(ValueError, match="same shape"):
+        run_backtest(np.ones((3, 2)), np.ones((3, 1)), BacktestConfig())
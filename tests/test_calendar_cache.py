@@ -0,0 +1,57 @@
+import os
+import time
+
+import numpy as np
+import pytz
+
+from cli.commands.downloading._download.downloader import utils
+from cli.commands.downloading._download.downloader.utils import (
+    LoadMarketCalendarConfig,
+    LoadSlotGridConfig,
+    load_cached_int64_array,
+    load_market_calendar,
+    load_slot_grid,
+)
+
+
+def slot_grid_config(market_calendar, cache_dir):
+    return LoadSlotGridConfig(
+        market_calendar, 6.5, 12, "09:30:00", pytz.timezone("US/Eastern"), cache_dir
+    )
+
+
+def test_consecutive_days_share_the_cached_calendar_and_grid(tmp_path):
+    for start, end in [("2021-06-15", "2023-03-10"), ("2021-06-16", "2023-03-11")]:
+        calendar = load_market_calendar(
+            LoadMarketCalendarConfig(start, end, cache_dir=str(tmp_path))
+        )
+        uncached = load_market_calendar(LoadMarketCalendarConfig(start, end))
+        assert calendar.equals(uncached)
+
+        grid = load_slot_grid(slot_grid_config(calendar, str(tmp_path)))
+        assert grid.equals(load_slot_grid(slot_grid_config(calendar, None)))
+
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_truncated_array_is_rebuilt(tmp_path):
+    load_cached_int64_array(str(tmp_path), "key", lambda: np.arange(1000))
+    with open(tmp_path / "key.npy", "r+b") as f:
+        f.truncate(100)
+
+    array = load_cached_int64_array(str(tmp_path), "key", lambda: np.arange(1000))
+
+    assert np.array_equal(array, np.arange(1000))
+
+
+def test_arrays_unused_for_long_are_pruned(tmp_path):
+    load_cached_int64_array(str(tmp_path), "used", lambda: np.arange(3))
+    old = time.time() - utils.CALENDAR_CACHE_MAX_AGE_SECONDS - 1
+    (tmp_path / "unused.npy").touch()
+    for key in ["used", "unused"]:
+        os.utime(tmp_path / f"{key}.npy", (old, old))
+
+    load_cached_int64_array(str(tmp_path), "used", lambda: np.arange(3))
+    load_cached_int64_array(str(tmp_path), "new", lambda: np.arange(3))
+
+    assert sorted(os.listdir(tmp_path)) == ["new.npy", "used.npy"]
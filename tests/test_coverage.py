@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from cli.commands.downloading._download.downloader.coverage import CoverageIndex
+
+# two sessions of 5 minute slots with a night in between
+SLOTS = pd.date_range("2022-01-03 14:30", periods=78, freq="5min", tz="UTC").append(
+    pd.date_range("2022-01-04 14:30", periods=78, freq="5min", tz="UTC")
+)
+
+
+# holes filled in later insert grid minutes between existing ones and shift
+# every bitmap, the bits already set must stay on their minutes
+def test_filling_holes_keeps_existing_bits(tmp_path):
+    coverage = CoverageIndex()
+    coverage.add("AAA", SLOTS[::3])
+    coverage.add("BBB", SLOTS[100:])
+    coverage.add("BBB", SLOTS[:50:2])
+    coverage.add("AAA", SLOTS[1::3])
+
+    expected = {
+        "AAA": SLOTS[::3].union(SLOTS[1::3]),
+        "BBB": SLOTS[100:].union(SLOTS[:50:2]),
+    }
+    filepath = str(tmp_path / "coverage.npz")
+    coverage.save(filepath, np.array([1]))
+    reloaded = CoverageIndex.load(filepath, np.array([1]))
+
+    for index in (coverage, reloaded):
+        for key, dtimes in expected.items():
+            np.testing.assert_array_equal(
+                index.contains_many(key, SLOTS), SLOTS.isin(dtimes)
+            )
+            assert index.missing(key, SLOTS).equals(SLOTS.difference(dtimes))
+        assert index.contains("AAA", SLOTS[0].to_pydatetime())
+        assert not index.contains("AAA", SLOTS[2].to_pydatetime())
+        assert not index.contains("AAA", SLOTS[0] + pd.Timedelta(minutes=1))
+
+
+# bitmaps span the stored slots, not every minute between the first and last
+def test_bitmaps_grow_with_the_slots_only():
+    coverage = CoverageIndex()
+    for day in range(100):
+        coverage.add("AAA", SLOTS[:78] + pd.Timedelta(days=day))
+
+    assert len(coverage._grid) == 78 * 100
+    assert coverage._bitmaps["AAA"].nbytes <= 2 * 78 * 100 // 8
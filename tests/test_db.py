@@ -0,0 +1,36 @@
+import pandas as pd
+
+from cli.commands.downloading._download.downloader.db import DataframeDatabase
+
+SLOTS = pd.date_range("2022-01-03 14:30", periods=3, freq="5min", tz="UTC")
+
+
+def test_add_entry_writes_through_under_copy_on_write():
+    with pd.option_context("mode.copy_on_write", True):
+        database = DataframeDatabase()
+        database.add_batch("AAA", SLOTS[:1], [1.0])
+        database.add_symbol("BBB", "float64")
+
+        database.add_entry("BBB", SLOTS[0].to_pydatetime(), 2.0)
+        database.add_entry("AAA", SLOTS[1].to_pydatetime(), 3.0)
+
+        assert database._df.loc[SLOTS[0], "BBB"] == 2.0
+        assert database._df.loc[SLOTS[1], "AAA"] == 3.0
+        assert database.contains("BBB", SLOTS[0].to_pydatetime())
+        assert database.contains_datetime(SLOTS[1].to_pydatetime())
+
+
+def test_sidecar_of_a_shifted_frame_is_not_reused(tmp_path):
+    filepath = str(tmp_path / "prices.parquet")
+    database = DataframeDatabase()
+    database.add_batch("AAA", SLOTS[:2], [1.0, 2.0])
+    database.save(filepath)
+
+    # same row and entry counts over other datetimes, as if the parquet file
+    # was replaced without its sidecar
+    pd.DataFrame({"AAA": [1.0, 2.0]}, index=SLOTS[1:]).to_parquet(filepath)
+    reloaded = DataframeDatabase()
+    reloaded.load(filepath)
+
+    assert reloaded.contains("AAA", SLOTS[2].to_pydatetime())
+    assert not reloaded.contains("AAA", SLOTS[0].to_pydatetime())
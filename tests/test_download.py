@@ -0,0 +1,283 @@
+from datetime import datetime, timedelta
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.fakes import (
+    FakePolygonClient,
+    FakeStockHistoricalDataClient,
+    market_minutes,
+    synthetic_closes,
+)
+
+from cli.commands.downloading._download.configs.download import DownloaderEnum
+from cli.commands.downloading._download.downloader.financials import (
+    FinancialsDownloader,
+)
+from cli.commands.downloading._download.downloader.checkpoint import (
+    Checkpointer,
+    FlushPolicy,
+)
+from cli.commands.downloading._download.downloader.prices import (
+    GetBatchPricesConfig,
+    AlignBarsConfig,
+    MinuteBars,
+    PRICE_TOLERANCE_MINUTES,
+    PricesDownloader,
+    align_bars,
+    coalesce_slot_positions,
+    get_batch_prices,
+    group_by_gap_intervals,
+)
+from cli.commands.downloading._download.downloader.response_cache import (
+    ResponseCache,
+    ResponseCacheConfig,
+)
+from cli.commands.downloading._download.downloader.profiles import ProfilesDownloader
+
+from conftest import FINANCIALS_FIELDS, PROFILES_FIELDS, record_config
+
+RECORD_DOWNLOADERS = [
+    (
+        FinancialsDownloader,
+        DownloaderEnum.FinancialsDownloader,
+        FINANCIALS_FIELDS,
+        {"gross_margin": 0.4, "revenue_diff": 0.05},
+    ),
+    (
+        ProfilesDownloader,
+        DownloaderEnum.ProfilesDownloader,
+        PROFILES_FIELDS,
+        {"total_employees": 10, "market_cap": 1e9},
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    "downloader_class, downloader_enum, entry_fields, entry", RECORD_DOWNLOADERS
+)
+def test_partial_pull_saves_pulled_datetimes_only(
+    tmp_path, downloader_class, downloader_enum, entry_fields, entry
+):
+    downloader = downloader_class(
+        record_config(tmp_path, downloader_enum, entry_fields)
+    )
+    pulled, skipped = datetime(2022, 3, 31), datetime(2022, 6, 30)
+
+    downloader.save_to_database("AAA", [pulled, skipped], [(pulled, entry)])
+
+    assert downloader.database.contains("AAA", pulled)
+    assert not downloader.database.contains("AAA", skipped)
+
+
+def test_failed_request_mid_symbol_is_reported_and_skipped(tmp_path):
+    downloader = ProfilesDownloader(
+        record_config(tmp_path, DownloaderEnum.ProfilesDownloader, PROFILES_FIELDS)
+    )
+    dtimes = [datetime(2022, 1, 1), datetime(2022, 4, 1), datetime(2022, 7, 1)]
+    downloader._polygon_client = FakePolygonClient(failing_dates={"2022-04-01"})
+
+    pulled = downloader.pull_missing_data("AAA", dtimes)
+    downloader.save_to_database("AAA", dtimes, pulled)
+    downloader.flush()
+
+    assert [dt for dt, _ in pulled] == [dtimes[0], dtimes[2]]
+    assert [downloader.database.contains("AAA", dt) for dt in dtimes] == [
+        True,
+        False,
+        True,
+    ]
+    assert downloader.failures.symbols() == ["AAA"]
+    assert os.path.exists(downloader.cfg.database_filepath)
+
+
+def test_offline_run_with_partly_warm_cache_saves_cached_datetimes(tmp_path):
+    dtimes = [datetime(2022, 1, 1), datetime(2022, 4, 1)]
+    warm = ProfilesDownloader(
+        record_config(
+            tmp_path,
+            DownloaderEnum.ProfilesDownloader,
+            PROFILES_FIELDS,
+            use_response_cache=True,
+        )
+    )
+    warm._polygon_client = FakePolygonClient()
+    warm.pull_missing_data("AAA", dtimes[:1])
+
+    offline = ProfilesDownloader(
+        record_config(
+            tmp_path,
+            DownloaderEnum.ProfilesDownloader,
+            PROFILES_FIELDS,
+            use_response_cache=True,
+            offline=True,
+        )
+    )
+    offline._polygon_client = FakePolygonClient()
+    pulled = offline.pull_missing_data("AAA", dtimes)
+    offline.save_to_database("AAA", dtimes, pulled)
+
+    assert offline.polygon_client.calls == 0
+    assert [offline.database.contains("AAA", dt) for dt in dtimes] == [True, False]
+    assert offline.failures.symbols() == ["AAA"]
+
+
+def test_checkpointer_counts_symbols_not_pages():
+    saves = []
+    checkpointer = Checkpointer(lambda: saves.append(1), FlushPolicy(every_symbols=2))
+
+    for _ in range(10):
+        checkpointer.mark_dirty("AAA")
+    assert saves == []
+
+    checkpointer.mark_dirty("BBB")
+    assert saves == [1]
+
+
+# every off-grid datetime lies inside some page, including those falling
+# between the grid slots two pages were split at
+def test_off_grid_gap_is_split_into_pages():
+    slot_grid = pd.date_range("2022-01-03 09:30", periods=100, freq="5min", tz="UTC")
+    downloader = SimpleNamespace(
+        _slot_grid=slot_grid, cfg=SimpleNamespace(page_slots=30)
+    )
+    off_grid = [
+        dt.to_pydatetime() + timedelta(minutes=2, seconds=30) for dt in slot_grid
+    ]
+    off_grid[0] = slot_grid[0].to_pydatetime() - timedelta(minutes=2)
+
+    intervals = PricesDownloader._span_intervals(downloader, off_grid)
+
+    padding = timedelta(minutes=PRICE_TOLERANCE_MINUTES)
+    assert len(intervals) == 4
+    assert intervals[0][0] == off_grid[0] - padding
+    assert intervals[-1][1] == off_grid[-1] + padding
+    for dt in off_grid:
+        assert any(start <= dt <= end for start, end in intervals)
+
+
+# adjacent and nearby gaps join one run, a gap contained in or repeated
+# within another run adds nothing to it
+def test_gap_slots_are_coalesced_into_runs():
+    positions = np.array([12, 3, 4, 5, 8, 4, 20, 21, 30])
+
+    assert coalesce_slot_positions(positions, 0) == [
+        (3, 5),
+        (8, 8),
+        (12, 12),
+        (20, 21),
+        (30, 30),
+    ]
+    assert coalesce_slot_positions(positions, 2) == [
+        (3, 8),
+        (12, 12),
+        (20, 21),
+        (30, 30),
+    ]
+    assert coalesce_slot_positions(positions, 3) == [(3, 12), (20, 21), (30, 30)]
+
+
+def test_symbols_with_overlapping_gaps_share_a_window():
+    day = datetime(2022, 1, 3, 14, 30)
+
+    def gap(start_hour: float, end_hour: float):
+        return (day + timedelta(hours=start_hour), day + timedelta(hours=end_hour))
+
+    symbol_to_gaps = {
+        "AAA": [gap(0, 2)],
+        "BBB": [gap(0, 2)],
+        "CCC": [gap(1, 2.5)],
+        "DDD": [gap(0.5, 1.5)],
+        "EEE": [gap(4, 5)],
+        "FFF": [gap(3, 6)],
+        "GGG": [gap(5.5, 8)],
+    }
+
+    groups = group_by_gap_intervals(symbol_to_gaps, max_group_size=3)
+
+    # identical, overlapping and covered gaps merge while the window stays
+    # within the longest gap, which GGG would exceed
+    assert groups == [
+        (["AAA", "BBB", "DDD"], gap(0, 2.5)),
+        (["CCC"], gap(0, 2.5)),
+        (["FFF", "EEE"], gap(3, 6)),
+        (["GGG"], gap(5.5, 8)),
+    ]
+    for symbol, gaps in symbol_to_gaps.items():
+        for start, end in gaps:
+            assert any(
+                symbol in symbols and window[0] <= start and end <= window[1]
+                for symbols, window in groups
+            )
+
+
+# each slot takes the bar at the nearest offset, the later minute first on a
+# tie, and nothing further away than PRICE_TOLERANCE_MINUTES
+def test_bars_are_aligned_in_search_order():
+    slots = pd.date_range("2022-01-03 14:30", periods=6, freq="10min", tz="UTC")
+    # sub-minute slots are matched from the minute they fall in
+    slots = slots.insert(6, slots[-1] + pd.Timedelta(minutes=10, seconds=30))
+    slot_minutes = slots.asi8 // 60_000_000_000
+    bar_minutes = np.concatenate(
+        [
+            slot_minutes[0] + np.array([-1, 0, 1]),
+            slot_minutes[1] + np.array([-1, 1]),
+            slot_minutes[2] + np.array([-1, 2]),
+            slot_minutes[3] + np.array([-4]),
+            slot_minutes[4] + np.array([-5, 5]),
+            slot_minutes[6] + np.array([-1, 1]),
+        ]
+    )
+
+    aligned = align_bars(
+        AlignBarsConfig(slots, MinuteBars(bar_minutes, bar_minutes.astype(float)))
+    )
+
+    offsets = np.array([0, 1, -1, -4, np.nan, np.nan, 1])
+    np.testing.assert_array_equal(aligned.to_numpy(), slot_minutes + offsets)
+    assert aligned.index.equals(slots)
+
+
+def test_bars_are_pulled_page_by_page():
+    client = FakeStockHistoricalDataClient(page_size=100)
+    start = pd.Timestamp("2022-01-03 14:30", tz="UTC").to_pydatetime()
+    end = pd.Timestamp("2022-01-04 21:00", tz="UTC").to_pydatetime()
+
+    symbol_to_bars = get_batch_prices(
+        GetBatchPricesConfig(["AAA", "BBB"], client, start, end)
+    )
+
+    minutes = market_minutes(start, end).asi8 // 60_000_000_000
+    assert client.calls == int(np.ceil(2 * len(minutes) / 100))
+    for symbol in ("AAA", "BBB"):
+        np.testing.assert_array_equal(symbol_to_bars[symbol].minutes, minutes)
+        np.testing.assert_array_equal(
+            symbol_to_bars[symbol].prices, synthetic_closes(symbol, minutes)
+        )
+
+
+# gaps that moved within the same days between runs reuse the cached response
+def test_bar_requests_are_cached_by_whole_days(tmp_path):
+    client = FakeStockHistoricalDataClient()
+    response_cache = ResponseCache(ResponseCacheConfig(cache_dir=str(tmp_path)))
+
+    def pull(start: str, end: str):
+        return get_batch_prices(
+            GetBatchPricesConfig(
+                ["AAA"],
+                client,
+                pd.Timestamp(start, tz="UTC").to_pydatetime(),
+                pd.Timestamp(end, tz="UTC").to_pydatetime(),
+                response_cache=response_cache,
+            )
+        )
+
+    first = pull("2022-01-03 15:00", "2022-01-04 16:00")
+    second = pull("2022-01-03 18:00", "2022-01-04 20:00")
+
+    assert client.calls == 1
+    np.testing.assert_array_equal(first["AAA"].minutes, second["AAA"].minutes)
+    np.testing.assert_array_equal(first["AAA"].prices, second["AAA"].prices)
@@ -0,0 +1,202 @@
+import argparse
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.fakes import (
+    FakePolygonClient,
+    FakeStockHistoricalDataClient,
+    synthetic_closes,
+)
+
+from cli.commands.downloading import _download as download_module
+from cli.commands.downloading._download.configs.download import (
+    DownloadConfig,
+    DownloaderEnum,
+)
+from cli.commands.downloading._download.downloader.build_downloader import (
+    build_downloader,
+)
+from cli.commands.downloading._download.downloader.record_db import RecordDatabase
+
+from conftest import FINANCIALS_FIELDS, PROFILES_FIELDS, record_config
+
+CONFIG_NAME = "e2e"
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD"]
+# record downloads over every symbol, replayable from the response cache
+RECORD_ARGS = dict(symbols=SYMBOLS, years_examined=2, use_response_cache=True)
+
+
+def prices_config(directory: str, **kwargs) -> DownloadConfig:
+    defaults = dict(
+        database_filepath=os.path.join(directory, "prices.parquet"),
+        downloader_enum=DownloaderEnum.PricesDownloader,
+        symbols=SYMBOLS,
+        use_existing_db=False,
+        years_examined=0.02,
+        database_entry_type="float64",
+        response_cache_dir=os.path.join(directory, "responses"),
+        calendar_cache_dir=os.path.join(directory, "calendar"),
+        alpaca_requests_per_minute=1e9,
+        max_retries=0,
+    )
+    return DownloadConfig(**{**defaults, **kwargs})
+
+
+def download_args(**kwargs) -> argparse.Namespace:
+    defaults = dict(
+        config=CONFIG_NAME,
+        debug=False,
+        workers=1,
+        flush_every_symbols=None,
+        flush_every_seconds=None,
+        offline=False,
+        no_response_cache=False,
+        metrics_json=None,
+        metrics_prom=None,
+        alpaca_url=None,
+        polygon_url=None,
+        requests_per_minute=None,
+    )
+    return argparse.Namespace(**{**defaults, **kwargs})
+
+
+# runs the download command on cfg with the fake clients injected, the same
+# way benchmarks/run.py does, and returns the downloader it built
+def run_download(cfg: DownloadConfig, alpaca_client=None, polygon_client=None, **args):
+    downloaders = []
+
+    def build_fake_downloader(cfg: DownloadConfig):
+        downloader = build_downloader(cfg)
+        downloader._alpaca_client = alpaca_client or FakeStockHistoricalDataClient()
+        downloader._polygon_client = polygon_client or FakePolygonClient()
+        downloaders.append(downloader)
+        return downloader
+
+    with mock.patch.object(
+        download_module, "CONFIG_CHOICES", {CONFIG_NAME: cfg}
+    ), mock.patch.object(download_module, "build_downloader", build_fake_downloader):
+        download_module._download_func(download_args(**args))
+    return downloaders[0]
+
+
+def saved_prices(filepath: str) -> pd.DataFrame:
+    return pd.read_parquet(filepath)
+
+
+def saved_records(filepath: str, entry_fields: dict) -> pd.DataFrame:
+    database = RecordDatabase(entry_fields)
+    database.load(filepath)
+    return database.frame()
+
+
+def test_prices_partial_pull_round_trips(tmp_path):
+    cfg = prices_config(tmp_path)
+
+    downloader = run_download(
+        cfg, alpaca_client=FakeStockHistoricalDataClient(failing_symbols={"BBB"})
+    )
+
+    saved = saved_prices(cfg.database_filepath)
+    pd.testing.assert_frame_equal(saved, downloader.database._df)
+    assert sorted(saved.columns[saved.notna().any()]) == ["AAA", "CCC", "DDD"]
+    assert downloader.failures.symbols() == ["BBB"]
+
+    # every slot holds the close of a bar a few minutes away at most
+    closes = saved["AAA"].dropna()
+    epoch_minutes = to_epoch_minutes(closes.index)
+    nearby_closes = [
+        synthetic_closes("AAA", epoch_minutes + offset) for offset in range(-4, 5)
+    ]
+    assert len(closes) > 0
+    assert (np.array(nearby_closes) == closes.to_numpy()).any(axis=0).all()
+
+
+# workers save pages as they finish, so only the column order may differ
+def test_prices_with_workers_match_a_sequential_run(tmp_path):
+    sequential = prices_config(tmp_path / "sequential")
+    concurrent = prices_config(tmp_path / "concurrent")
+
+    run_download(sequential, workers=1)
+    run_download(concurrent, workers=4)
+
+    pd.testing.assert_frame_equal(
+        saved_prices(concurrent.database_filepath),
+        saved_prices(sequential.database_filepath),
+        check_like=True,
+    )
+
+
+def test_prices_offline_replays_the_online_run(tmp_path):
+    online = prices_config(tmp_path, symbols=SYMBOLS[:2])
+    offline = prices_config(
+        tmp_path, database_filepath=os.path.join(tmp_path, "offline.parquet")
+    )
+
+    run_download(online)
+    alpaca_client = FakeStockHistoricalDataClient()
+    downloader = run_download(offline, alpaca_client=alpaca_client, offline=True)
+
+    assert alpaca_client.calls == 0
+    pd.testing.assert_frame_equal(
+        saved_prices(offline.database_filepath),
+        saved_prices(online.database_filepath),
+    )
+    assert downloader.failures.symbols() == SYMBOLS[2:]
+
+
+@pytest.mark.parametrize(
+    "downloader_enum, entry_fields",
+    [
+        (DownloaderEnum.ProfilesDownloader, PROFILES_FIELDS),
+        (DownloaderEnum.FinancialsDownloader, FINANCIALS_FIELDS),
+    ],
+)
+def test_records_partial_pull_round_trips(tmp_path, downloader_enum, entry_fields):
+    cfg = record_config(tmp_path, downloader_enum, entry_fields, **RECORD_ARGS)
+
+    downloader = run_download(
+        cfg, polygon_client=FakePolygonClient(failing_symbols={"BBB"}), workers=4
+    )
+
+    saved = saved_records(cfg.database_filepath, entry_fields)
+    pd.testing.assert_frame_equal(saved, downloader.database.frame())
+    assert sorted(saved["symbol"].unique()) == ["AAA", "CCC", "DDD"]
+    assert downloader.failures.symbols() == ["BBB"]
+
+
+@pytest.mark.parametrize(
+    "downloader_enum, entry_fields",
+    [
+        (DownloaderEnum.ProfilesDownloader, PROFILES_FIELDS),
+        (DownloaderEnum.FinancialsDownloader, FINANCIALS_FIELDS),
+    ],
+)
+def test_records_offline_replays_the_online_run(
+    tmp_path, downloader_enum, entry_fields
+):
+    online = record_config(tmp_path, downloader_enum, entry_fields, **RECORD_ARGS)
+    offline = record_config(
+        tmp_path,
+        downloader_enum,
+        entry_fields,
+        database_filepath=os.path.join(tmp_path, "offline.parquet"),
+        **RECORD_ARGS,
+    )
+
+    run_download(online)
+    polygon_client = FakePolygonClient()
+    run_download(offline, polygon_client=polygon_client, offline=True)
+
+    assert polygon_client.calls == 0
+    pd.testing.assert_frame_equal(
+        saved_records(offline.database_filepath, entry_fields),
+        saved_records(online.database_filepath, entry_fields),
+    )
+
+
+def to_epoch_minutes(index: pd.DatetimeIndex) -> np.ndarray:
+    return pd.DatetimeIndex(index).tz_convert("UTC").asi8 // 60_000_000_000
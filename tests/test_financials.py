@@ -0,0 +1,59 @@
+from datetime import datetime
+import pytest
+
+from benchmarks.fakes import FakeHTTPResponse
+from cli.commands.downloading._download.downloader.financials import (
+    GetFinancialsConfig,
+    get_financials,
+)
+
+
+def filing(filing_date, gross_profit, revenues):
+    def data_point(value):
+        return None if value is None else {"value": value}
+
+    return {
+        "filing_date": filing_date,
+        "financials": {
+            "income_statement": {
+                "gross_profit": data_point(gross_profit),
+                "revenues": data_point(revenues),
+            }
+        },
+    }
+
+
+class FilingsClient:
+    BASE = ""
+    headers = {}
+    timeout = None
+
+    def __init__(self, filings):
+        self.filings = filings
+        self.client = self
+
+    def request(self, method, url, **kwargs):
+        return FakeHTTPResponse(200, {"status": "OK", "results": self.filings})
+
+
+def test_filings_without_usable_values_are_skipped():
+    client = FilingsClient(
+        [
+            filing("2019-02-01", 40.0, 100.0),
+            filing(None, 40.0, 100.0),
+            filing("2020-02-01", None, 100.0),
+            filing("2020-03-01", 0.0, 0.0),
+            filing("2021-02-01", 55.0, 110.0),
+        ]
+    )
+
+    financials = get_financials(
+        GetFinancialsConfig("AAA", client, [datetime(2021, 4, 1)])
+    )
+
+    assert financials == [
+        (
+            datetime(2021, 4, 1),
+            {"gross_margin": 0.5, "revenue_diff": pytest.approx(0.1)},
+        )
+    ]
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from cli.commands.downloading._download.downloader import partitioned_db
+from cli.commands.downloading._download.downloader.partitioned_db import (
+    PartitionedParquetDatabase,
+)
+
+
+def test_entry_by_entry_writes_merge_once_per_read(tmp_path, monkeypatch):
+    merges = []
+    combine_batches = partitioned_db.combine_batches
+    monkeypatch.setattr(
+        partitioned_db,
+        "combine_batches",
+        lambda batches: merges.append(len(batches)) or combine_batches(batches),
+    )
+    dtimes = pd.date_range("2022-03-01 14:30", periods=200, freq="5min", tz="UTC")
+    database = PartitionedParquetDatabase()
+    database.add_symbol("AAA", "float64")
+
+    for i, dt in enumerate(dtimes):
+        database.add_entry("AAA", dt.to_pydatetime(), float(i))
+
+    assert merges == []
+    assert database.missing("AAA", dtimes).empty
+    assert len(merges) == 2
+
+    database.save(str(tmp_path))
+    reloaded = PartitionedParquetDatabase()
+    reloaded.load(str(tmp_path))
+    assert reloaded.missing("AAA", dtimes).empty
+    assert reloaded.contains("AAA", dtimes[-1].to_pydatetime())
+    assert not reloaded.contains("BBB", dtimes[-1].to_pydatetime())
+
+
+def test_lookups_keep_a_bounded_number_of_partitions(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitioned_db, "MAX_CACHED_PARTITIONS", 2)
+    dtimes = pd.date_range("2022-01-03 14:30", periods=6, freq="MS", tz="UTC")
+    database = PartitionedParquetDatabase()
+    database.add_batch("AAA", dtimes, range(len(dtimes)))
+    database.save(str(tmp_path))
+
+    assert database.missing("AAA", dtimes).empty
+    assert len(database._valid_indexes) == 2
+
+
+def test_part_files_are_compacted_on_save(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitioned_db, "MAX_PART_FILES", 3)
+    dtimes = pd.date_range("2022-03-01 14:30", periods=10, freq="5min", tz="UTC")
+    database = PartitionedParquetDatabase()
+
+    for i, dt in enumerate(dtimes):
+        database.add_entry("AAA", dt.to_pydatetime(), float(i))
+        database.save(str(tmp_path))
+
+    partition_dir = database._partition_dir(("AAA", 2022, 3))
+    assert len(partitioned_db.part_files(partition_dir)) <= 3
+    reloaded = PartitionedParquetDatabase()
+    reloaded.load(str(tmp_path))
+    assert reloaded.missing("AAA", dtimes).empty
+    assert reloaded._read_stored_partition(("AAA", 2022, 3)).tolist() == list(range(10))
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from core import pit_join
+from core.pit_join import (
+    PointInTimeJoinConfig,
+    build_point_in_time,
+    load_point_in_time,
+)
+
+SYMBOLS = ["AAA", "BBB"]
+SLOTS = pd.date_range("2022-03-28 13:30", periods=24 * 20, freq="h", tz="UTC")
+# quarterly record dates, read as midnights in US/Eastern
+FILING_DATES = ["2022-03-31", "2022-04-05", "2022-04-12"]
+
+
+def write_prices(filepath: str, prices: pd.DataFrame) -> None:
+    prices.to_parquet(filepath)
+
+
+def write_financials(filepath: str, filing_dates) -> None:
+    pd.DataFrame(
+        {
+            "symbol": np.repeat(SYMBOLS, len(filing_dates)),
+            "datetime": pd.to_datetime(list(filing_dates) * len(SYMBOLS)),
+            "gross_margin": np.arange(len(SYMBOLS) * len(filing_dates), dtype=float),
+        }
+    ).to_parquet(filepath)
+
+
+def join(tmp_path, output_dir: str, rebuild: bool = False):
+    return build_point_in_time(
+        PointInTimeJoinConfig(
+            prices_filepath=str(tmp_path / "prices.parquet"),
+            record_filepaths={"financials": str(tmp_path / "financials.parquet")},
+            output_dir=output_dir,
+            rebuild=rebuild,
+        )
+    )
+
+
+def random_prices() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        100 + rng.random((len(SLOTS), len(SYMBOLS))).cumsum(axis=0),
+        index=SLOTS,
+        columns=SYMBOLS,
+    )
+
+
+# a fundamental keyed on its filing date must not leak into earlier slots
+def test_records_are_never_visible_before_their_date(tmp_path):
+    write_prices(str(tmp_path / "prices.parquet"), random_prices())
+    write_financials(str(tmp_path / "financials.parquet"), FILING_DATES)
+    output_dir = str(tmp_path / "joined")
+
+    join(tmp_path, output_dir)
+
+    known_from = pd.DatetimeIndex(FILING_DATES).tz_localize("US/Eastern")
+    for symbol_index, symbol in enumerate(SYMBOLS):
+        joined = load_point_in_time(output_dir, symbol)
+        filings_known = known_from.searchsorted(joined["datetime"], side="right")
+        expected = np.where(
+            filings_known > 0,
+            symbol_index * len(FILING_DATES) + filings_known - 1,
+            np.nan,
+        )
+        np.testing.assert_array_equal(joined["gross_margin"].to_numpy(), expected)
+
+
+# slots arrive in chunks while an earlier hole is filled and a filing appears,
+# the incremental output must match one joined from scratch
+def test_incremental_runs_match_a_full_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(pit_join, "MAX_PART_FILES", 2)
+    prices = random_prices()
+    holes = prices.copy()
+    holes.iloc[50:60, 0] = np.nan
+    prices_filepath = str(tmp_path / "prices.parquet")
+    financials_filepath = str(tmp_path / "financials.parquet")
+    output_dir = str(tmp_path / "incremental")
+
+    summaries = []
+    for end, frame, filing_dates in [
+        (100, holes, FILING_DATES[:1]),
+        (200, holes, FILING_DATES[:1]),
+        (300, holes, FILING_DATES[:1]),
+        (350, holes, FILING_DATES[:1]),
+        (400, prices, FILING_DATES[:1]),
+        (480, prices, FILING_DATES),
+        (480, prices, FILING_DATES),
+    ]:
+        write_prices(prices_filepath, frame.iloc[:end])
+        write_financials(financials_filepath, filing_dates)
+        summaries.append(join(tmp_path, output_dir))
+
+    assert summaries[1].appended == SYMBOLS
+    assert summaries[4].rebuilt == ["AAA"] and summaries[4].appended == ["BBB"]
+    assert summaries[5].rebuilt == SYMBOLS
+    assert summaries[6].reused == SYMBOLS
+    assert len(pit_join.part_files(pit_join.point_in_time_dir(output_dir, "BBB"))) <= 2
+
+    rebuilt_dir = str(tmp_path / "rebuilt")
+    join(tmp_path, rebuilt_dir, rebuild=True)
+    for symbol in SYMBOLS:
+        pd.testing.assert_frame_equal(
+            load_point_in_time(output_dir, symbol),
+            load_point_in_time(rebuilt_dir, symbol),
+        )
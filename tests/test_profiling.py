@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+import pstats
+import re
+
+from cli.profiling import profile
+
+
+def work_in_worker_thread() -> int:
+    return sum(range(10_000))
+
+
+# downloads run on worker threads, their calls have to show up in the report
+def test_cpu_profile_covers_worker_threads(tmp_path):
+    output = str(tmp_path / "profile.txt")
+
+    with profile("cpu", output):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda _: work_in_worker_thread(), range(4)))
+
+    with open(output) as f:
+        report = f.read()
+    assert int(re.search(r"merged profiles of (\d+) threads", report)[1]) > 1
+    assert "work_in_worker_thread" in report
+    functions = pstats.Stats(f"{output}.pstats").stats
+    assert any(name == "work_in_worker_thread" for _, _, name in functions)
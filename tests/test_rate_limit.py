@@ -0,0 +1,149 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakePolygonClient, annual_financials
+
+from cli.commands.downloading._download.downloader import rate_limit
+from cli.commands.downloading._download.downloader.financials import (
+    get_financials_history,
+)
+from cli.commands.downloading._download.downloader.prices import PricesDownloader
+from cli.commands.downloading._download.downloader.rate_limit import (
+    RateLimitConfig,
+    RateLimiter,
+    backoff_seconds,
+    call_with_retry,
+)
+from cli.exceptions import ResourceError
+
+
+# time only moves when the limiter or the backoff sleeps
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(
+        rate_limit,
+        "time",
+        SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep),
+    )
+    return clock
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, retry_after: str = None):
+        super().__init__(f"status {status}")
+        headers = {} if retry_after is None else {"Retry-After": retry_after}
+        self.response = SimpleNamespace(status_code=status, headers=headers)
+
+
+def failing_fetch(errors, result="ok"):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fetch, calls
+
+
+def limiter(requests_per_minute: float = 60, **kwargs) -> RateLimiter:
+    return RateLimiter(
+        "test",
+        RateLimitConfig(requests_per_minute, base_backoff_seconds=0.001, **kwargs),
+    )
+
+
+def test_tokens_are_spaced_at_the_configured_rate(clock):
+    rate_limiter = limiter(60)
+
+    for _ in range(4):
+        rate_limiter.acquire()
+
+    assert clock.now == pytest.approx(3.0)
+
+
+def test_rate_limited_requests_wait_for_retry_after_and_slow_down(clock):
+    rate_limiter = limiter(60)
+    fetch, calls = failing_fetch([HTTPError(429, "5"), HTTPError(429, "5")])
+
+    assert call_with_retry(rate_limiter, fetch) == "ok"
+
+    assert len(calls) == 3
+    assert clock.now >= 10
+    assert rate_limiter.rate == pytest.approx(rate_limiter.max_rate * 0.3)
+
+
+def test_rate_recovers_after_successes(clock):
+    rate_limiter = limiter(60)
+    rate_limiter.on_rate_limited(None)
+
+    for _ in range(20):
+        call_with_retry(rate_limiter, lambda: "ok")
+
+    assert rate_limiter.rate == rate_limiter.max_rate
+
+
+def test_transient_errors_give_up_after_max_retries(clock):
+    fetch, calls = failing_fetch([HTTPError(503)] * 3)
+
+    with pytest.raises(ResourceError):
+        call_with_retry(limiter(max_retries=2), fetch)
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_retried(clock):
+    fetch, calls = failing_fetch([HTTPError(404)])
+
+    with pytest.raises(ResourceError):
+        call_with_retry(limiter(max_retries=5), fetch)
+    assert len(calls) == 1
+
+
+def test_backoff_is_capped():
+    for attempt in range(10):
+        seconds = backoff_seconds(attempt, 1.0, 8.0)
+        assert 0 <= seconds <= min(8.0, 2**attempt)
+
+
+# paged responses take a token per http request, retried pages included
+def test_every_page_takes_a_token(clock):
+    client = FakePolygonClient(page_size=3, rate_limited_requests=2)
+    rate_limiter = limiter(1e9, max_retries=5)
+    acquired = []
+    acquire = rate_limiter.acquire
+    rate_limiter.acquire = lambda: acquired.append(acquire())
+
+    history = get_financials_history(
+        client, "AAA", datetime(2022, 1, 1), rate_limiter=rate_limiter
+    )
+
+    filings = annual_financials("AAA", "2022-01-01")
+    assert len(history) == len(filings)
+    assert client.calls == 2 + -(-len(filings) // 3)
+    assert len(acquired) == client.calls
+
+
+def test_alpaca_client_leaves_retries_to_call_with_retry():
+    downloader = SimpleNamespace(
+        _alpaca_client=None,
+        cfg=SimpleNamespace(
+            alpaca_key_id="key", alpaca_secret_key="secret", alpaca_url_override=None
+        ),
+    )
+
+    assert PricesDownloader.alpaca_client.fget(downloader)._retry == 0
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pandas as pd
+
+from cli.commands.downloading._download.downloader.record_db import RecordDatabase
+
+from conftest import PROFILES_FIELDS
+
+QUARTERS = pd.date_range("2020-03-31", periods=8, freq="Q", tz="UTC")
+
+
+def test_membership_survives_a_reload(tmp_path):
+    database = RecordDatabase(PROFILES_FIELDS)
+    entry = {"total_employees": 10, "market_cap": 1e9}
+    database.add_rows("AAA", [(dt.to_pydatetime(), entry) for dt in QUARTERS[::2]])
+
+    filepath = str(tmp_path / "records.parquet")
+    database.save(filepath)
+    reloaded = RecordDatabase(PROFILES_FIELDS)
+    reloaded.load(filepath)
+
+    for db in (database, reloaded):
+        assert db.contains("AAA", QUARTERS[0].to_pydatetime())
+        assert not db.contains("AAA", QUARTERS[1].to_pydatetime())
+        assert not db.contains("BBB", QUARTERS[0].to_pydatetime())
+        assert db.missing("AAA", QUARTERS).equals(QUARTERS[1::2])
+        assert db.missing("BBB", QUARTERS).equals(QUARTERS)
+
+
+def test_naive_datetimes_are_read_as_utc():
+    database = RecordDatabase(PROFILES_FIELDS)
+    database.add_entry("AAA", datetime(2022, 3, 31), {"market_cap": 1.0})
+
+    assert database.contains("AAA", pd.Timestamp("2022-03-31", tz="UTC"))
+    assert database.missing("AAA", pd.DatetimeIndex(["2022-03-31"])).empty
@@ -0,0 +1,67 @@
+import os
+import time
+
+from cli.commands.downloading._download.downloader import response_cache
+from cli.commands.downloading._download.downloader.response_cache import (
+    ResponseCache,
+    ResponseCacheConfig,
+    cache_key,
+)
+
+
+def test_stale_temporary_files_are_swept_on_open(tmp_path):
+    stale, fresh = tmp_path / "stale.pkl.1.2.tmp", tmp_path / "fresh.pkl.1.3.tmp"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    old = time.time() - response_cache.STALE_TMP_SECONDS - 1
+    os.utime(stale, (old, old))
+
+    ResponseCache(ResponseCacheConfig(cache_dir=str(tmp_path)))
+
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_read_tolerates_eviction_between_read_and_touch(tmp_path, monkeypatch):
+    cache = ResponseCache(ResponseCacheConfig(cache_dir=str(tmp_path)))
+    cache.get_or_fetch("polygon.ticker_details", {"ticker": "AAA"}, lambda: 1)
+    filepath = cache._filepath(cache_key("polygon.ticker_details", {"ticker": "AAA"}))
+
+    # the file disappears right after it was read, as if another thread
+    # evicted it
+    def evicted_utime(path, times):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(response_cache.os, "utime", evicted_utime)
+    response = cache.get_or_fetch(
+        "polygon.ticker_details", {"ticker": "AAA"}, lambda: 2
+    )
+
+    assert response == 1
+    assert not os.path.exists(filepath)
+
+
+# e.g. a truncated write, or a payload from an older layout
+def test_unreadable_responses_are_fetched_again(tmp_path):
+    cache = ResponseCache(ResponseCacheConfig(cache_dir=str(tmp_path)))
+    cache.get_or_fetch("polygon.ticker_details", {"ticker": "AAA"}, lambda: 1)
+    filepath = cache._filepath(cache_key("polygon.ticker_details", {"ticker": "AAA"}))
+
+    for content in ['{"fetched_at": 1', '{"response": 1}', "[]"]:
+        with open(filepath, "w") as f:
+            f.write(content)
+        response = cache.get_or_fetch(
+            "polygon.ticker_details", {"ticker": "AAA"}, lambda: 2
+        )
+        assert response == 2
+    assert cache.get_or_fetch("polygon.ticker_details", {"ticker": "AAA"}, None) == 2
+
+
+def test_pickled_responses_are_dropped_on_open(tmp_path):
+    pickled = tmp_path / f"{cache_key('polygon.ticker_details', {})}.pkl"
+    pickled.write_bytes(b"\x80\x04K\x01.")
+
+    ResponseCache(ResponseCacheConfig(cache_dir=str(tmp_path)))
+
+    assert not pickled.exists()
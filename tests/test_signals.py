@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from core.signals import (
+    SignalParameterError,
+    check_params,
+    momentum,
+    moving_average,
+    moving_average_crossover,
+)
+
+
+@pytest.fixture
+def prices():
+    return np.linspace(100, 110, 20).reshape(10, 2)
+
+
+@pytest.mark.parametrize("lookback", [0, -1, 11])
+def test_momentum_rejects_lookbacks_outside_the_history(prices, lookback):
+    with pytest.raises(SignalParameterError, match="lookback"):
+        momentum(prices, lookback)
+
+
+@pytest.mark.parametrize("window", [0, 11])
+def test_moving_average_rejects_windows_outside_the_history(prices, window):
+    with pytest.raises(SignalParameterError, match="window"):
+        moving_average(prices, window)
+
+
+def test_window_spanning_the_whole_history(prices):
+    averages = moving_average(prices, 10)
+
+    assert np.isnan(averages[:-1]).all()
+    assert np.allclose(averages[-1], prices.mean(axis=0))
+    assert moving_average_crossover(prices, 1, 10).shape == prices.shape
+
+
+@pytest.mark.parametrize("lookback", [2.5, "3", True])
+def test_momentum_rejects_lookbacks_that_are_not_integers(prices, lookback):
+    with pytest.raises(SignalParameterError, match="integer"):
+        momentum(prices, lookback)
+
+
+def test_unknown_params_are_rejected():
+    check_params(momentum, {"lookback": 3})
+    check_params(lambda prices, **params: prices, {"anything": 1})
+
+    with pytest.raises(SignalParameterError, match="window"):
+        check_params(momentum, {"window": 3})
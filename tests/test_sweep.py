@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from core import sweep
+from core.backtest import BacktestConfig, run_backtest
+from core.signals import SIGNALS
+from core.sweep import SweepConfig, param_grid, run_sweep
+
+
+# workers read the prices from shared memory, their results must match running
+# every parameter set in this process, and no segment may outlive the sweep
+def test_shared_memory_sweep_matches_sequential_backtests(monkeypatch):
+    specs = []
+    share_array = sweep.share_array
+
+    @contextmanager
+    def recording_share_array(array):
+        with share_array(array) as spec:
+            specs.append(spec)
+            yield spec
+
+    monkeypatch.setattr(sweep, "share_array", recording_share_array)
+    rng = np.random.default_rng(0)
+    prices = 100 + rng.random((200, 4)).cumsum(axis=0)
+    prices[:20, 1] = np.nan
+    cfg = SweepConfig(
+        signal="moving_average_crossover",
+        param_sets=param_grid({"fast": [3, 5], "slow": [10, 20]}),
+        backtest=BacktestConfig(transaction_cost_bps=2, periods_per_year=252),
+        workers=2,
+    )
+
+    results = run_sweep(prices, cfg)
+
+    assert len(results) == len(cfg.param_sets)
+    for params, result in zip(cfg.param_sets, results):
+        weights = SIGNALS[cfg.signal](prices, **params)
+        expected = run_backtest(prices, weights, cfg.backtest)
+        assert result == pytest.approx(
+            {**params, **expected.metrics(cfg.backtest.periods_per_year)}, nan_ok=True
+        )
+
+    assert len(specs) == 1
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=specs[0].name)